@@ -0,0 +1,105 @@
+"""ASGI entry point serving /chaty on the async execution path.
+
+Every query awaits its LLM and API calls on the event loop instead of holding a thread,
+so one worker process can keep hundreds of queries in flight. Serve it with
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+
+import json
+import logging
+
+import run
+from utils import render_metrics, format_sse
+
+logger = logging.getLogger(__name__)
+
+
+async def _read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            run.initialize_runtime()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await run.get_http_client().aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _read_query(receive, send):
+    """Return (query, context) from the request body, or None after answering 400."""
+    try:
+        request_data = json.loads(await _read_body(receive))  # {query": <QUERY>, "context": [<CONTEXT>]}
+        return request_data['query'], "\n".join(request_data['context'])
+    except (ValueError, KeyError, TypeError) as e:
+        await _send_json(send, 400, {"error": f"Invalid request: {e}"})
+        return None
+
+
+async def chaty(receive, send):
+    request_data = await _read_query(receive, send)
+    if request_data is None:
+        return
+    answer = await run.arun_chaty(*request_data)
+    await _send_json(send, 200, {"answer": run.extract_final_answer(answer)})
+
+
+async def chaty_stream(receive, send):
+    """Server-sent events: stage progress as it happens, then the finished answer in chunks."""
+    request_data = await _read_query(receive, send)
+    if request_data is None:
+        return
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+    })
+    events = run.astream_chaty(*request_data)
+    try:
+        async for event, data in events:
+            await send({"type": "http.response.body", "body": format_sse(event, data), "more_body": True})
+    finally:
+        await events.aclose()
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/metrics" and scope["method"] == "GET":
+        body, content_type = render_metrics()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type.encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return
+    handler = {"/chaty": chaty, "/chaty/stream": chaty_stream}.get(scope["path"])
+    if handler is None:
+        await _send_json(send, 404, {"error": "Not found"})
+        return
+    if scope["method"] != "POST":
+        await _send_json(send, 405, {"error": "Method not allowed"})
+        return
+    await handler(receive, send)
@@ -0,0 +1,101 @@
+"""Micro-benchmark for get_matched_endpoint on large synthetic specs.
+
+Usage: python benchmarks/bench_endpoint_matcher.py [--paths 2000 5000] [--lookups 2000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import ReducedOpenAPISpec, get_matched_endpoint
+
+
+def legacy_get_matched_endpoint(api_spec: ReducedOpenAPISpec, plan: str):
+    """The linear-scan implementation get_matched_endpoint used before EndpointMatcher."""
+    pattern = r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)*"
+    matches = re.findall(pattern, plan)
+    plan_endpoints = [
+        "{method} {route}".format(method=method, route=route.split("?")[0])
+        for method, route in matches
+    ]
+    spec_endpoints = [item[0] for item in api_spec.endpoints]
+
+    matched_endpoints = []
+    for plan_endpoint in plan_endpoints:
+        if plan_endpoint in spec_endpoints:
+            matched_endpoints.append(plan_endpoint)
+            continue
+        for name in spec_endpoints:
+            arg_list = re.findall(r"[{](.*?)[}]", name)
+            pattern = name.format(**{arg: r"[^/]+" for arg in arg_list}) + '$'
+            if re.match(pattern, plan_endpoint):
+                matched_endpoints.append(name)
+                break
+    if len(matched_endpoints) == 0:
+        return None
+    return matched_endpoints
+
+
+def synthetic_spec(num_paths: int, rng: random.Random) -> ReducedOpenAPISpec:
+    endpoints = []
+    for i in range(num_paths):
+        product = rng.choice(["securetrack", "securechangeworkflow"])
+        kind = i % 4
+        if kind == 0:
+            route = f"/{product}/api/resource{i}.json"
+        elif kind == 1:
+            route = f"/{product}/api/resource{i}/{{id}}.json"
+        elif kind == 2:
+            route = f"/{product}/api/resource{i}/{{id}}/children/{{child_id}}"
+        else:
+            route = f"/{product}/api/group{i % 50}/item{i}/{{name}}"
+        method = rng.choice(["GET", "POST", "PUT", "DELETE"])
+        endpoints.append((f"{method} {route}", f"Endpoint {i}.", {}))
+    return ReducedOpenAPISpec(servers=[{"url": "https://localhost"}], description="", endpoints=endpoints)
+
+
+def concrete_plan(name: str, rng: random.Random) -> str:
+    concrete = re.sub(r"[{](.*?)[}]", lambda _: str(rng.randint(1, 10000)), name)
+    return f"{concrete}?start=0&count=100 to get the requested resource"
+
+
+def timed(func, spec, plans):
+    start = time.perf_counter()
+    results = [func(spec, plan) for plan in plans]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paths", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for num_paths in args.paths:
+        spec = synthetic_spec(num_paths, rng)
+        names = [name for name, _, _ in spec.endpoints]
+        plans = [concrete_plan(rng.choice(names), rng) for _ in range(args.lookups)]
+
+        build_start = time.perf_counter()
+        spec.endpoint_matcher
+        build_time = time.perf_counter() - build_start
+
+        legacy_time, legacy_results = timed(legacy_get_matched_endpoint, spec, plans)
+        new_time, new_results = timed(get_matched_endpoint, spec, plans)
+        assert legacy_results == new_results, "matcher disagrees with the legacy implementation"
+
+        print(
+            f"paths={num_paths:>6} lookups={args.lookups}: "
+            f"legacy {legacy_time / args.lookups * 1e6:10.1f}us/lookup, "
+            f"matcher {new_time / args.lookups * 1e6:8.1f}us/lookup "
+            f"(build {build_time * 1000:.1f}ms), speedup x{legacy_time / new_time:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
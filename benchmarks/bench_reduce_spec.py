@@ -0,0 +1,164 @@
+"""Benchmark for reduce_openapi_spec(merge_allof=True) on large synthetic specs.
+
+Compares time and peak traced memory against the implementation used before $refs were
+resolved once per component and allOf compositions were merged once per schema.
+
+Usage: python benchmarks/bench_reduce_spec.py [--paths 500 2000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import reduce_openapi_spec
+
+
+def legacy_dereference_refs(spec_obj, full_spec):
+    """Inlines a fresh copy of the target of every $ref."""
+
+    def retrieve(path):
+        out = full_spec
+        for component in path.split("/")[1:]:
+            out = out[component]
+        return out
+
+    def dereference(obj):
+        if isinstance(obj, dict):
+            if "$ref" in obj:
+                return dereference(retrieve(obj["$ref"]))
+            return {k: dereference(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [dereference(el) for el in obj]
+        return obj
+
+    return dereference(spec_obj)
+
+
+def legacy_merge_allof_properties(obj):
+    """Copies the whole tree and re-merges every allOf wherever it appears."""
+
+    def merge(to_merge):
+        merged = {'properties': {}, 'required': [], 'type': 'object'}
+        for partial_schema in to_merge:
+            if 'allOf' in partial_schema:
+                tmp = merge(partial_schema['allOf'])
+                merged['properties'].update(tmp['properties'])
+                merged['required'].extend(tmp['required'])
+                continue
+            merged['properties'].update(partial_schema.get('properties', {}))
+            merged['required'].extend(partial_schema.get('required', []))
+        return merged
+
+    def merge_allof(obj):
+        if isinstance(obj, dict):
+            if 'allOf' in obj:
+                return merge_allof(merge(obj['allOf']))
+            return {k: merge_allof(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [merge_allof(el) for el in obj]
+        return obj
+
+    return merge_allof(obj)
+
+
+def legacy_reduce_openapi_spec(spec, only_required=False):
+    """Dereference and merge every endpoint's full docs, then strip them down."""
+    endpoints = [
+        (f"{operation_name.upper()} {route}", docs.get("description"), docs)
+        for route, operation in spec["paths"].items()
+        for operation_name, docs in operation.items()
+        if operation_name in ["get", "post", "patch", "delete", "put"]
+    ]
+    endpoints = [(name, description, legacy_dereference_refs(docs, spec)) for name, description, docs in endpoints]
+    endpoints = [(name, description, legacy_merge_allof_properties(docs)) for name, description, docs in endpoints]
+
+    def reduce_endpoint_docs(docs):
+        out = {}
+        if docs.get("description"):
+            out["description"] = docs.get("description")
+        if docs.get("parameters"):
+            out["parameters"] = [p for p in docs["parameters"] if p.get("required") or not only_required]
+        if docs.get("requestBody"):
+            out["requestBody"] = docs.get("requestBody")
+        if "200" in docs["responses"]:
+            out["responses"] = docs["responses"]["200"]
+        return out
+
+    return [(name, description, reduce_endpoint_docs(docs)) for name, description, docs in endpoints]
+
+
+def synthetic_spec(num_paths: int, num_fields: int = 30) -> dict:
+    """Endpoints over a few components composed with allOf, as the Tufin OAS does."""
+
+    def fields(prefix):
+        return {f"{prefix}_{i}": {"type": "string", "description": f"The {prefix} field number {i}."} for i in range(num_fields)}
+
+    schemas = {
+        "Base": {"type": "object", "properties": fields("base"), "required": ["base_0"]},
+        "Device": {"allOf": [{"$ref": "#/components/schemas/Base"}, {"properties": fields("device")}]},
+        "Rule": {"allOf": [{"$ref": "#/components/schemas/Base"}, {"properties": fields("rule"), "required": ["rule_0"]}]},
+        "DeviceList": {"type": "object", "properties": {"device": {"type": "array", "items": {"$ref": "#/components/schemas/Device"}}}},
+        "RuleList": {"type": "object", "properties": {"rule": {"type": "array", "items": {"$ref": "#/components/schemas/Rule"}}}},
+        "Error": {"allOf": [{"$ref": "#/components/schemas/Base"}, {"properties": fields("error")}]},
+    }
+    parameters = {
+        "Id": {"name": "id", "in": "path", "required": True, "schema": {"type": "integer"}},
+        "Start": {"name": "start", "in": "query", "schema": {"type": "integer"}},
+        "Count": {"name": "count", "in": "query", "schema": {"type": "integer"}},
+    }
+    paths = {}
+    for i in range(num_paths):
+        schema = ["DeviceList", "RuleList", "Device", "Rule"][i % 4]
+        paths[f"/securetrack/api/resource{i}/{{id}}"] = {
+            "get": {
+                "description": f"Returns resource {i}.",
+                "parameters": [{"$ref": f"#/components/parameters/{name}"} for name in parameters],
+                "responses": {
+                    "200": {"description": "OK", "content": {"application/json": {"schema": {"$ref": f"#/components/schemas/{schema}"}}}},
+                    "400": {"description": "Bad request", "content": {"application/json": {"schema": {"$ref": "#/components/schemas/Error"}}}},
+                },
+            }
+        }
+    return {"servers": [{"url": "https://localhost"}], "info": {"description": ""}, "paths": paths, "components": {"schemas": schemas, "parameters": parameters}}
+
+
+def measure(func, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, retained, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paths", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for num_paths in args.paths:
+        spec = synthetic_spec(num_paths)
+        legacy_time, legacy_retained, legacy_peak, legacy_endpoints = measure(lambda: legacy_reduce_openapi_spec(spec), args.repeat)
+        new_time, new_retained, new_peak, api_spec = measure(lambda: reduce_openapi_spec(spec, only_required=False, merge_allof=True), args.repeat)
+        assert json.dumps(legacy_endpoints) == json.dumps(api_spec.endpoints), "reduced spec differs from the legacy implementation"
+
+        print(
+            f"paths={num_paths:>5}: "
+            f"legacy {legacy_time * 1000:8.1f}ms peak {legacy_peak / 2**20:7.1f}MiB retained {legacy_retained / 2**20:7.1f}MiB | "
+            f"new {new_time * 1000:6.1f}ms peak {new_peak / 2**20:5.1f}MiB retained {new_retained / 2**20:5.1f}MiB | "
+            f"speedup x{legacy_time / new_time:.0f}, peak memory /{legacy_peak / new_peak:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""Offline end-to-end benchmark over the RestBench-style datasets.
+
+Every query of a dataset runs through the full RestGPT pipeline against a local stand-in
+server, which answers each call with an example built from the endpoint's response schema
+in the OAS, and a scripted LLM. Endpoints that declare start/count parameters serve a
+collection of `--collection-size` items page by page, and the Caller fetches them with
+its default PaginationPolicy. The LLM follows the dataset's solution path: the Planner
+emits one step per solution call, the APISelector picks that call and the Caller issues it.
+Replies are deterministic, so runs are comparable. The report covers each query's wall
+time, the time spent in each stage (exclusive of nested stages), LLM calls and
+prompt/completion tokens per stage, and HTTP calls.
+
+Usage: python benchmarks/run_benchmark.py [--datasets tufin] [--mode sync|async]
+           [--repeat 3] [--llm-latency 0] [--http-latency 0] [--collection-size 250]
+           [--output report.json]
+           [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import langchain
+from langchain.llms.base import LLM
+
+from model import RestGPT, Planner, APISelector, Caller, ResponseParser, SimpleResponseParser, parsing_code_cache
+from utils import HTTPClient, PaginationPolicy, ReducedOpenAPISpec, configure_sandbox, count_tokens, find_paging_parameters, reduce_openapi_spec
+
+DATASETS = {
+    "tufin": ("datasets/tufin.json", "specs/tufin_oas.json"),
+    "tmdb": ("datasets/tmdb.json", "specs/tmdb_oas.json"),
+    "spotify": ("datasets/spotify.json", "specs/spotify_oas.json"),
+}
+STAGES = {Planner: "planner", APISelector: "api_selector", Caller: "caller", ResponseParser: "parser", SimpleResponseParser: "parser"}
+ARRAY_ITEMS = 5
+MAX_SCHEMA_DEPTH = 8
+SOLUTION_CALL_PATTERN = re.compile(r"(GET|POST|PUT|PATCH|DELETE)\s+(\S+)")
+
+
+class QueryStats:
+    def __init__(self) -> None:
+        # "llm" is the scripted LLM's own time (token counting and simulated latency).
+        self.stage_time = {stage: 0.0 for stage in {*STAGES.values(), "llm"}}
+        self.llm_calls = {stage: 0 for stage in set(STAGES.values())}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.http_calls = 0
+        self._stack: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.stage_time[name] += elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+
+current_stats: Optional[QueryStats] = None
+
+
+@contextmanager
+def instrument_stages():
+    """Time every stage chain's _call/_acall into `current_stats`, restoring them afterwards."""
+    originals = []
+    for cls, name in STAGES.items():
+        call, acall = cls.__dict__["_call"], cls.__dict__.get("_acall")
+        originals.append((cls, call, acall))
+
+        def timed_call(self, *args, _call=call, _name=name, **kwargs):
+            with current_stats.stage(_name):
+                return _call(self, *args, **kwargs)
+
+        setattr(cls, "_call", timed_call)
+        if acall is not None:
+            async def timed_acall(self, *args, _acall=acall, _name=name, **kwargs):
+                with current_stats.stage(_name):
+                    return await _acall(self, *args, **kwargs)
+
+            setattr(cls, "_acall", timed_acall)
+    try:
+        yield
+    finally:
+        for cls, call, acall in originals:
+            setattr(cls, "_call", call)
+            if acall is not None:
+                setattr(cls, "_acall", acall)
+
+
+def example_from_schema(schema: Any, depth: int = 0) -> Any:
+    if not isinstance(schema, dict) or depth > MAX_SCHEMA_DEPTH:
+        return None
+    if "example" in schema:
+        return schema["example"]
+    if "allOf" in schema:
+        merged = {}
+        for part in schema["allOf"]:
+            value = example_from_schema(part, depth + 1)
+            if isinstance(value, dict):
+                merged.update(value)
+        return merged
+    for key in ("oneOf", "anyOf"):
+        if schema.get(key):
+            return example_from_schema(schema[key][0], depth + 1)
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type", "object" if "properties" in schema else None)
+    if schema_type == "object":
+        return {name: example_from_schema(prop, depth + 1) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [example_from_schema(schema.get("items", {}), depth + 1) for _ in range(ARRAY_ITEMS)]
+    return {"string": "string", "integer": 1, "number": 1.0, "boolean": True}.get(schema_type)
+
+
+def response_schema(docs: dict) -> Optional[dict]:
+    content = (docs.get("responses") or {}).get("content") or {}
+    for media_type, body in content.items():
+        if "json" in media_type:
+            return body.get("schema")
+    return None
+
+
+def example_page(example: Any, start: int, count: int, collection_size: int) -> Any:
+    """Cut one page out of a `collection_size`-item collection built from the example's first list.
+
+    Items copy the example's first item, with ids numbered by their position, and an integer
+    `count`/`total` next to them describes the page and the collection.
+    """
+    page = json.loads(json.dumps(example))
+    queue = [page]
+    while queue:
+        node = queue.pop(0)
+        if not isinstance(node, dict):
+            continue
+        for key, value in node.items():
+            if isinstance(value, list) and value:
+                items = [json.loads(json.dumps(value[0])) for _ in range(max(0, min(count, collection_size - start)))]
+                for position, item in enumerate(items, start):
+                    if isinstance(item, dict) and isinstance(item.get("id"), int):
+                        item["id"] = position + 1
+                node[key] = items
+                for name, size in (("count", len(items)), ("total", collection_size)):
+                    if isinstance(node.get(name), int):
+                        node[name] = size
+                return page
+        queue.extend(node.values())
+    return page
+
+
+def start_stand_in_server(api_spec: ReducedOpenAPISpec, latency: float, collection_size: int) -> ThreadingHTTPServer:
+    """Serve every endpoint of `api_spec` with a schema-derived example body, paging collections."""
+    bodies: Dict[str, bytes] = {}
+    bodies_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self) -> None:
+            if current_stats is not None:
+                with current_stats._lock:
+                    current_stats.http_calls += 1
+            if latency:
+                time.sleep(latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            url = urlsplit(self.path)
+            name = api_spec.endpoint_matcher.match(f"{self.command} {url.path}")
+            if name is None:
+                status, body = 404, b'{"message": "Not found"}'
+            else:
+                with bodies_lock:
+                    if name not in bodies:
+                        example = example_from_schema(response_schema(api_spec.endpoint_docs[name]) or {})
+                        bodies[name] = json.dumps(example).encode() if example is not None else b""
+                    body = bodies[name]
+                paging = find_paging_parameters(api_spec.endpoint_docs[name])
+                query = parse_qs(url.query)
+                if body and paging is not None and paging.start in query and paging.count in query:
+                    start, count = int(query[paging.start][0]), int(query[paging.count][0])
+                    body = json.dumps(example_page(json.loads(body), start, count, collection_size)).encode()
+                status = 200 if self.command == "GET" or body else 201
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ScriptedLLM(LLM):
+    """Deterministic LLM that walks the current query's solution path."""
+
+    base_url: str = ""
+    solution: List[str] = []
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @staticmethod
+    def _tail(prompt: str) -> str:
+        return prompt.split("Begin!")[-1]
+
+    def _complete(self, prompt: str) -> Tuple[str, str]:
+        tail = self._tail(prompt)
+        if prompt.startswith("You are an agent that plans"):
+            done = tail.count("API response:")
+            if done >= len(self.solution):
+                return "planner", "Final Answer: the requested information was retrieved."
+            return "planner", f"Step {done + 1}: call the API needed for the user query"
+        if prompt.startswith("You are a planner that plans"):
+            step = int(re.findall(r"Step (\d+):", tail)[-1])
+            return "api_selector", f"{self.solution[step - 1]} to answer the query"
+        if prompt.startswith("You are an agent that gets"):
+            if "Response:" in tail:
+                return "caller", "Execution Result: the API call succeeded."
+            method, route = SOLUTION_CALL_PATTERN.search(tail.split("Plan:", 1)[-1]).groups()
+            route = re.sub(r"\{[^}]*\}", "1", route)
+            path, _, query_string = route.partition("?")
+            action_input = {"url": self.base_url + path, "description": "benchmark call", "output_instructions": "return the response"}
+            if query_string:
+                action_input["params"] = dict(parse_qsl(query_string))
+            if method != "GET":
+                action_input["data"] = {}
+            return "caller", f"Operation: {method}\nInput: {json.dumps(action_input)}"
+        if "generate Python code" in prompt:
+            return "parser", "print(str(data)[:300])"
+        if prompt.startswith("Here is an API JSON response") or prompt.startswith("Given a string"):
+            return "parser", "The API response was processed."
+        raise ValueError(f"Unscripted prompt: {prompt[:80]!r}")
+
+    def _record(self, prompt: str) -> str:
+        stage, completion = self._complete(prompt)
+        with current_stats._lock:
+            current_stats.llm_calls[stage] += 1
+            current_stats.prompt_tokens += count_tokens(prompt)
+            current_stats.completion_tokens += count_tokens(completion)
+        return completion
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        with current_stats.stage("llm"):
+            if self.latency:
+                time.sleep(self.latency)
+            return self._record(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        with current_stats.stage("llm"):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._record(prompt)
+
+
+async def arun_agent(agent: RestGPT, query: str) -> None:
+    # Each query runs on its own event loop, so the client's aiohttp session goes with it.
+    try:
+        await agent.arun(query=query)
+    finally:
+        await agent.requests_wrapper.aclose()
+
+
+def run_query(agent: RestGPT, llm: ScriptedLLM, item: dict, mode: str, warm: bool) -> dict:
+    global current_stats
+    current_stats = QueryStats()
+    llm.solution = [" ".join(call.split()) for call in item["solution"]]
+    if not warm:
+        parsing_code_cache.clear()
+    error = None
+    start = time.perf_counter()
+    try:
+        if mode == "async":
+            asyncio.run(arun_agent(agent, item["query"]))
+        else:
+            agent.run(query=item["query"])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall_time = time.perf_counter() - start
+    stats = current_stats
+    return {
+        "query": item["query"],
+        "wall_time": wall_time,
+        "stage_time": stats.stage_time,
+        "other_time": max(wall_time - sum(stats.stage_time.values()), 0.0),
+        "llm_calls": stats.llm_calls,
+        "prompt_tokens": stats.prompt_tokens,
+        "completion_tokens": stats.completion_tokens,
+        "http_calls": stats.http_calls,
+        "error": error,
+    }
+
+
+def summarize(queries: List[dict]) -> dict:
+    wall_times = sorted(query["wall_time"] for query in queries)
+    return {
+        "queries": len(queries),
+        "errors": sum(query["error"] is not None for query in queries),
+        "wall_time_total": sum(wall_times),
+        "wall_time_mean": statistics.mean(wall_times),
+        "wall_time_p50": wall_times[len(wall_times) // 2],
+        "wall_time_p95": wall_times[min(int(len(wall_times) * 0.95), len(wall_times) - 1)],
+        "stage_time": {stage: sum(query["stage_time"][stage] for query in queries) for stage in queries[0]["stage_time"]},
+        "llm_calls": sum(sum(query["llm_calls"].values()) for query in queries),
+        "prompt_tokens": sum(query["prompt_tokens"] for query in queries),
+        "completion_tokens": sum(query["completion_tokens"] for query in queries),
+        "http_calls": sum(query["http_calls"] for query in queries),
+    }
+
+
+def run_dataset(name: str, args: argparse.Namespace) -> dict:
+    dataset_path, spec_path = (os.path.join(ROOT, path) for path in DATASETS[name])
+    with open(dataset_path) as f:
+        dataset = json.load(f)
+    with open(spec_path) as f:
+        api_spec = reduce_openapi_spec(json.load(f), only_required=False, merge_allof=True)
+
+    server = start_stand_in_server(api_spec, args.http_latency, args.collection_size)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    api_spec.servers = [{"url": base_url}]
+    llm = ScriptedLLM(base_url=base_url, latency=args.llm_latency)
+    client = HTTPClient()
+    agent = RestGPT(llm, api_spec=api_spec, scenario=name, requests_wrapper=client, pagination=PaginationPolicy())
+
+    queries = []
+    try:
+        for _ in range(args.repeat):
+            for item in dataset[: args.limit]:
+                queries.append(run_query(agent, llm, item, args.mode, args.warm))
+    finally:
+        server.shutdown()
+        client.close()
+    return {"summary": summarize(queries), "queries": queries}
+
+
+def compare(report: dict, baseline: dict) -> None:
+    for name, result in report["datasets"].items():
+        if name not in baseline.get("datasets", {}):
+            continue
+        old = baseline["datasets"][name]["summary"]
+        new = result["summary"]
+        print(f"== {name} ==", file=sys.stderr)
+        for metric in ("wall_time_mean", "wall_time_p95", "llm_calls", "prompt_tokens", "completion_tokens", "http_calls", "errors"):
+            delta = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{metric:>18}: {old[metric]:12.4f} -> {new[metric]:12.4f} ({delta:+.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", nargs="+", default=["tufin"], choices=list(DATASETS))
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None, help="only run the first N queries of each dataset")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="simulated seconds per HTTP call")
+    parser.add_argument("--collection-size", type=int, default=250, help="items of each paged collection")
+    parser.add_argument("--warm", action="store_true", help="keep the parsing code cache between queries")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to print deltas against")
+    args = parser.parse_args()
+
+    # The benchmark measures the pipeline itself, so completions are never replayed.
+    langchain.llm_cache = None
+    # Parsing code runs in the sandbox pool, as it does in the server.
+    configure_sandbox({})
+
+    report = {
+        "meta": {"mode": args.mode, "repeat": args.repeat, "llm_latency": args.llm_latency, "http_latency": args.http_latency, "warm": args.warm, "python": platform.python_version()},
+        "datasets": {},
+        "skipped": {},
+    }
+    with instrument_stages():
+        for name in args.datasets:
+            missing = [path for path in DATASETS[name] if not os.path.exists(os.path.join(ROOT, path))]
+            if missing:
+                report["skipped"][name] = f"missing {', '.join(missing)}"
+                continue
+            report["datasets"][name] = run_dataset(name, args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import json
 import os
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import run
+from utils import render_metrics, format_sse
 
 app = Flask(__name__)
 
@@ -14,20 +15,29 @@ def chaty():
     query = request_data['query']
     context = "\n".join(request_data['context'])
     answer = run.run_chaty(query, context)
-
-    # Search for the 'Final Answer:' in the response
-    answer_marker = "Final Answer:"
-    if answer_marker in answer:
-        # Split the answer on 'Final Answer:' and take the second part
-        final_answer = answer.split(answer_marker, 1)[1].strip()
-    else:
-        # If 'Final Answer:' is not found, set a default message
-        final_answer = answer
+    final_answer = run.extract_final_answer(answer)
 
     # Create a JSON object with the final answer
     answer_json = {"answer": final_answer}
     return json.dumps(answer_json)
 
+
+@app.route("/chaty/stream", methods=['POST'])
+def chaty_stream():
+    """Server-sent events: stage progress as it happens, then the finished answer in chunks."""
+    request_data = request.get_json()
+    query = request_data['query']
+    context = "\n".join(request_data['context'])
+    events = (format_sse(event, data) for event, data in run.stream_chaty(query, context))
+    return Response(events, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 if __name__ == "__main__":
+    run.initialize_runtime()
     port = 8080 #int(os.environ.get('PORT', 8080))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -1,5 +1,6 @@
 from .rest_gpt import RestGPT
+from .context import ExecutionContext
 from .planner import Planner
 from .api_selector import APISelector
 from .caller import Caller
-from .parser import ResponseParser, SimpleResponseParser
+from .parser import ResponseParser, SimpleResponseParser, ParsingCodeCache, parsing_code_cache
@@ -8,7 +8,7 @@ from langchain.prompts.base import BasePromptTemplate
 from langchain.prompts.prompt import PromptTemplate
 from langchain.llms.base import BaseLLM
 
-from utils import ReducedOpenAPISpec, get_matched_endpoint
+from utils import ReducedOpenAPISpec, TokenBudget, get_matched_endpoint, timed_stage
 
 logger = logging.getLogger(__name__)
 
@@ -480,17 +480,18 @@ class APISelector(Chain):
     api_spec: ReducedOpenAPISpec
     scenario: str
     api_selector_prompt: BasePromptTemplate
+    top_k: int = 20
+    token_budget: TokenBudget
     output_key: str = "result"
 
-    def __init__(self, llm: BaseLLM, scenario: str, api_spec: ReducedOpenAPISpec) -> None:
-        api_name_desc = [f"{endpoint[0]} {endpoint[1].split('.')[0] if endpoint[1] is not None else ''}" for endpoint in api_spec.endpoints]
-        api_name_desc = '\n'.join(api_name_desc)
+    def __init__(self, llm: BaseLLM, scenario: str, api_spec: ReducedOpenAPISpec, top_k: int = 20, token_budget: Optional[TokenBudget] = None) -> None:
+        token_budget = token_budget or TokenBudget()
         api_selector_prompt = PromptTemplate(
             template=API_SELECTOR_PROMPT,
-            partial_variables={"endpoints": api_name_desc, "icl_examples": icl_examples[scenario]},
-            input_variables=["plan", "background", "agent_scratchpad"],
+            partial_variables={"icl_examples": token_budget.fit_examples(icl_examples[scenario])},
+            input_variables=["endpoints", "plan", "background", "agent_scratchpad"],
         )
-        super().__init__(llm=llm, api_spec=api_spec, scenario=scenario, api_selector_prompt=api_selector_prompt)
+        super().__init__(llm=llm, api_spec=api_spec, scenario=scenario, api_selector_prompt=api_selector_prompt, top_k=top_k, token_budget=token_budget)
 
     @property
     def _chain_type(self) -> str:
@@ -527,7 +528,7 @@ class APISelector(Chain):
         if len(history) == 0:
             return ""
         scratchpad = ""
-        for i, (plan, api_plan, execution_res) in enumerate(history):
+        for i, (plan, api_plan, execution_res) in enumerate(self.token_budget.compact_steps(history)):
             if i != 0:
                 scratchpad += "Instruction: " + plan + "\n"
             scratchpad += self.llm_prefix.format(i + 1) + api_plan + "\n"
@@ -535,30 +536,64 @@ class APISelector(Chain):
         scratchpad += "Instruction: " + instruction + "\n"
         return scratchpad
     
-    def _call(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+    def _get_endpoints(self, inputs: Dict[str, Any]) -> str:
+        """List the `top_k` endpoints most relevant to the plan, background and earlier calls.
+
+        The most relevant ones are kept when the list exceeds the endpoints token budget.
+        """
+        query = [inputs['plan'], inputs['background'], inputs.get('instruction', '')]
+        query.extend(api_plan for _, api_plan, _ in inputs.get('history', []))
+        shortlist = self.api_spec.endpoint_index.top_k(" ".join(query), self.top_k)
+        shortlist = shortlist[:self.token_budget.lines_within([self.api_spec.selector_endpoints[i] for i in shortlist])]
+        return '\n'.join(self.api_spec.selector_endpoints[i] for i in sorted(shortlist))
+
+    def _get_selector_chain(self, inputs: Dict[str, Any]) -> Tuple[LLMChain, str]:
         # inputs: background, plan, (optional) history, instruction
         if 'history' in inputs:
             scratchpad = self._construct_scratchpad(inputs['history'], inputs['instruction'])
         else:
             scratchpad = ""
-        api_selector_chain = LLMChain(llm=self.llm, prompt=self.api_selector_prompt)
-        api_selector_chain_output = api_selector_chain.run(plan=inputs['plan'], background=inputs['background'], agent_scratchpad=scratchpad, stop=self._stop)
-        
-        api_plan = re.sub(r"API calling \d+: ", "", api_selector_chain_output).strip()
+        api_selector_chain = LLMChain(llm=self.llm, prompt=self.api_selector_prompt.partial(endpoints=self._get_endpoints(inputs)))
+        return api_selector_chain, scratchpad
 
+    def _parse_api_plan(self, api_selector_chain_output: str) -> str:
+        api_plan = re.sub(r"API calling \d+: ", "", api_selector_chain_output).strip()
         logger.info(f"API Selector: {api_plan}")
-
-        finish = re.match(r"No API call needed.(.*)", api_plan)
-        if finish is not None:
-            return {"result": api_plan}
-
+        return api_plan
+
+    def _retry_scratchpad(self, api_plan: str, api_selector_chain_output: str, scratchpad: str, iterations: int) -> Optional[str]:
+        """The scratchpad to ask again with, or None when `api_plan` can be returned.
+
+        Shared by `_call` and `_acall`: a plan is asked again, at most 3 times, while it calls
+        an endpoint that is not in the spec.
+        """
+        if iterations == 0 and re.match(r"No API call needed.(.*)", api_plan) is not None:
+            return None
+        if iterations >= 3 or get_matched_endpoint(self.api_spec, api_plan) is not None:
+            return None
+        logger.info("API Selector: The API you called is not in the list of available APIs. Please use another API.")
+        return scratchpad + api_selector_chain_output + "\nThe API you called is not in the list of available APIs. Please use another API.\n"
+
+    @timed_stage("api_selector")
+    def _call(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        api_selector_chain, scratchpad = self._get_selector_chain(inputs)
         iterations = 0
-        while get_matched_endpoint(self.api_spec, api_plan) is None and iterations < 3:
-            iterations = iterations + 1
-            logger.info("API Selector: The API you called is not in the list of available APIs. Please use another API.")
-            scratchpad += api_selector_chain_output + "\nThe API you called is not in the list of available APIs. Please use another API.\n"
+        while True:
             api_selector_chain_output = api_selector_chain.run(plan=inputs['plan'], background=inputs['background'], agent_scratchpad=scratchpad, stop=self._stop)
-            api_plan = re.sub(r"API calling \d+: ", "", api_selector_chain_output).strip()
-            logger.info(f"API Selector: {api_plan}")
-
-        return {"result": api_plan}
+            api_plan = self._parse_api_plan(api_selector_chain_output)
+            scratchpad = self._retry_scratchpad(api_plan, api_selector_chain_output, scratchpad, iterations)
+            if scratchpad is None:
+                return {"result": api_plan}
+            iterations += 1
+
+    @timed_stage("api_selector")
+    async def _acall(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        api_selector_chain, scratchpad = self._get_selector_chain(inputs)
+        iterations = 0
+        while True:
+            api_selector_chain_output = await api_selector_chain.arun(plan=inputs['plan'], background=inputs['background'], agent_scratchpad=scratchpad, stop=self._stop)
+            api_plan = self._parse_api_plan(api_selector_chain_output)
+            scratchpad = self._retry_scratchpad(api_plan, api_selector_chain_output, scratchpad, iterations)
+            if scratchpad is None:
+                return {"result": api_plan}
+            iterations += 1
@@ -1,22 +1,25 @@
+import asyncio
+import contextvars
 import json
 import logging
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 from copy import deepcopy
+import aiohttp
 import yaml
 import time
 import re
 import requests
 import os
 
-import tiktoken
-
 from langchain.chains.base import Chain
 from langchain.chains.llm import LLMChain
 from langchain.requests import RequestsWrapper
 from langchain.prompts.prompt import PromptTemplate
 from langchain.llms.base import BaseLLM
 
-from utils import simplify_json, get_matched_endpoint, ReducedOpenAPISpec, fix_json_error
+from utils import simplify_json, get_matched_endpoint, ReducedOpenAPISpec, fix_json_error, HTTPClient, ParsedResponse, parse_response, truncate_to_tokens
+from utils import PaginationPolicy, PagingParameters, find_paging_parameters, iter_pages, aiter_pages, merge_pages, is_truncated, find_page_items, timed_stage, TokenBudget, emit_progress
 from .parser import ResponseParser, SimpleResponseParser
 
 from langchain.requests import Requests
@@ -42,7 +45,7 @@ Base url: {api_url}
 Endpoints:
 {api_docs}
 
-If the API path contains "{{}}", it means that it is a variable and you should replace it with the appropriate value. For example, if the path is "/users/{{user_id}}/tweets", you should replace "{{user_id}}" with the user id. "{{" and "}}" cannot appear in the url.
+If the API path contains "{{}}", it means that it is a variable and you should replace it with the appropriate value. For example, if the path is "/users/{{user_id}}/tweets", you should replace "{{user_id}}" with the user id. "{{" and "}}" cannot appear in the url, unless you use "fan_out" as described below.
 
 You can use http request method, i.e., GET, POST, DELETE, PATCH, PUT, and generate the corresponding parameters according to the API documentation and the plan.
 The input should be a JSON string which has 3 base keys: url, description, output_instructions
@@ -51,6 +54,7 @@ The value of "description" should describe what the API response is about. The d
 The value of "output_instructions" should be instructions on what information to extract from the response, for example the id(s) for a resource(s) that the POST request creates. Note "output_instructions" MUST be natural language and as verbose as possible! It cannot be "return the full response". Output instructions should faithfully contain the contents of the api calling plan and be as specific as possible. The output instructions can also contain conditions such as filtering, sorting, etc.
 If you are using GET method, add "params" key, and the value of "params" should be a dict of key-value pairs.
 If you are using POST, PATCH or PUT methods, add "data" key, and the value of "data" should be a dict of key-value pairs. 
+If the plan asks you to call the same API once for every element of a list (e.g., the revisions of every device), do not call it element by element. Make a single call: keep the variable of the path in "{{}}" in the url and add a "fan_out" key whose value maps that variable to the list of values, e.g. "fan_out": {{"id": [1, 2, 3]}}. A "fan_out" variable that is not in the url is sent as a query parameter. The calls run concurrently and the response contains one result per value.
 When invoking a POST API map the fields in the "data" element to the corresponded fields as describe in the API schema 
 Remember to add a comma after every value except the last one, ensuring that the overall structure of the JSON remains valid.
 
@@ -104,8 +108,18 @@ Input: {{
     "output_instructions": "Dont try to parse the response's body, Just check if the HTTP response code is 201 "
 }}
 
+Example 5:
+Operation: GET
+Input: {{
+    "url": "https://192.168.32.84/securetrack/api/devices/{{id}}/revisions.json",
+    "fan_out": {{
+        "id": [20, 21, 35]
+    }},
+    "description": "The API response is the list of revisions of each of the devices 20, 21 and 35",
+    "output_instructions": "Return the id and the date of the latest revision of the device"
+}}
 
-Example 8:
+Example 6:
 Operation: POST
 Input: {{
     "url": "https://192.168.32.84/securetrack/api/topology/generic/interface.json",
@@ -157,22 +171,33 @@ Thought: {agent_scratchpad}
 """
 
 
+class _NoAliasDumper(yaml.Dumper):
+    """Prints spec components shared between docs in full, not as YAML anchors and aliases."""
+
+    def ignore_aliases(self, data: Any) -> bool:
+        return True
+
 
 class Caller(Chain):
     llm: BaseLLM
     api_spec: ReducedOpenAPISpec
     scenario: str
-    requests_wrapper: RequestsWrapper
+    requests_wrapper: Union[HTTPClient, RequestsWrapper]
     max_iterations: Optional[int] = 15
     max_execution_time: Optional[float] = None
     early_stopping_method: str = "force"
     simple_parser: bool = False
     with_response: bool = False
+    fan_out_workers: int = 8
+    pagination: Optional[PaginationPolicy] = None
+    token_budget: TokenBudget
+    # (method, url, params, status) of every request issued, for the plan cache.
+    executed_calls: List[Tuple[str, str, Any, Optional[int]]] = []
     output_key: str = "result"
 
 
-    def __init__(self, llm: BaseLLM, api_spec: ReducedOpenAPISpec, scenario: str, requests_wrapper: RequestsWrapper, simple_parser: bool = False, with_response: bool = False) -> None:
-        super().__init__(llm=llm, api_spec=api_spec, scenario=scenario, requests_wrapper=requests_wrapper, simple_parser=simple_parser, with_response=with_response)
+    def __init__(self, llm: BaseLLM, api_spec: ReducedOpenAPISpec, scenario: str, requests_wrapper: Union[HTTPClient, RequestsWrapper], simple_parser: bool = False, with_response: bool = False, pagination: Optional[PaginationPolicy] = None, token_budget: Optional[TokenBudget] = None) -> None:
+        super().__init__(llm=llm, api_spec=api_spec, scenario=scenario, requests_wrapper=requests_wrapper, simple_parser=simple_parser, with_response=with_response, pagination=pagination, token_budget=token_budget or TokenBudget())
 
     @property
     def _chain_type(self) -> str:
@@ -220,7 +245,7 @@ class Caller(Chain):
         if len(history) == 0:
             return ""
         scratchpad = ""
-        for i, (plan, execution_res) in enumerate(history):
+        for i, (plan, execution_res) in enumerate(self.token_budget.compact_steps(history)):
             scratchpad += self.llm_prefix.format(i + 1) + plan + "\n"
             scratchpad += self.observation_prefix + execution_res + "\n"
         return scratchpad
@@ -244,16 +269,21 @@ class Caller(Chain):
 
         return action, action_input
     
-    def _get_response(self, action: str, action_input: str) -> str:
+    @staticmethod
+    def _load_action_input(action_input: str) -> Dict[str, Any]:
         action_input = action_input.strip().strip('`')
         left_bracket = action_input.find('{')
         right_bracket = action_input.rfind('}')
         action_input = action_input[left_bracket:right_bracket + 1]
         try:
-            data = json.loads(action_input)
+            return json.loads(action_input)
         except json.JSONDecodeError as e:
             raise e
-        
+
+    def _prepare_request(self, action: str, action_input: str) -> Tuple[str, str, Dict[str, Any], Any, Any, str, Optional[str]]:
+        """Turn the Caller's "Operation/Input" into a requests-wrapper method name, url and kwargs."""
+        data = self._load_action_input(action_input)
+
         desc = data.get("description", "No description")
         query = data.get("output_instructions", None)
 
@@ -273,49 +303,234 @@ class Caller(Chain):
         if action == "GET":
             if 'params' in data:
                 params = data.get("params")
-                response = self.requests_wrapper.get(data.get("url"), params=params, verify=False)
+                method, kwargs = "get", {"params": params, "verify": False}
             else:
-                response = self.requests_wrapper.get(data.get("url"), verify=False)
+                method, kwargs = "get", {"verify": False}
         elif action == "POST":
             params = data.get("params")
             request_body = data.get("data")
-            response = self.requests_wrapper.post(data["url"], params=params, data=request_body, verify=False)
+            method, kwargs = "post", {"params": params, "data": request_body, "verify": False}
         elif action == "PUT":
             params = data.get("params")
             request_body = data.get("data")
-            response = self.requests_wrapper.put(data["url"], params=params, data=request_body, verify=False)
+            method, kwargs = "put", {"params": params, "data": request_body, "verify": False}
         elif action == "DELETE":
             params = data.get("params")
             request_body = data.get("data")
-            response = self.requests_wrapper.delete(data["url"], params=params, json=request_body, verify=False)
+            method, kwargs = "delete", {"params": params, "json": request_body, "verify": False}
         else:
             raise NotImplementedError
-        
-        if isinstance(response, requests.models.Response):
-            if response.status_code != 200:
-                return response.text
-            response_text = response.text
-        elif isinstance(response, str):
-            response_text = response
+
+        return method, data.get("url"), kwargs, params, request_body, desc, query
+
+    def _record_call(self, action: str, url: str, params: Any, response: Any) -> None:
+        status = getattr(response, "status_code", None)
+        self.executed_calls.append((action, url, params, status))
+        emit_progress("http", method=action, url=url, status=status)
+
+    def _record_page(self, action: str, url: str, params: Any, response: Any, page: int) -> None:
+        if page == 1:
+            # Recorded as the call the plan asked for; a replay is paged again.
+            self._record_call(action, url, params, response)
         else:
+            emit_progress("http", method=action, url=url, status=getattr(response, "status_code", None), page=page)
+
+    def _get_response(self, action: str, action_input: str) -> Tuple[ParsedResponse, Any, Any, str, Optional[str]]:
+        method, url, kwargs, params, request_body, desc, query = self._prepare_request(action, action_input)
+        response = getattr(self.requests_wrapper, method)(url, **kwargs)
+        self._record_call(action, url, params, response)
+
+        # Error bodies are passed on to the parser too, like the text-only requests wrapper did.
+        if not isinstance(response, (requests.models.Response, str)):
             raise NotImplementedError
         
-        return response_text, params, request_body, desc, query
-    
-    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
-        iterations = 0
-        time_elapsed = 0.0
-        start_time = time.time()
-        intermediate_steps: List[Tuple[str, str]] = []
+        return parse_response(response), params, request_body, desc, query
+
+    async def _aget_response(self, action: str, action_input: str) -> Tuple[ParsedResponse, Any, Any, str, Optional[str]]:
+        if not isinstance(self.requests_wrapper, HTTPClient):
+            # langchain's wrappers have no pooled async path; keep them off the event loop.
+            return await asyncio.to_thread(self._get_response, action, action_input)
+        method, url, kwargs, params, request_body, desc, query = self._prepare_request(action, action_input)
+        response = await getattr(self.requests_wrapper, "a" + method)(url, **kwargs)
+        self._record_call(action, url, params, response)
+        return parse_response(response), params, request_body, desc, query
+
+    def _expand_fan_out(self, action_input: str) -> Optional[List[Tuple[Dict[str, Any], str]]]:
+        """Expand an Input with a "fan_out" key into one concrete Input per parameter value.
+
+        Returns None for ordinary Inputs. Each fan-out variable is substituted into its
+        "{name}" placeholder in the url, or sent as a query parameter when the url has none.
+        Several variables are zipped, so their value lists must have the same length.
+        A "fan_out" that is not an object of lists, such as {"id": "1,2,3"}, is rejected with
+        a ValueError, which the Caller reports back to the LLM as the step's observation.
+        """
+        data = self._load_action_input(action_input)
+        fan_out = data.pop("fan_out", None)
+        if not fan_out:
+            return None
+        if not isinstance(fan_out, dict) or not all(isinstance(values, list) for values in fan_out.values()):
+            raise ValueError(f"fan_out must map each variable to a list of values: {fan_out}")
+        lengths = {len(values) for values in fan_out.values()}
+        if len(lengths) != 1:
+            raise ValueError(f"fan_out value lists must have the same length: {fan_out}")
+
+        expanded = []
+        for i in range(lengths.pop()):
+            binding = {name: values[i] for name, values in fan_out.items()}
+            item = deepcopy(data)
+            for name, value in binding.items():
+                placeholder = "{" + name + "}"
+                if placeholder in item["url"]:
+                    item["url"] = item["url"].replace(placeholder, str(value))
+                else:
+                    item["params"] = item.get("params") or {}
+                    item["params"][name] = value
+            expanded.append((binding, json.dumps(item)))
+        return expanded
+
+    @staticmethod
+    def _merge_results(bindings: List[Dict[str, Any]], results: List[str]) -> str:
+        lines = []
+        for binding, result in zip(bindings, results):
+            label = ", ".join(f"{name}={value}" for name, value in binding.items())
+            lines.append(f"[{label}] {result.strip()}")
+        return "\n".join(lines)
+
+    def _try_get_response(self, action: str, action_input: str) -> Union[Tuple[ParsedResponse, Any, Any, str, Optional[str]], Exception]:
+        try:
+            return self._get_response(action, action_input)
+        except requests.exceptions.RequestException as e:
+            return e
+
+    async def _atry_get_response(self, action: str, action_input: str, semaphore: asyncio.Semaphore) -> Union[Tuple[ParsedResponse, Any, Any, str, Optional[str]], Exception]:
+        async with semaphore:
+            try:
+                return await self._aget_response(action, action_input)
+            except (requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return e
+
+    def _execute(self, action: str, action_input: str) -> str:
+        response, params, request_body, desc, query = self._get_response(action, action_input)
+        response_parser = self._get_response_parser(action, action_input)
+        return response_parser.run(**self._get_parser_inputs(response, params, request_body, desc, query))
+
+    async def _aexecute(self, action: str, action_input: str) -> str:
+        response, params, request_body, desc, query = await self._aget_response(action, action_input)
+        response_parser = self._get_response_parser(action, action_input)
+        return await response_parser.arun(**self._get_parser_inputs(response, params, request_body, desc, query))
+
+    def _start_fan_out(self, action: str, fan_out: List[Tuple[Dict[str, Any], str]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        bindings, action_inputs = zip(*fan_out)
+        logger.info(f"Fan-out: {len(action_inputs)} {action} calls")
+        return list(bindings), list(action_inputs)
+
+    def _execute_fan_out(self, action: str, fan_out: List[Tuple[Dict[str, Any], str]]) -> str:
+        """Issue the expanded calls on a bounded thread pool and merge the parsed results.
+
+        Responses are parsed one after another: the first parse generates the parsing code
+        and the others reuse it from the parsing code cache instead of calling the LLM.
+        """
+        bindings, action_inputs = self._start_fan_out(action, fan_out)
+        with ThreadPoolExecutor(max_workers=min(self.fan_out_workers, len(action_inputs))) as pool:
+            # Each call runs in a copy of this context, so stage metrics and progress events reach the query.
+            futures = [pool.submit(contextvars.copy_context().run, self._try_get_response, action, action_input) for action_input in action_inputs]
+            responses = [future.result() for future in futures]
+
+        response_parser = self._get_response_parser(action, action_inputs[0])
+        results = [f"Request failed: {response}" if isinstance(response, Exception) else response_parser.run(**self._get_parser_inputs(*response)) for response in responses]
+        return self._merge_results(bindings, results)
+
+    async def _aexecute_fan_out(self, action: str, fan_out: List[Tuple[Dict[str, Any], str]]) -> str:
+        bindings, action_inputs = self._start_fan_out(action, fan_out)
+        semaphore = asyncio.Semaphore(self.fan_out_workers)
+        responses = await asyncio.gather(*(self._atry_get_response(action, action_input, semaphore) for action_input in action_inputs))
+
+        response_parser = self._get_response_parser(action, action_inputs[0])
+        results = [f"Request failed: {response}" if isinstance(response, Exception) else await response_parser.arun(**self._get_parser_inputs(*response)) for response in responses]
+        return self._merge_results(bindings, results)
+
+    def _get_paging_parameters(self, action: str, action_input: str) -> Optional[PagingParameters]:
+        """Return the endpoint's start/count parameters if this call should be fetched page by page.
+
+        Calls that set the page size themselves are left alone; a start set without a count
+        is kept as the offset the pages begin at.
+        """
+        if self.pagination is None or action != "GET":
+            return None
+        api_url = self.api_spec.servers[0]['url']
+        data = self._load_action_input(action_input)
+        matched_endpoints = get_matched_endpoint(self.api_spec, action + ' ' + data['url'].replace(api_url, ''))
+        if not matched_endpoints:
+            return None
+        paging = find_paging_parameters(self.api_spec.endpoint_docs.get(matched_endpoints[0]))
+        params = data.get("params") or {}
+        if paging is None or paging.count in params:
+            return None
+        try:
+            int(params.get(paging.start, 0))
+        except (TypeError, ValueError):
+            return None
+        return paging
+
+    @staticmethod
+    def _get_page_params(params: Optional[dict], paging: PagingParameters, start: int, count: int) -> dict:
+        params = params or {}
+        return {**params, paging.start: int(params.get(paging.start, 0)) + start, paging.count: count}
+
+    def _get_paged_parser(self, action: str, action_input: str, pages: List[ParsedResponse], params: Any, request_body: Any, desc: str, query: Optional[str]) -> Tuple[Chain, Dict[str, Any]]:
+        logger.info(f"Paged {action}: {len(pages)} pages")
+        return self._get_response_parser(action, action_input), self._get_parser_inputs(merge_pages(pages), params, request_body, desc, query)
+
+    def _paged_observation(self, result: str, pages: List[ParsedResponse]) -> str:
+        if not is_truncated(pages, self.pagination):
+            return result
+        _, total = find_page_items(pages[0].data)
+        fetched = len(pages) * self.pagination.page_size
+        remaining = f"of {total} " if total is not None else ""
+        return f"{result.rstrip()}\nNote: only the first {fetched} {remaining}items were fetched ({len(pages)} pages); the rest of the collection was not read."
+
+    def _execute_paged(self, action: str, action_input: str, paging: PagingParameters) -> str:
+        """Fetch a collection page by page, then parse the items of all pages together.
+
+        Every page is downloaded (with read-ahead) before the single parse of the merged
+        pages; a collection cut off by the page limit is noted in the observation.
+        """
+        method, url, kwargs, params, request_body, desc, query = self._prepare_request(action, action_input)
+
+        def fetch(start: int, count: int) -> requests.Response:
+            response = self.requests_wrapper.get(url, **{**kwargs, "params": self._get_page_params(params, paging, start, count)})
+            self._record_page(action, url, params, response, start // count + 1)
+            return response
+
+        pages = list(iter_pages(fetch, self.pagination))
+        response_parser, parser_inputs = self._get_paged_parser(action, action_input, pages, params, request_body, desc, query)
+        return self._paged_observation(response_parser.run(**parser_inputs), pages)
+
+    async def _aexecute_paged(self, action: str, action_input: str, paging: PagingParameters) -> str:
+        method, url, kwargs, params, request_body, desc, query = self._prepare_request(action, action_input)
+
+        async def fetch(start: int, count: int) -> requests.Response:
+            page_kwargs = {**kwargs, "params": self._get_page_params(params, paging, start, count)}
+            if isinstance(self.requests_wrapper, HTTPClient):
+                response = await self.requests_wrapper.aget(url, **page_kwargs)
+            else:
+                response = await asyncio.to_thread(self.requests_wrapper.get, url, **page_kwargs)
+            self._record_page(action, url, params, response, start // count + 1)
+            return response
 
-        api_plan = inputs['api_plan']
+        pages = [page async for page in aiter_pages(fetch, self.pagination)]
+        response_parser, parser_inputs = self._get_paged_parser(action, action_input, pages, params, request_body, desc, query)
+        return self._paged_observation(await response_parser.arun(**parser_inputs), pages)
+
+    def _get_caller_chain(self, api_plan: str) -> LLMChain:
         api_url = self.api_spec.servers[0]['url']
         matched_endpoints = get_matched_endpoint(self.api_spec, api_plan)
-        endpoint_docs_by_name = {name: docs for name, _, docs in self.api_spec.endpoints}
+        endpoint_docs_by_name = self.api_spec.endpoint_docs
         api_doc_for_caller = ""
         assert len(matched_endpoints) == 1, f"Found {len(matched_endpoints)} matched endpoints, but expected 1."
         endpoint_name = matched_endpoints[0]
-        tmp_docs = deepcopy(endpoint_docs_by_name.get(endpoint_name))
+        # Only top-level keys are replaced below; the docs themselves are shared and read-only.
+        tmp_docs = dict(endpoint_docs_by_name.get(endpoint_name))
         if 'responses' in tmp_docs and 'content' in tmp_docs['responses']:
             if 'application/json' in tmp_docs['responses']['content']:
                 tmp_docs['responses'] = tmp_docs['responses']['content']['application/json']['schema']['properties']
@@ -323,11 +538,8 @@ class Caller(Chain):
                 tmp_docs['responses'] = tmp_docs['responses']['content']['application/json; charset=utf-8']['schema']['properties']
         if not self.with_response and 'responses' in tmp_docs:
             tmp_docs.pop("responses")
-        tmp_docs = yaml.dump(tmp_docs)
-        encoder = tiktoken.encoding_for_model('gpt-3.5-turbo-0125')
-        encoded_docs = encoder.encode(tmp_docs)
-        if len(encoded_docs) > 1500:
-            tmp_docs = encoder.decode(encoded_docs[:1500])
+        tmp_docs = yaml.dump(tmp_docs, Dumper=_NoAliasDumper)
+        tmp_docs = truncate_to_tokens(tmp_docs, 1500, suffix='')
         api_doc_for_caller += f"== Docs for {endpoint_name} == \n{tmp_docs}\n"
 
         caller_prompt = PromptTemplate(
@@ -339,7 +551,66 @@ class Caller(Chain):
             input_variables=["api_plan", "background", "agent_scratchpad"],
         )
         
-        caller_chain = LLMChain(llm=self.llm, prompt=caller_prompt)
+        return LLMChain(llm=self.llm, prompt=caller_prompt)
+
+    def _get_response_parser(self, action: str, action_input: str) -> Chain:
+        api_url = self.api_spec.servers[0]['url']
+        called_endpoint_name = action + ' ' + json.loads(action_input)['url'].replace(api_url, '')
+        called_endpoint_name = get_matched_endpoint(self.api_spec, called_endpoint_name)[0]
+        api_path = api_url + called_endpoint_name.split(' ')[-1]
+        api_doc_for_parser = self.api_spec.endpoint_docs.get(called_endpoint_name)
+        if not self.simple_parser:
+            return ResponseParser(
+                llm=self.llm,
+                api_path=api_path,
+                api_doc=api_doc_for_parser,
+            )
+        return SimpleResponseParser(
+            llm=self.llm,
+            api_path=api_path,
+            api_doc=api_doc_for_parser,
+        )
+
+    @staticmethod
+    def _get_parser_inputs(response: ParsedResponse, params: Any, request_body: Any, desc: str, query: Optional[str]) -> Dict[str, Any]:
+        params_or_data = {
+            "params": params if params is not None else "No parameters",
+            "data": request_body if request_body is not None else "No request body",
+        }
+        return {"query": query, "response_description": desc, "api_param": params_or_data, "json": response}
+
+    def _get_execution(self, action: str, action_input: str) -> Tuple[str, Any]:
+        """Decide how a step's Input is executed.
+
+        Returns ("fan_out", expanded inputs), ("paged", paging parameters), ("single", None),
+        or ("invalid", observation) for an Input that cannot be called as given.
+        """
+        try:
+            fan_out = self._expand_fan_out(action_input)
+        except ValueError as e:
+            return "invalid", f"Invalid Input, no API was called: {e}"
+        if fan_out is not None:
+            return "fan_out", fan_out
+        paging = self._get_paging_parameters(action, action_input)
+        if paging is not None:
+            return "paged", paging
+        return "single", None
+
+    @staticmethod
+    def _record_step(intermediate_steps: List[Tuple[str, str]], caller_chain_output: str, parsing_res: str) -> None:
+        logger.info(f"Parser: {parsing_res}")
+        emit_progress("result", result=parsing_res)
+        intermediate_steps.append((caller_chain_output, parsing_res))
+
+    @timed_stage("caller")
+    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
+        iterations = 0
+        time_elapsed = 0.0
+        start_time = time.time()
+        intermediate_steps: List[Tuple[str, str]] = []
+
+        api_plan = inputs['api_plan']
+        caller_chain = self._get_caller_chain(api_plan)
 
         while self._should_continue(iterations, time_elapsed):
             scratchpad = self._construct_scratchpad(intermediate_steps)
@@ -349,33 +620,50 @@ class Caller(Chain):
             action, action_input = self._get_action_and_input(caller_chain_output)
             if action == "Execution Result":
                 return {"result": action_input}
-            response, params, request_body, desc, query = self._get_response(action, action_input)
-
-            called_endpoint_name = action + ' ' + json.loads(action_input)['url'].replace(api_url, '')
-            called_endpoint_name = get_matched_endpoint(self.api_spec, called_endpoint_name)[0]
-            api_path = api_url + called_endpoint_name.split(' ')[-1]
-            api_doc_for_parser = endpoint_docs_by_name.get(called_endpoint_name)
-            if not self.simple_parser:
-                response_parser = ResponseParser(
-                    llm=self.llm,
-                    api_path=api_path,
-                    api_doc=api_doc_for_parser,
-                )
+            kind, execution = self._get_execution(action, action_input)
+            if kind == "fan_out":
+                parsing_res = self._execute_fan_out(action, execution)
+            elif kind == "paged":
+                parsing_res = self._execute_paged(action, action_input, execution)
+            elif kind == "single":
+                parsing_res = self._execute(action, action_input)
             else:
-                response_parser = SimpleResponseParser(
-                    llm=self.llm,
-                    api_path=api_path,
-                    api_doc=api_doc_for_parser,
-                )
+                parsing_res = execution
+            self._record_step(intermediate_steps, caller_chain_output, parsing_res)
 
-            params_or_data = {
-                "params": params if params is not None else "No parameters",
-                "data": request_body if request_body is not None else "No request body",
-            }
-            parsing_res = response_parser.run(query=query, response_description=desc, api_param=params_or_data, json=response)
-            logger.info(f"Parser: {parsing_res}")
+            iterations += 1
+            time_elapsed = time.time() - start_time
 
-            intermediate_steps.append((caller_chain_output, parsing_res))
+        return {"result": caller_chain_output}
+
+    @timed_stage("caller")
+    async def _acall(self, inputs: Dict[str, str]) -> Dict[str, str]:
+        iterations = 0
+        time_elapsed = 0.0
+        start_time = time.time()
+        intermediate_steps: List[Tuple[str, str]] = []
+
+        api_plan = inputs['api_plan']
+        caller_chain = self._get_caller_chain(api_plan)
+
+        while self._should_continue(iterations, time_elapsed):
+            scratchpad = self._construct_scratchpad(intermediate_steps)
+            caller_chain_output = await caller_chain.arun(api_plan=api_plan, background=inputs['background'], agent_scratchpad=scratchpad, stop=self._stop)
+            logger.info(f"Caller: {caller_chain_output}")
+
+            action, action_input = self._get_action_and_input(caller_chain_output)
+            if action == "Execution Result":
+                return {"result": action_input}
+            kind, execution = self._get_execution(action, action_input)
+            if kind == "fan_out":
+                parsing_res = await self._aexecute_fan_out(action, execution)
+            elif kind == "paged":
+                parsing_res = await self._aexecute_paged(action, action_input, execution)
+            elif kind == "single":
+                parsing_res = await self._aexecute(action, action_input)
+            else:
+                parsing_res = execution
+            self._record_step(intermediate_steps, caller_chain_output, parsing_res)
 
             iterations += 1
             time_elapsed = time.time() - start_time
@@ -383,7 +671,6 @@ class Caller(Chain):
         return {"result": caller_chain_output}
 
 
-
 # "data": {{
 #          "ticket.subject": "OMERTEST",
 #          "ticket.priority": "Normal",
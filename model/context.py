@@ -0,0 +1,47 @@
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, List, Optional, Tuple
+
+
+@dataclass
+class ExecutionContext:
+    """Request-scoped state for one RestGPT run.
+
+    RestGPT itself holds no per-query state, so a single instance can serve concurrent
+    requests. Histories are bounded deques: once `max_history` steps are recorded the
+    oldest step is evicted, which keeps prompts and memory from growing without limit.
+    """
+
+    max_history: int = 30
+    max_execution_time: Optional[float] = None
+    planner_history: Deque[Tuple[str, str]] = field(init=False)
+    api_selector_history: Deque[Tuple[str, str, str]] = field(init=False)
+    counters: Counter = field(default_factory=Counter)
+    # (method, url, params, status) of every API request, in order.
+    api_calls: List[Tuple[str, str, Any, Optional[int]]] = field(default_factory=list)
+    start_time: float = field(default_factory=time.time)
+    deadline: Optional[float] = field(init=False)
+
+    def __post_init__(self):
+        self.planner_history = deque(maxlen=self.max_history)
+        self.api_selector_history = deque(maxlen=self.max_history)
+        self.deadline = self.start_time + self.max_execution_time if self.max_execution_time is not None else None
+
+    @property
+    def time_elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+
+    def new_api_selector_round(self) -> None:
+        """Start a fresh API selector history for the next top-level plan."""
+        self.api_selector_history.clear()
+
+    def record_step(self, plan: str, api_plan: str, execution_res: str) -> None:
+        self.planner_history.append((plan, execution_res))
+        self.api_selector_history.append((plan, api_plan, execution_res))
@@ -1,6 +1,10 @@
 import json
 import logging
-from typing import Any, Dict, List, Optional
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import sys
 from io import StringIO
 
@@ -13,7 +17,7 @@ from langchain.chains.llm import LLMChain
 from langchain.prompts.prompt import PromptTemplate
 from langchain.llms.base import BaseLLM
 
-from utils import simplify_json
+from utils import ParsedResponse, digest_json, parse_response, get_encoder, fits_within, truncate_to_tokens, timed_stage, get_sandbox_pool, ResponseProjector
 
 logger = logging.getLogger(__name__)
 
@@ -60,7 +64,7 @@ Begin!
 Python Code:
 """
 
-CODE_PARSING_RESPONSE_TEMPLATE = """Here is an API response JSON snippet with its corresponding schema and a query. 
+CODE_PARSING_RESPONSE_TEMPLATE = """Here is a digest of an API response JSON with its corresponding schema and a query. 
 The API's response JSON follows the schema.
 Assume the JSON response is stored in a python dict variable called 'data', your task is to generate Python code to extract information I need from the API response.
 Please print the final result.
@@ -82,7 +86,7 @@ Parameters for this API call:
 Response JSON schema defined in the OAS:
 {response_schema}
 
-JSON snippet:
+JSON digest (one line per path: types, presence rate, array lengths, numeric range, distinct values):
 {json}
 
 Query: {query}
@@ -181,6 +185,74 @@ class PythonREPL(BaseModel):
         return output
 
 
+def run_parsing_code(code: str, json_data: Any) -> Optional[str]:
+    """Run generated parsing code over `data` in the sandbox pool, or in-process when it is disabled."""
+    pool = get_sandbox_pool()
+    if pool is None:
+        return PythonREPL(_globals={"data": json_data}).run(code)
+    return pool.run(code, {"data": json_data})
+
+
+async def arun_parsing_code(code: str, json_data: Any) -> Optional[str]:
+    pool = get_sandbox_pool()
+    if pool is None:
+        return PythonREPL(_globals={"data": json_data}).run(code)
+    return await pool.arun(code, {"data": json_data})
+
+
+class ParsingCodeCache:
+    """LRU cache of parsing programs that already ran successfully.
+
+    Programs are keyed by endpoint, normalized query and a hash of the response schema
+    the code was generated against. A cached program that raises or prints nothing is
+    evicted so the next call regenerates it.
+    """
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max_entries
+        self._programs: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(api_path: str, query: str, schema_hash: str) -> tuple:
+        normalized_query = re.sub(r"\s+", " ", query.strip().lower()).rstrip(" .?!")
+        return api_path, normalized_query, schema_hash
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            code = self._programs.get(key)
+            if code is None:
+                self.counters["misses"] += 1
+                return None
+            self._programs.move_to_end(key)
+            self.counters["hits"] += 1
+            return code
+
+    def put(self, key: tuple, code: str) -> None:
+        with self._lock:
+            self._programs[key] = code
+            self._programs.move_to_end(key)
+            while len(self._programs) > self.max_entries:
+                self._programs.popitem(last=False)
+
+    def invalidate(self, key: tuple) -> None:
+        with self._lock:
+            if self._programs.pop(key, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._programs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {**self.counters, "entries": len(self._programs), "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0}
+
+
+parsing_code_cache = ParsingCodeCache()
+
+
 class ResponseParser(Chain):
     """Implements Program-Aided Language Models."""
 
@@ -192,6 +264,9 @@ class ResponseParser(Chain):
     python_globals: Optional[Dict[str, Any]] = None
     python_locals: Optional[Dict[str, Any]] = None
     encoder: tiktoken.Encoding = None
+    api_path: str = None
+    projector: ResponseProjector = None
+    response_schema_hash: str = None
     max_json_length_1: int = 500000
     max_json_length_2: int = 200000
     max_output_length: int = 50000
@@ -209,23 +284,21 @@ class ResponseParser(Chain):
                 },
                 input_variables=["query", "json", "api_param", "response_description"]
             )
-            super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt)
+            encoder = get_encoder()
+            super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt, encoder=encoder, projector=ResponseProjector(api_path, api_doc))
             return
 
         if 'application/json' in api_doc['responses']['content']:
             response_schema = json.dumps(api_doc['responses']['content']['application/json']["schema"]['properties'], indent=4)
         elif 'application/json; charset=utf-8' in api_doc['responses']['content']:
             response_schema = json.dumps(api_doc['responses']['content']['application/json; charset=utf-8']["schema"]['properties'], indent=4)
-        encoder = tiktoken.encoding_for_model('gpt-3.5-turbo-0125')
-        encoded_schema = encoder.encode(response_schema)
+        encoder = get_encoder()
         max_schema_length = 2500
-        if len(encoded_schema) > max_schema_length:
-            response_schema = encoder.decode(encoded_schema[:max_schema_length]) + '...'
+        response_schema = truncate_to_tokens(response_schema, max_schema_length)
         # if len(response_schema) > RESPONSE_SCHEMA_MAX_LENGTH:
         #     response_schema = response_schema[:RESPONSE_SCHEMA_MAX_LENGTH] + '...'
         if with_example and 'examples' in api_doc['responses']['content']['application/json']:
-            response_example = simplify_json(api_doc['responses']['content']['application/json']["examples"]['response']['value'])
-            response_example = json.dumps(response_example, indent=4)
+            response_example = digest_json(api_doc['responses']['content']['application/json']["examples"]['response']['value']).render()
         else:
             response_example = "No example provided"
         code_parsing_schema_prompt = PromptTemplate(
@@ -265,7 +338,10 @@ class ResponseParser(Chain):
                          code_parsing_response_prompt=code_parsing_response_prompt, 
                          llm_parsing_prompt=llm_parsing_prompt, 
                          postprocess_prompt=postprocess_prompt, 
-                         encoder=encoder)
+                         encoder=encoder,
+                         api_path=api_path,
+                         projector=ResponseProjector(api_path, api_doc),
+                         response_schema_hash=hashlib.sha256(response_schema.encode()).hexdigest())
 
     @property
     def _chain_type(self) -> str:
@@ -290,51 +366,97 @@ class ResponseParser(Chain):
         else:
             return [self.output_key, "intermediate_steps"]
 
-    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
-        if self.code_parsing_schema_prompt is None or inputs['query'] is None:
-            extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
-            output = extract_code_chain.predict(query=inputs['query'], json=inputs['json'], api_param=inputs['api_param'], response_description=inputs['response_description'])
-            return {"result": output}
-        
-        extract_code_chain = LLMChain(llm=self.llm, prompt=self.code_parsing_schema_prompt)
-        code = extract_code_chain.predict(query=inputs['query'], response_description=inputs['response_description'], api_param=inputs['api_param'])
-        logger.info(f"Code: \n{code}")
-        json_data = json.loads(inputs["json"])
-        repl = PythonREPL(_globals={"data": json_data})
-        res = repl.run(code)
-        output = res
-
-        if output is None or len(output) == 0:
-            extract_code_chain = LLMChain(llm=self.llm, prompt=self.code_parsing_response_prompt)
-            json_data = json.loads(inputs["json"])
-            encoded_json = self.encoder.encode(inputs["json"])
-            if len(encoded_json) > self.max_json_length_1:
-                simplified_json_data = self.encoder.decode(encoded_json[:self.max_json_length_1]) + '...'
-            else:
-                simplified_json_data = inputs["json"]
-            # simplified_json_data = json.dumps(simplify_json(json_data), indent=4)
-            code = extract_code_chain.predict(query=inputs['query'], json=simplified_json_data, api_param=inputs['api_param'])
-            logger.info(f"Code: \n{code}")
-            repl = PythonREPL(_globals={"data": json_data})
-            res = repl.run(code)
-            output = res
-
-        if output is None or len(output) == 0:
-            extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
-            if len(encoded_json) > self.max_json_length_2:
-                simplified_json_data = self.encoder.decode(encoded_json[:self.max_json_length_2]) + '...'
-            output = extract_code_chain.predict(query=inputs['query'], json=simplified_json_data, api_param=inputs['api_param'], response_description=inputs['response_description'])
+    def _parses_with_code(self, response: ParsedResponse, inputs: Dict[str, Any]) -> bool:
+        return self.code_parsing_schema_prompt is not None and inputs['query'] is not None and response.is_json
 
-        encoded_output = self.encoder.encode(output)
-        if len(encoded_output) > self.max_output_length:
-            output = self.encoder.decode(encoded_output[:self.max_output_length])
-            logger.info(f"Output too long, truncating to {self.max_output_length} tokens")
-            postprocess_chain = LLMChain(llm=self.llm, prompt=self.postprocess_prompt)
-            output = postprocess_chain.predict(truncated_str=output)
+    def _get_llm_parsing_inputs(self, response: ParsedResponse, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(query=inputs['query'], json=self.projector.excerpt(response, inputs['query'], self.max_json_length_2), api_param=inputs['api_param'], response_description=inputs['response_description'])
 
+    def _get_cached_code(self, inputs: Dict[str, Any]) -> Tuple[tuple, Optional[str]]:
+        cache_key = parsing_code_cache.make_key(self.api_path, inputs['query'], self.response_schema_hash)
+        cached_code = parsing_code_cache.get(cache_key)
+        if cached_code is not None:
+            logger.info(f"Code (cached): \n{cached_code}")
+        return cache_key, cached_code
+
+    def _get_code_chains(self, json_data: Any, inputs: Dict[str, Any]) -> Iterator[Tuple[LLMChain, Dict[str, Any]]]:
+        """Yield the code-writing chains to try in order, with their inputs.
+
+        Code is written from the response schema first, then from a digest of the response
+        itself; the digest is only rendered if the first program prints nothing.
+        """
+        yield LLMChain(llm=self.llm, prompt=self.code_parsing_schema_prompt), dict(query=inputs['query'], response_description=inputs['response_description'], api_param=inputs['api_param'])
+        json_digest = digest_json(json_data).render(self.max_json_length_1)
+        yield LLMChain(llm=self.llm, prompt=self.code_parsing_response_prompt), dict(query=inputs['query'], json=json_digest, api_param=inputs['api_param'])
+
+    def _get_postprocess_inputs(self, output: str) -> Optional[Dict[str, Any]]:
+        """Return the postprocess chain's inputs if the output is too long, else None."""
+        if fits_within(output, self.max_output_length):
+            return None
+        logger.info(f"Output too long, truncating to {self.max_output_length} tokens")
+        return dict(truncated_str=truncate_to_tokens(output, self.max_output_length, suffix=''))
+
+    @timed_stage("parser")
+    def _call(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        response = parse_response(inputs["json"])
+        llm_parsing_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
+        if not self._parses_with_code(response, inputs):
+            return {"result": llm_parsing_chain.predict(**self._get_llm_parsing_inputs(response, inputs))}
+
+        cache_key, code = self._get_cached_code(inputs)
+        output = None
+        if code is not None:
+            output = run_parsing_code(code, response.data)
+            if not output:
+                parsing_code_cache.invalidate(cache_key)
+
+        if not output:
+            for extract_code_chain, chain_inputs in self._get_code_chains(response.data, inputs):
+                code = extract_code_chain.predict(**chain_inputs)
+                logger.info(f"Code: \n{code}")
+                output = run_parsing_code(code, response.data)
+                if output:
+                    parsing_code_cache.put(cache_key, code)
+                    break
+
+        if not output:
+            output = llm_parsing_chain.predict(**self._get_llm_parsing_inputs(response, inputs))
+
+        postprocess_inputs = self._get_postprocess_inputs(output)
+        if postprocess_inputs is not None:
+            output = LLMChain(llm=self.llm, prompt=self.postprocess_prompt).predict(**postprocess_inputs)
         return {"result": output}
 
-    
+    @timed_stage("parser")
+    async def _acall(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        response = parse_response(inputs["json"])
+        llm_parsing_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
+        if not self._parses_with_code(response, inputs):
+            return {"result": await llm_parsing_chain.apredict(**self._get_llm_parsing_inputs(response, inputs))}
+
+        cache_key, code = self._get_cached_code(inputs)
+        output = None
+        if code is not None:
+            output = await arun_parsing_code(code, response.data)
+            if not output:
+                parsing_code_cache.invalidate(cache_key)
+
+        if not output:
+            for extract_code_chain, chain_inputs in self._get_code_chains(response.data, inputs):
+                code = await extract_code_chain.apredict(**chain_inputs)
+                logger.info(f"Code: \n{code}")
+                output = await arun_parsing_code(code, response.data)
+                if output:
+                    parsing_code_cache.put(cache_key, code)
+                    break
+
+        if not output:
+            output = await llm_parsing_chain.apredict(**self._get_llm_parsing_inputs(response, inputs))
+
+        postprocess_inputs = self._get_postprocess_inputs(output)
+        if postprocess_inputs is not None:
+            output = await LLMChain(llm=self.llm, prompt=self.postprocess_prompt).apredict(**postprocess_inputs)
+        return {"result": output}
 
 
 class SimpleResponseParser(Chain):
@@ -343,6 +465,7 @@ class SimpleResponseParser(Chain):
     llm: BaseLLM
     llm_parsing_prompt: PromptTemplate = None
     encoder: tiktoken.Encoding = None
+    projector: ResponseProjector = None
     max_json_length: int = 1000
     output_key: str = "result"
     return_intermediate_steps: bool = False
@@ -358,8 +481,8 @@ class SimpleResponseParser(Chain):
                 },
                 input_variables=["query", "json", "api_param", "response_description"]
             )
-            encoder = tiktoken.encoding_for_model('gpt-3.5-turbo-0125')
-            super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt, encoder=encoder)
+            encoder = get_encoder()
+            super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt, encoder=encoder, projector=ResponseProjector(api_path, api_doc))
             return
 
         llm_parsing_prompt = PromptTemplate(
@@ -371,9 +494,9 @@ class SimpleResponseParser(Chain):
             input_variables=["query", "json", "api_param", "response_description"]
         )
 
-        encoder = tiktoken.encoding_for_model('gpt-3.5-turbo-0125')
+        encoder = get_encoder()
 
-        super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt, encoder=encoder)
+        super().__init__(llm=llm, llm_parsing_prompt=llm_parsing_prompt, encoder=encoder, projector=ResponseProjector(api_path, api_doc))
 
     @property
     def _chain_type(self) -> str:
@@ -398,18 +521,28 @@ class SimpleResponseParser(Chain):
         else:
             return [self.output_key, "intermediate_steps"]
 
-    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
+    @timed_stage("parser")
+    def _call(self, inputs: Dict[str, Any]) -> Dict[str, str]:
         if inputs['query'] is None:
             extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
-            output = extract_code_chain.predict(query=inputs['query'], json=inputs['json'], api_param=inputs['api_param'], response_description=inputs['response_description'])
+            output = extract_code_chain.predict(query=inputs['query'], json=self.projector.excerpt(parse_response(inputs['json']), inputs['query'], self.max_json_length), api_param=inputs['api_param'], response_description=inputs['response_description'])
             return {"result": output}
         
-        encoded_json = self.encoder.encode(inputs["json"])
         extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
-        if len(encoded_json) > self.max_json_length:
-            encoded_json = self.encoder.decode(encoded_json[:self.max_json_length]) + '...'
-        output = extract_code_chain.predict(query=inputs['query'], json=encoded_json, api_param=inputs['api_param'], response_description=inputs['response_description'])
+        truncated_json = self.projector.excerpt(parse_response(inputs["json"]), inputs['query'], self.max_json_length)
+        output = extract_code_chain.predict(query=inputs['query'], json=truncated_json, api_param=inputs['api_param'], response_description=inputs['response_description'])
 
         return {"result": output}
 
-    
\ No newline at end of file
+    @timed_stage("parser")
+    async def _acall(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        if inputs['query'] is None:
+            extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
+            output = await extract_code_chain.apredict(query=inputs['query'], json=self.projector.excerpt(parse_response(inputs['json']), inputs['query'], self.max_json_length), api_param=inputs['api_param'], response_description=inputs['response_description'])
+            return {"result": output}
+        
+        extract_code_chain = LLMChain(llm=self.llm, prompt=self.llm_parsing_prompt)
+        truncated_json = self.projector.excerpt(parse_response(inputs["json"]), inputs['query'], self.max_json_length)
+        output = await extract_code_chain.apredict(query=inputs['query'], json=truncated_json, api_param=inputs['api_param'], response_description=inputs['response_description'])
+
+        return {"result": output}
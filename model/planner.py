@@ -6,6 +6,8 @@ from langchain.chains.llm import LLMChain
 from langchain.prompts.prompt import PromptTemplate
 from langchain.llms.base import BaseLLM
 
+from utils import TokenBudget, timed_stage
+
 icl_examples = {
     "tufin": """Example 1:
 User query: get the details about device 12 in JSON format
@@ -91,10 +93,11 @@ class Planner(Chain):
     llm: BaseLLM
     scenario: str
     planner_prompt: str
+    token_budget: TokenBudget
     output_key: str = "result"
 
-    def __init__(self, llm: BaseLLM, scenario: str, planner_prompt=PLANNER_PROMPT) -> None:
-        super().__init__(llm=llm, scenario=scenario, planner_prompt=planner_prompt)
+    def __init__(self, llm: BaseLLM, scenario: str, planner_prompt=PLANNER_PROMPT, token_budget: Optional[TokenBudget] = None) -> None:
+        super().__init__(llm=llm, scenario=scenario, planner_prompt=planner_prompt, token_budget=token_budget or TokenBudget())
 
     @property
     def _chain_type(self) -> str:
@@ -131,26 +134,36 @@ class Planner(Chain):
         if len(history) == 0:
             return ""
         scratchpad = ""
-        for i, (plan, execution_res) in enumerate(history):
+        for i, (plan, execution_res) in enumerate(self.token_budget.compact_steps(history)):
             scratchpad += self.llm_prefix.format(i + 1) + plan + "\n"
             scratchpad += self.observation_prefix + execution_res + "\n"
         return scratchpad
 
-    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
+    def _get_planner_chain(self, inputs: Dict[str, Any]) -> LLMChain:
         scratchpad = self._construct_scratchpad(inputs['history'])
         # print("Scrachpad: \n", scratchpad)
         planner_prompt = PromptTemplate(
             template=self.planner_prompt,
             partial_variables={
                 "agent_scratchpad": scratchpad,
-                "icl_examples": icl_examples[self.scenario],
+                "icl_examples": self.token_budget.fit_examples(icl_examples[self.scenario]),
             },
             input_variables=["input"]
         )
-        planner_chain = LLMChain(llm=self.llm, prompt=planner_prompt)
-        planner_chain_output = planner_chain.run(input=inputs['input'], stop=self._stop)
+        return LLMChain(llm=self.llm, prompt=planner_prompt)
 
+    @timed_stage("planner")
+    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
+        planner_chain = self._get_planner_chain(inputs)
+        planner_chain_output = planner_chain.run(input=inputs['input'], stop=self._stop)
         planner_chain_output = re.sub(r"Plan step \d+: ", "", planner_chain_output).strip()
 
         return {"result": planner_chain_output}
 
+    @timed_stage("planner")
+    async def _acall(self, inputs: Dict[str, str]) -> Dict[str, str]:
+        planner_chain = self._get_planner_chain(inputs)
+        planner_chain_output = await planner_chain.arun(input=inputs['input'], stop=self._stop)
+        planner_chain_output = re.sub(r"Plan step \d+: ", "", planner_chain_output).strip()
+
+        return {"result": planner_chain_output}
@@ -6,7 +6,7 @@ from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from langchain.callbacks.base import BaseCallbackManager
 from langchain.chains.base import Chain
-from langchain.callbacks.manager import CallbackManagerForChainRun
+from langchain.callbacks.manager import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
 from langchain.llms.base import BaseLLM
 
 from langchain.requests import RequestsWrapper
@@ -14,7 +14,8 @@ from langchain.requests import RequestsWrapper
 from .planner import Planner
 from .api_selector import APISelector
 from .caller import Caller
-from utils import ReducedOpenAPISpec
+from .context import ExecutionContext
+from utils import ReducedOpenAPISpec, HTTPClient, PaginationPolicy, TokenBudget, emit_progress
 
 
 logger = logging.getLogger(__name__)
@@ -25,14 +26,16 @@ class RestGPT(Chain):
     llm: BaseLLM
     api_spec: ReducedOpenAPISpec
     planner: Planner
-    planner_history: List[Tuple[str, str]] = []
     api_selector: APISelector
     scenario: str = "tmdb"
-    requests_wrapper: RequestsWrapper
+    requests_wrapper: Union[HTTPClient, RequestsWrapper]
     simple_parser: bool = False
     return_intermediate_steps: bool = False
     max_iterations: Optional[int] = 15
     max_execution_time: Optional[float] = None
+    max_history: int = 30
+    pagination: Optional[PaginationPolicy] = None
+    token_budget: TokenBudget
     early_stopping_method: str = "force"
 
     def __init__(
@@ -40,11 +43,14 @@ class RestGPT(Chain):
         llm: BaseLLM,
         api_spec: ReducedOpenAPISpec,
         scenario: str,
-        requests_wrapper: RequestsWrapper,
+        requests_wrapper: Union[HTTPClient, RequestsWrapper],
         caller_doc_with_response: bool = False,
         parser_with_example: bool = False,
         simple_parser: bool = False,
         callback_manager: Optional[BaseCallbackManager] = None,
+        planner: Optional[Planner] = None,
+        api_selector: Optional[APISelector] = None,
+        token_budget: Optional[TokenBudget] = None,
         **kwargs: Any,
     ) -> None:
         if scenario in ['TMDB', 'Tmdb']:
@@ -56,12 +62,16 @@ class RestGPT(Chain):
         if scenario not in ['tmdb', 'spotify', 'tufin']:
             raise ValueError(f"Invalid scenario {scenario}")
         
-        planner = Planner(llm=llm, scenario=scenario)
-        api_selector = APISelector(llm=llm, scenario=scenario, api_spec=api_spec)
+        # Planner and APISelector are stateless between runs, so a warm runtime can share them.
+        token_budget = token_budget or TokenBudget()
+        if planner is None:
+            planner = Planner(llm=llm, scenario=scenario, token_budget=token_budget)
+        if api_selector is None:
+            api_selector = APISelector(llm=llm, scenario=scenario, api_spec=api_spec, token_budget=token_budget)
 
         super().__init__(
             llm=llm, api_spec=api_spec, planner=planner, api_selector=api_selector, scenario=scenario,
-            requests_wrapper=requests_wrapper, simple_parser=simple_parser, callback_manager=callback_manager, **kwargs
+            requests_wrapper=requests_wrapper, simple_parser=simple_parser, token_budget=token_budget, callback_manager=callback_manager, **kwargs
         )
 
     def save(self, file_path: Union[Path, str]) -> None:
@@ -96,13 +106,10 @@ class RestGPT(Chain):
         print("Debug...")
         return input()
 
-    def _should_continue(self, iterations: int, time_elapsed: float) -> bool:
-        if self.max_iterations is not None and iterations >= self.max_iterations:
+    def _should_continue(self, context: ExecutionContext) -> bool:
+        if self.max_iterations is not None and context.counters["iterations"] >= self.max_iterations:
             return False
-        if (
-            self.max_execution_time is not None
-            and time_elapsed >= self.max_execution_time
-        ):
+        if context.expired():
             return False
 
         return True
@@ -116,11 +123,10 @@ class RestGPT(Chain):
             final_output["intermediate_steps"] = intermediate_steps
         return final_output
 
-    # def _get_api_selector_background(self, planner_history: List[Tuple[str, str]]) -> str:
-    def _get_api_selector_background(self) -> str:
-        if len(self.planner_history) == 0:
+    def _get_api_selector_background(self, context: ExecutionContext) -> str:
+        if len(context.planner_history) == 0:
             return "No background"
-        return "\n".join([step[1] for step in self.planner_history])
+        return "\n".join([step[1] for step in self.token_budget.compact_steps(list(context.planner_history))])
 
     def _should_continue_plan(self, plan) -> bool:
         if re.search("Continue", plan):
@@ -132,63 +138,151 @@ class RestGPT(Chain):
             return True
         return False
 
+    def new_context(self) -> ExecutionContext:
+        return ExecutionContext(max_history=self.max_history, max_execution_time=self.max_execution_time)
+
+    def _get_planner_inputs(self, query: str, context: ExecutionContext) -> Dict[str, Any]:
+        context.increment("planner_calls")
+        return dict(input=query, history=list(context.planner_history))
+
+    @staticmethod
+    def _record_plan(plan: str) -> str:
+        logger.info(f"Planner: {plan}")
+        emit_progress("plan", plan=plan)
+        return plan
+
+    def _plan(self, query: str, context: ExecutionContext) -> str:
+        return self._record_plan(self.planner.run(**self._get_planner_inputs(query, context)))
+
+    async def _aplan(self, query: str, context: ExecutionContext) -> str:
+        return self._record_plan(await self.planner.arun(**self._get_planner_inputs(query, context)))
+
+    def _get_executor(self, api_plan: str, context: ExecutionContext) -> Union[str, Caller]:
+        """Return the answer of a plan that needs no API call, or a Caller to execute it."""
+        finished = re.match(r"No API call needed.(.*)", api_plan)
+        if finished:
+            return finished.group(1)
+        emit_progress("api_plan", api_plan=api_plan)
+        context.increment("caller_calls")
+        return Caller(llm=self.llm, api_spec=self.api_spec, scenario=self.scenario, simple_parser=self.simple_parser, requests_wrapper=self.requests_wrapper, pagination=self.pagination, token_budget=self.token_budget)
+
+    def _execute(self, api_plan: str, background: str, context: ExecutionContext) -> str:
+        executor = self._get_executor(api_plan, context)
+        if isinstance(executor, str):
+            return executor
+        try:
+            return executor.run(api_plan=api_plan, background=background)
+        finally:
+            context.api_calls.extend(executor.executed_calls)
+
+    async def _aexecute(self, api_plan: str, background: str, context: ExecutionContext) -> str:
+        executor = self._get_executor(api_plan, context)
+        if isinstance(executor, str):
+            return executor
+        try:
+            return await executor.arun(api_plan=api_plan, background=background)
+        finally:
+            context.api_calls.extend(executor.executed_calls)
+
+    def _get_api_selector_inputs(self, context: ExecutionContext, plan: str, instruction: Optional[str] = None) -> Dict[str, Any]:
+        """Count an API selector call and build its inputs.
+
+        `instruction` is a "Continue" plan from the Planner, refining the round's first plan.
+        """
+        background = self._get_api_selector_background(context)
+        context.increment("api_selector_calls")
+        if instruction is None:
+            return dict(plan=plan, background=background)
+        return dict(plan=plan, background=background, history=list(context.api_selector_history), instruction=instruction)
+
+    @staticmethod
+    def _get_path_plan(query: str, api_plan: str) -> str:
+        api_plan = f"{api_plan} to {query.strip()}"
+        logger.info(f"Direct call: {api_plan}")
+        return api_plan
+
+    def run_path(self, query: str, api_plans: Sequence[str], context: Optional[ExecutionContext] = None) -> str:
+        """Answer a request from known API calls, one Caller run each, skipping the Planner and APISelector.
+
+        Used for the intent router's single-endpoint fast path and for plan cache replays.
+        Each call sees the results of the previous ones as its background.
+        """
+        context = context or self.new_context()
+        execution_res = ""
+        for api_plan in api_plans:
+            api_plan = self._get_path_plan(query, api_plan)
+            execution_res = self._execute(api_plan, self._get_api_selector_background(context), context)
+            context.record_step(query, api_plan, execution_res)
+        return f"Final Answer: {execution_res.strip()}"
+
+    async def arun_path(self, query: str, api_plans: Sequence[str], context: Optional[ExecutionContext] = None) -> str:
+        context = context or self.new_context()
+        execution_res = ""
+        for api_plan in api_plans:
+            api_plan = self._get_path_plan(query, api_plan)
+            execution_res = await self._aexecute(api_plan, self._get_api_selector_background(context), context)
+            context.record_step(query, api_plan, execution_res)
+        return f"Final Answer: {execution_res.strip()}"
+
     def _call(
         self,
         inputs: Dict[str, Any],
         run_manager: Optional[CallbackManagerForChainRun] = None,
     ) -> Dict[str, Any]:
         query = inputs['query']
+        # Callers may pass their own context (e.g. to read counters afterwards); otherwise each run gets a fresh one.
+        context = inputs.get('context') or self.new_context()
 
-        # planner_history: List[Tuple[str, str]] = []
-        iterations = 0
-        time_elapsed = 0.0
-        start_time = time.time()
+        plan = self._plan(query, context)
 
-        plan = self.planner.run(input=query, history=self.planner_history)
-        logger.info(f"Planner: {plan}")
+        while self._should_continue(context):
+            context.new_api_selector_round()
+            api_selector_inputs = self._get_api_selector_inputs(context, plan)
+            while True:
+                api_plan = self.api_selector.run(**api_selector_inputs)
+
+                execution_res = self._execute(api_plan, api_selector_inputs['background'], context)
+                context.record_step(plan, api_plan, execution_res)
 
-        while self._should_continue(iterations, time_elapsed):
-            tmp_planner_history = [plan]
-            api_selector_history: List[Tuple[str, str, str]] = []
-            # api_selector_background = self._get_api_selector_background(self.planner_history)
-            api_selector_background = self._get_api_selector_background()
-            api_plan = self.api_selector.run(plan=plan, background=api_selector_background)
+                plan = self._plan(query, context)
+                if not self._should_continue_plan(plan):
+                    break
+                api_selector_inputs = self._get_api_selector_inputs(context, api_selector_inputs['plan'], instruction=plan)
 
-            finished = re.match(r"No API call needed.(.*)", api_plan)
-            if not finished:
-                executor = Caller(llm=self.llm, api_spec=self.api_spec, scenario=self.scenario, simple_parser=self.simple_parser, requests_wrapper=self.requests_wrapper)
-                execution_res = executor.run(api_plan=api_plan, background=api_selector_background)
-            else:
-                execution_res = finished.group(1)
+            if self._should_end(plan):
+                break
 
-            self.planner_history.append((plan, execution_res))
-            api_selector_history.append((plan, api_plan, execution_res))
+            context.increment("iterations")
+
+        return {"result": plan}
 
-            plan = self.planner.run(input=query, history=self.planner_history)
-            logger.info(f"Planner: {plan}")
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        query = inputs['query']
+        context = inputs.get('context') or self.new_context()
 
-            while self._should_continue_plan(plan):
-                # api_selector_background = self._get_api_selector_background(self.planner_history)
-                api_selector_background = self._get_api_selector_background()
-                api_plan = self.api_selector.run(plan=tmp_planner_history[0], background=api_selector_background, history=api_selector_history, instruction=plan)
+        plan = await self._aplan(query, context)
 
-                finished = re.match(r"No API call needed.(.*)", api_plan)
-                if not finished:
-                    executor = Caller(llm=self.llm, api_spec=self.api_spec, scenario=self.scenario, simple_parser=self.simple_parser, requests_wrapper=self.requests_wrapper)
-                    execution_res = executor.run(api_plan=api_plan, background=api_selector_background)
-                else:
-                    execution_res = finished.group(1)
+        while self._should_continue(context):
+            context.new_api_selector_round()
+            api_selector_inputs = self._get_api_selector_inputs(context, plan)
+            while True:
+                api_plan = await self.api_selector.arun(**api_selector_inputs)
 
-                self.planner_history.append((plan, execution_res))
-                api_selector_history.append((plan, api_plan, execution_res))
+                execution_res = await self._aexecute(api_plan, api_selector_inputs['background'], context)
+                context.record_step(plan, api_plan, execution_res)
 
-                plan = self.planner.run(input=query, history=self.planner_history)
-                logger.info(f"Planner: {plan}")
+                plan = await self._aplan(query, context)
+                if not self._should_continue_plan(plan):
+                    break
+                api_selector_inputs = self._get_api_selector_inputs(context, api_selector_inputs['plan'], instruction=plan)
 
             if self._should_end(plan):
                 break
 
-            iterations += 1
-            time_elapsed = time.time() - start_time
+            context.increment("iterations")
 
         return {"result": plan}
@@ -1,13 +1,20 @@
 import os
 import json
+import asyncio
 import logging
+import queue
+import threading
 import time
 import yaml
+from urllib.parse import urlsplit
 
-from langchain.requests import Requests
 from langchain import OpenAI
 
-from utils import reduce_openapi_spec, ColorPrint
+from utils import load_spec_bundle, get_http_client, build_response_cache, configure_llm_cache, configure_sandbox, PaginationPolicy, TokenBudget, ColorPrint
+from utils import LLMMetricsCallbackHandler, observe_stage, observe_iterations, set_endpoint_resolver, register_cache
+from utils import build_intent_router, build_plan_cache, Route, AGENT_LABEL
+from utils import report_progress, emit_progress, iter_answer_chunks
+from model import parsing_code_cache
 from model import RestGPT
 
 logger = logging.getLogger()
@@ -28,57 +35,296 @@ def load_configuration():
     return config
 
 
-def initialize_api_scenario():
-    with open("specs/tufin_oas.json") as f:
-        raw_api_spec = json.load(f)
-    api_spec = reduce_openapi_spec(raw_api_spec, only_required=False, merge_allof=True)
+def initialize_api_scenario(config=None):
+    cache_dir = (config or {}).get('spec_cache_dir', '.spec_cache')
+    api_spec = load_spec_bundle("specs/tufin_oas.json", cache_dir=cache_dir, only_required=False, merge_allof=True)
     return api_spec
 
 
-def setup_scenario(api_spec):
+def setup_scenario(api_spec, config=None):
     headers = {'Authorization': f'Basic {os.environ["TUFIN_BASIC_AUTH"]}'}
-    requests_wrapper = Requests(headers=headers)
-    llm = OpenAI(model_name="gpt-3.5-turbo-0125", temperature=0.0, max_tokens=700)
-    return RestGPT(llm, api_spec=api_spec, scenario='tufin', requests_wrapper=requests_wrapper, simple_parser=False)
+    response_cache = build_response_cache((config or {}).get('response_cache'))
+    requests_wrapper = get_http_client(headers=headers, response_cache=response_cache, **(config or {}).get('http_client', {}))
+    llm = OpenAI(model_name="gpt-3.5-turbo-0125", temperature=0.0, max_tokens=700, callbacks=[LLMMetricsCallbackHandler()])
+    pagination = PaginationPolicy(**(config or {}).get('pagination', {}))
+    token_budget = TokenBudget(**(config or {}).get('token_budget', {}))
+    return RestGPT(llm, api_spec=api_spec, scenario='tufin', requests_wrapper=requests_wrapper, simple_parser=False, pagination=pagination, token_budget=token_budget)
 
 
-def run_chaty(prompt, context):
-    initialize_logging()
-    config = load_configuration()
-    api_spec = initialize_api_scenario()
-    rest_gpt = setup_scenario(api_spec)
+def setup_metrics(api_spec, llm_cache=None):
+    """Label HTTP latencies with the spec's endpoint templates and report the caches' hit ratios."""
+    def endpoint_template(method, url):
+        return api_spec.endpoint_matcher.match(f"{method.upper()} {urlsplit(url).path}")
+
+    set_endpoint_resolver(endpoint_template)
+    register_cache("parsing_code", parsing_code_cache.stats)
+    if llm_cache is not None:
+        register_cache("llm", llm_cache.stats)
+    response_cache = get_http_client().response_cache
+    if response_cache is not None:
+        register_cache("http_response", response_cache.stats)
+
+
+class AgentRuntime:
+    """Preloaded agent components, built once per process and shared by every request.
+
+    RestGPT keeps all per-query state in an ExecutionContext, so the single `agent`
+    instance can serve concurrent requests; each request only creates a new context.
+    """
+
+    def __init__(self, config: dict, api_spec, agent: RestGPT, startup_report: dict, router=None, plan_cache=None):
+        self.config = config
+        self.api_spec = api_spec
+        self.agent = agent
+        self.router = router
+        self.plan_cache = plan_cache
+        self.startup_report = startup_report
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def initialize_runtime() -> AgentRuntime:
+    """Build the process-wide AgentRuntime once and log how long each startup stage took."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            return _runtime
+
+        startup_report = {}
+        start_time = stage_start = time.perf_counter()
+
+        def _mark(stage):
+            nonlocal stage_start
+            now = time.perf_counter()
+            startup_report[stage] = now - stage_start
+            stage_start = now
+
+        initialize_logging()
+        _mark("logging")
+        config = load_configuration()
+        llm_cache = configure_llm_cache(config.get('llm_cache'))
+        configure_sandbox(config.get('sandbox'))
+        _mark("configuration")
+        api_spec = initialize_api_scenario(config)
+        _mark("api_spec")
+        agent = setup_scenario(api_spec, config)
+        setup_metrics(api_spec, llm_cache)
+        _mark("agent")
+        router = build_intent_router(config.get('router'), api_spec)
+        plan_cache = build_plan_cache(config.get('plan_cache'), api_spec)
+        if plan_cache is not None:
+            register_cache("plan", plan_cache.stats)
+        _mark("router")
+        startup_report["total"] = time.perf_counter() - start_time
+
+        logger.info("Startup report: " + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in startup_report.items()))
+        _runtime = AgentRuntime(config, api_spec, agent, startup_report, router, plan_cache)
+        return _runtime
+
+
+def get_runtime() -> AgentRuntime:
+    if _runtime is None:
+        return initialize_runtime()
+    return _runtime
+
+
+def route_prompt(prompt):
+    """Route a prompt with the runtime's intent router; every prompt goes to the agent without one."""
+    router = get_runtime().router
+    if router is None:
+        return Route("agent")
+    start = time.perf_counter()
+    route = router.route(prompt)
+    emit_progress("route", kind=route.kind, intent=route.intent)
+    logger.info(f"Route: {route.kind} ({route.intent}, confidence {route.confidence:.2f}) in {(time.perf_counter() - start) * 1e6:.0f}us")
+    return route
+
+
+def uses_direct_path(route, context):
+    """Whether the prompt stands on its own, so its API calls can be replayed or learned.
+
+    A follow-up ("sort them by ip") depends on earlier turns, and a prompt the router sent
+    to the agent for its anaphora or several steps has no single replayable shape.
+    """
+    return not context and not (route.kind == "agent" and route.intent == AGENT_LABEL)
+
+
+def direct_path(prompt, route, context=None):
+    """API calls that answer the prompt without planning: a plan cache replay or the router's fast path."""
+    if not uses_direct_path(route, context):
+        return None
+    plan_cache = get_runtime().plan_cache
+    api_plans = plan_cache.lookup(prompt) if plan_cache is not None else None
+    if api_plans is not None:
+        logger.info(f"Plan cache hit: {api_plans}")
+        return api_plans
+    if route.kind == "endpoint":
+        return [route.endpoint]
+    return None
+
+
+def learn_path(prompt, route, context, answer, execution_context):
+    """Remember the API calls of a run that reached a final answer.
+
+    Only runs whose agent received the prompt alone are learned, so the cache is keyed on
+    exactly what the agent answered.
+    """
+    plan_cache = get_runtime().plan_cache
+    if plan_cache is not None and uses_direct_path(route, context) and "Final Answer" in answer:
+        plan_cache.learn(prompt, execution_context.api_calls)
+
+
+ERROR_ANSWER = "Encountered an error, can you ask the question again? Try to be specific."
+
+
+def extract_final_answer(answer):
+    # Search for the 'Final Answer:' in the response
+    answer_marker = "Final Answer:"
+    if answer_marker in answer:
+        # Split the answer on 'Final Answer:' and take the second part
+        return answer.split(answer_marker, 1)[1].strip()
+    # If 'Final Answer:' is not found, use the whole answer
+    return answer
+
+
+def _start_query(prompt):
+    """Check out the agent with a fresh execution context and route the prompt."""
     logger.info(f"{prompt}")
+    checkout_start = time.perf_counter()
+    rest_gpt = get_runtime().agent
+    execution_context = rest_gpt.new_context()
+    logger.info(f"Agent checkout time: {(time.perf_counter() - checkout_start) * 1000:.2f}ms")
+    return rest_gpt, execution_context, route_prompt(prompt)
+
+
+def _agent_query(prompt, context):
+    full_query = f"Previous conversations: {context} User question: {prompt}"
+    logger.info(f"Query: {full_query}")
+    return full_query
+
+
+def _finish_query(answer, execution_context):
+    logger.info(f"Answer: {answer}")
+    logger.info(f"Counters: {dict(execution_context.counters)}")
+    logger.debug(f"HTTP connection stats: {get_http_client().stats()}")
+    logger.info(f"Execution Time: {execution_context.time_elapsed:.2f}s")
+    observe_iterations(execution_context.counters)
+
+
+def run_chaty(prompt, context):
+    try:
+        rest_gpt, execution_context, route = _start_query(prompt)
+        if route.kind == "answer":
+            logger.info(route.answer)
+            return route.answer
+
+        with observe_stage("query"):
+            api_plans = direct_path(prompt, route, context)
+            if api_plans is not None:
+                answer = rest_gpt.run_path(prompt, api_plans, context=execution_context)
+            else:
+                answer = rest_gpt.run(query=_agent_query(prompt, context), context=execution_context)
+                learn_path(prompt, route, context, answer, execution_context)
+        _finish_query(answer, execution_context)
+        return answer
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        return ERROR_ANSWER
+
+
+async def arun_chaty(prompt, context):
+    """Async run_chaty: LLM and API calls are awaited, so one process can serve many queries."""
     try:
-        if prompt.lower().__contains__("what did we do before"):
-            logger.info(
-                "Final Answer: Go to Swagger API, here is the link: https://192.168.32.84/securetrack/apidoc/ and find between all the APIs something that will be relevant")
-            return "Final Answer: Go to Swagger API, here is the link: https://192.168.32.84/securetrack/apidoc/ and find between all the APIs something that will be relevant"
-        if prompt.lower().__contains__("what do we do now?"):
-            logger.info("Final Answer: Ask me any API question and I will solve all your problems!")
-            return "Final Answer: Ask me any API question and I will solve all your problems!"
-        if prompt.lower().__contains__("hi, how are you"):
-            logger.info("Final Answer: Hello, im here to assist you with APIs how can I help?")
-            return "Final Answer: Hello, Im here to assist you with APIs how can I help?"
-        if prompt.lower().__contains__("whats the weather"):
-            logger.info("Final Answer: Im not qualified to answer this question, you can teach me the API for weather")
-            return "Final Answer: Im not qualified to answer this question, you can teach me the API for weather"
-        if prompt.lower().__contains__("what else can you do"):
-            logger.info("Final Answer: I can show the world, the tos API world")
-            return "Final Answer: I can show the world, the tos API world"
-        full_query = f"Previous conversations: {context} User question: {prompt}"
-        logger.info(f"Query: {full_query}")
-
-        answer = rest_gpt.run(full_query)
-        logger.info(f"Answer: {answer}")
-        logger.info(f"Execution Time: {time.time() - time.time()}")
+        rest_gpt, execution_context, route = _start_query(prompt)
+        if route.kind == "answer":
+            logger.info(route.answer)
+            return route.answer
 
+        with observe_stage("query"):
+            api_plans = direct_path(prompt, route, context)
+            if api_plans is not None:
+                answer = await rest_gpt.arun_path(prompt, api_plans, context=execution_context)
+            else:
+                answer = await rest_gpt.arun(query=_agent_query(prompt, context), context=execution_context)
+                learn_path(prompt, route, context, answer, execution_context)
+        _finish_query(answer, execution_context)
         return answer
     except Exception as e:
         logger.error(f"An error occurred: {e}")
-        return "Encountered an error, can you ask the question again? Try to be specific."
+        return ERROR_ANSWER
+
+
+def _answer_events(answer):
+    final_answer = extract_final_answer(answer)
+    for chunk in iter_answer_chunks(final_answer):
+        yield "answer_chunk", {"text": chunk}
+    yield "answer", {"answer": final_answer}
+
+
+def stream_chaty(prompt, context):
+    """Run run_chaty on a worker thread and yield (event, data) for each stage as it happens.
+
+    The finished answer follows as "answer_chunk" events and a closing "answer" event.
+    """
+    events = queue.Queue()
+
+    def worker():
+        answer = ERROR_ANSWER
+        try:
+            with report_progress(lambda event, data: events.put((event, data))):
+                answer = run_chaty(prompt, context)
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+        finally:
+            # Always end the stream, or the consumer waits for events forever.
+            events.put((None, answer))
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        event, data = events.get()
+        if event is None:
+            break
+        yield event, data
+    yield from _answer_events(data)
+
+
+async def astream_chaty(prompt, context):
+    """Async stream_chaty; the query is cancelled if the client stops reading."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def sink(event, data):
+        # Events may come from worker threads (e.g. langchain's sync requests wrapper).
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    async def worker():
+        answer = ERROR_ANSWER
+        try:
+            with report_progress(sink):
+                answer = await arun_chaty(prompt, context)
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+        finally:
+            sink(None, answer)
+
+    task = asyncio.create_task(worker())
+    try:
+        while True:
+            event, data = await events.get()
+            if event is None:
+                break
+            yield event, data
+    finally:
+        if not task.done():
+            task.cancel()
+    for event, data in _answer_events(data):
+        yield event, data
 
 
 def main():
+    initialize_runtime()
     history = []
     while True:
         prompt = input("Please input an instruction (Press ENTER to use the example instruction): ")
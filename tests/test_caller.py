@@ -0,0 +1,100 @@
+import json
+import os
+
+import asyncio
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+
+from model import Caller
+from utils import HTTPClient, PaginationPolicy, reduce_openapi_spec
+
+from conftest import ROOT
+
+BASE_URL = "https://tos.example"
+
+
+class PromptRecordingLLM(FakeListLLM):
+    prompts: list = []
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return super()._call(prompt, stop, run_manager, **kwargs)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return self._call(prompt, stop, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def api_spec():
+    with open(os.path.join(ROOT, "specs", "tufin_oas.json")) as f:
+        api_spec = reduce_openapi_spec(json.load(f), only_required=False, merge_allof=True)
+    api_spec.servers = [{"url": BASE_URL}]
+    return api_spec
+
+
+@pytest.fixture(scope="module")
+def caller(api_spec):
+    return Caller(FakeListLLM(responses=[]), api_spec, "tufin", HTTPClient())
+
+
+def action_input(**fields):
+    return json.dumps({"url": BASE_URL + "/securetrack/api/devices/{id}/revisions.json", "description": "revisions", **fields})
+
+
+def test_fan_out_expands_one_input_per_value(caller):
+    expanded = caller._expand_fan_out(action_input(fan_out={"id": [20, 21]}))
+    assert [binding for binding, _ in expanded] == [{"id": 20}, {"id": 21}]
+    assert [json.loads(item)["url"] for _, item in expanded] == [
+        BASE_URL + "/securetrack/api/devices/20/revisions.json",
+        BASE_URL + "/securetrack/api/devices/21/revisions.json",
+    ]
+
+
+def test_input_without_fan_out_is_not_expanded(caller):
+    assert caller._expand_fan_out(action_input()) is None
+
+
+@pytest.mark.parametrize("fan_out", [{"id": "1,2,3"}, {"id": 7}, {"id": [1, 2], "name": "a"}, ["1", "2"]])
+def test_fan_out_values_must_be_lists(caller, fan_out):
+    with pytest.raises(ValueError):
+        caller._expand_fan_out(action_input(fan_out=fan_out))
+
+
+def test_fan_out_lists_must_have_the_same_length(caller):
+    with pytest.raises(ValueError):
+        caller._expand_fan_out(action_input(fan_out={"id": [1, 2], "name": ["a"]}))
+
+
+def test_fan_out_variables_are_sent_as_params_when_params_is_null(caller):
+    expanded = caller._expand_fan_out(json.dumps({"url": BASE_URL + "/securetrack/api/devices.json", "params": None, "fan_out": {"vendor": ["Cisco"]}}))
+    assert json.loads(expanded[0][1])["params"] == {"vendor": "Cisco"}
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_invalid_fan_out_is_reported_back_to_the_llm(api_spec, asynchronous):
+    step = "Operation: GET\nInput: " + action_input(fan_out={"id": "1,2,3"})
+    llm = PromptRecordingLLM(responses=[step, "Execution Result: corrected"], prompts=[])
+    caller = Caller(llm, api_spec, "tufin", HTTPClient())
+    inputs = {"api_plan": "GET /securetrack/api/devices/{id}/revisions.json to get the revisions", "background": ""}
+    result = asyncio.run(caller.arun(**inputs)) if asynchronous else caller.run(**inputs)
+    assert result == "corrected"
+    assert "Invalid Input, no API was called: fan_out must map each variable to a list of values" in llm.prompts[1]
+
+
+def devices_input(**params):
+    return json.dumps({"url": BASE_URL + "/securetrack/api/devices.json", "params": params, "description": "devices"})
+
+
+def test_pages_only_when_the_model_does_not_choose_a_page_size(api_spec):
+    caller = Caller(FakeListLLM(responses=[]), api_spec, "tufin", HTTPClient(), pagination=PaginationPolicy())
+    assert caller._get_paging_parameters("GET", devices_input()) is not None
+    assert caller._get_paging_parameters("GET", devices_input(start=200)) is not None
+    assert caller._get_paging_parameters("GET", devices_input(count=10)) is None
+    assert caller._get_paging_parameters("GET", devices_input(start="next")) is None
+
+
+def test_pages_begin_at_the_start_the_model_chose(api_spec):
+    paging = Caller(FakeListLLM(responses=[]), api_spec, "tufin", HTTPClient(), pagination=PaginationPolicy())._get_paging_parameters("GET", devices_input())
+    assert Caller._get_page_params({"start": "200"}, paging, 100, 100) == {"start": 300, "count": 100}
+    assert Caller._get_page_params(None, paging, 0, 100) == {"start": 0, "count": 100}
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from utils import build_intent_router, reduce_openapi_spec
+
+from conftest import ROOT
+
+DATASET_PATH = os.path.join(ROOT, "datasets", "tufin.json")
+ROUTER_OPTIONS = {
+    "intents_path": os.path.join(ROOT, "datasets", "intents.yaml"),
+    "api_examples_paths": [DATASET_PATH],
+}
+
+
+@pytest.fixture(scope="module")
+def router():
+    return build_intent_router(ROUTER_OPTIONS)
+
+
+@pytest.fixture(scope="module")
+def api_spec():
+    with open(os.path.join(ROOT, "specs", "tufin_oas.json")) as f:
+        return reduce_openapi_spec(json.load(f), only_required=False, merge_allof=True)
+
+
+@pytest.fixture(scope="module")
+def spec_router(api_spec):
+    return build_intent_router(ROUTER_OPTIONS, api_spec)
+
+
+@pytest.mark.parametrize("prompt", [
+    "How many firewalls do we have?",
+    "what can you tell me about device 20",
+    "Hi, list my devices please",
+    "hello, what are the active workflows?",
+    "show the revisions of device 12 from last week",
+    "what else can you do with tickets?",
+    "what did we do before with device 5?",
+    "sort them by ip",
+    "get the devices and then show their revisions",
+    "show its revisions",
+    "what is the os version of it",
+])
+def test_api_questions_go_to_the_agent(router, prompt):
+    assert router.route(prompt).kind == "agent"
+
+
+@pytest.mark.parametrize("prompt, intent", [
+    ("hi", "greeting"),
+    ("Hi, how are you?", "greeting"),
+    ("what else can you do?", "capabilities"),
+    ("What's the weather?", "weather"),
+    ("whats the weather", "weather"),
+    ("what do we do now?", "usage"),
+    ("what did we do before", "previous_process"),
+    ("how do I use you", "usage"),
+    ("tell me a joke", "out_of_scope"),
+])
+def test_small_talk_gets_a_canned_answer(router, prompt, intent):
+    route = router.route(prompt)
+    assert route.kind == "answer"
+    assert route.intent == intent
+    assert route.answer.startswith("Final Answer:")
+
+
+def test_agent_keywords_mark_follow_ups(router):
+    assert router.route("list all devices and then show their rules").intent == "agent"
+
+
+@pytest.mark.parametrize("prompt, endpoint", [
+    ("Give me the  device that is monitored by Tufin's Securetrack where its id is 20 and show me its os version", "GET /securetrack/api/devices/{id}.json"),
+    ("Give me the path between the given source Network-Objectc with ID 422 to destination NetworkObject with ID 483 for any given service", "GET /securetrack/api/topology/path.json"),
+    ("Give me the  revisions of a device with device id 4", "GET /securetrack/api/devices/{id}/revisions.json"),
+])
+def test_clear_single_endpoint_queries_take_the_fast_path(spec_router, prompt, endpoint):
+    route = spec_router.route(prompt)
+    assert route.kind == "endpoint"
+    assert route.endpoint == endpoint
+
+
+@pytest.mark.parametrize("prompt", ["sort them by ip", "show its revisions", "list all devices and then show their rules"])
+def test_follow_ups_never_take_the_fast_path(spec_router, prompt):
+    assert spec_router.route(prompt).kind == "agent"
+
+
+def test_fast_path_only_picks_the_solution_endpoint(spec_router, api_spec):
+    with open(DATASET_PATH) as f:
+        dataset = json.load(f)
+    fast = 0
+    for item in dataset:
+        route = spec_router.route(item["query"])
+        if route.kind != "endpoint":
+            continue
+        fast += 1
+        assert len(item["solution"]) == 1
+        method, url = item["solution"][0].split(None, 1)
+        # One solution in the dataset spells the path "devices.json.json".
+        path = url.split("?")[0].replace(".json.json", ".json")
+        assert api_spec.endpoint_matcher.match(f"{method} {path}") == route.endpoint
+    assert fast >= 10
@@ -0,0 +1,51 @@
+import json
+
+from utils import PaginationPolicy, ParsedResponse, is_truncated, merge_pages, parse_response
+from utils.pagination import find_page_items
+
+
+def page(start, count, total=250, status_code=200):
+    devices = [{"id": i, "name": f"d{i}"} for i in range(start, min(start + count, total))]
+    body = json.dumps({"devices": {"count": len(devices), "total": total, "device": devices}}).encode()
+    return ParsedResponse(body=body, data=json.loads(body), is_json=True, status_code=status_code)
+
+
+def test_pages_are_merged_into_one_collection():
+    pages = [page(0, 100), page(100, 100), page(200, 100)]
+    merged = merge_pages(pages)
+    assert [device["id"] for device in merged.data["devices"]["device"]] == list(range(250))
+    assert merged.data["devices"]["count"] == 250
+    assert merged.data["devices"]["total"] == 250
+    assert parse_response(merged.body).data == merged.data
+
+
+def test_merging_leaves_the_pages_intact():
+    pages = [page(0, 100), page(100, 100)]
+    merge_pages(pages)
+    assert len(pages[0].data["devices"]["device"]) == 100
+    assert pages[0].data["devices"]["count"] == 100
+
+
+def test_failed_pages_are_left_out():
+    failed = ParsedResponse(body=b'{"message": "error"}', data={"message": "error"}, is_json=True, status_code=500)
+    merged = merge_pages([page(0, 100), failed])
+    assert len(merged.data["devices"]["device"]) == 100
+
+
+def test_top_level_lists_are_concatenated():
+    pages = [parse_response(json.dumps([1, 2]).encode()), parse_response(json.dumps([3]).encode())]
+    assert merge_pages(pages).data == [1, 2, 3]
+
+
+def test_single_page_is_returned_as_is():
+    first = page(0, 100, total=50)
+    assert merge_pages([first]) is first
+    assert find_page_items(first.data) == (first.data["devices"]["device"], 50)
+
+
+def test_collections_cut_off_by_the_page_limit_are_truncated():
+    policy = PaginationPolicy(page_size=100, max_pages=2)
+    assert is_truncated([page(0, 100), page(100, 100)], policy)
+    assert not is_truncated([page(0, 100, total=200), page(100, 100, total=200)], policy)
+    assert not is_truncated([page(0, 100, total=150), page(100, 100, total=150)], policy)
+    assert not is_truncated([page(0, 100)], PaginationPolicy(page_size=100, max_pages=3))
@@ -0,0 +1,87 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import run
+from model.context import ExecutionContext
+from utils import PlanCache, Route, query_template, reduce_openapi_spec
+
+from conftest import ROOT
+
+BASE_URL = "https://tos.example"
+
+
+@pytest.fixture(scope="module")
+def api_spec():
+    with open(os.path.join(ROOT, "specs", "tufin_oas.json")) as f:
+        api_spec = reduce_openapi_spec(json.load(f), only_required=False, merge_allof=True)
+    api_spec.servers = [{"url": BASE_URL}]
+    return api_spec
+
+
+@pytest.fixture
+def plan_cache(api_spec):
+    return PlanCache(api_spec)
+
+
+def call(path, params=None, status=200):
+    return ("GET", BASE_URL + path, params, status)
+
+
+def test_query_template_replaces_arguments_with_slots():
+    template, slots = query_template('Path from 10.10.10.1/24 to 3.3.3.3 on tcp:443 for device 60.')
+    assert template == "path from {ip_1} to {ip_2} on {service_1} for device {num_1}"
+    assert slots == {"ip_1": "10.10.10.1/24", "ip_2": "3.3.3.3", "service_1": "tcp:443", "num_1": "60"}
+
+
+def test_learned_path_is_replayed_with_new_arguments(plan_cache):
+    assert plan_cache.learn("show the revisions of device 12", [call("/securetrack/api/devices/12/revisions.json")])
+    assert plan_cache.lookup("show the revisions of device 7") == ["GET /securetrack/api/devices/7/revisions.json"]
+    assert plan_cache.lookup("show the rules of device 7") is None
+
+
+def test_values_not_taken_from_the_query_are_not_learned(plan_cache):
+    # A device id from an earlier response, and a vendor from an earlier turn.
+    assert not plan_cache.learn("show the revisions of the first device", [call("/securetrack/api/devices/12/revisions.json")])
+    assert not plan_cache.learn("sort them by ip", [call("/securetrack/api/devices.json", {"vendor": "Cisco", "sort": "ip"})])
+    assert not plan_cache.learn("list devices with id 4", [call("/securetrack/api/devices.json", {"ids": "4,5"})])
+    assert plan_cache.stats()["entries"] == 0
+
+
+def test_query_words_and_flags_are_learned(plan_cache):
+    assert plan_cache.learn("list the cisco devices with their os version", [call("/securetrack/api/devices.json", {"vendor": "Cisco", "show_os_version": "true"})])
+    assert plan_cache.lookup("list the Cisco devices with their OS version") == ["GET /securetrack/api/devices.json?vendor=Cisco&show_os_version=true"]
+
+
+def test_failed_and_write_calls_are_not_learned(plan_cache):
+    assert not plan_cache.learn("show the revisions of device 12", [call("/securetrack/api/devices/12/revisions.json", status=404)])
+    assert not plan_cache.learn("delete device 12", [("DELETE", BASE_URL + "/securetrack/api/devices/12.json", None, 200)])
+
+
+@pytest.fixture
+def runtime(monkeypatch, plan_cache):
+    monkeypatch.setattr(run, "_runtime", SimpleNamespace(plan_cache=plan_cache))
+    plan_cache.add("give me the device with id 20", ["GET /securetrack/api/devices/20.json"])
+    return plan_cache
+
+
+def test_follow_ups_neither_replay_nor_learn(runtime):
+    route = Route("agent", intent="api")
+    assert run.direct_path("give me the device with id 5", route, []) == ["GET /securetrack/api/devices/5.json"]
+    assert run.direct_path("give me the device with id 5", route, ["list all devices"]) is None
+
+    context = ExecutionContext()
+    context.api_calls.append(call("/securetrack/api/devices.json", {"vendor": "Cisco", "sort": "ip"}))
+    run.learn_path("sort them by ip", route, ["list the cisco devices"], "Final Answer: ...", context)
+    assert runtime.lookup("sort them by ip") is None
+
+
+def test_agent_verdicts_skip_the_plan_cache(runtime):
+    route = Route("agent", intent="agent")
+    assert run.direct_path("give me the device with id 5", route, []) is None
+    context = ExecutionContext()
+    context.api_calls.append(call("/securetrack/api/devices/5/revisions.json"))
+    run.learn_path("get device 5 and then its revisions", route, [], "Final Answer: ...", context)
+    assert runtime.lookup("get device 5 and then its revisions") is None
@@ -0,0 +1,16 @@
+import run
+from utils import iter_answer_chunks
+
+
+def test_answer_chunks_rebuild_the_answer_without_cutting_characters():
+    answer = "Devices: fw-a (1), fw-b (2) — ünïcode ✓ 设备"
+    chunks = list(iter_answer_chunks(answer))
+    assert len(chunks) > 1
+    assert "".join(chunks) == answer
+
+
+def test_answer_is_streamed_as_chunks_then_a_closing_answer_event():
+    events = list(run._answer_events("Final Answer: two devices"))
+    assert {event for event, _ in events[:-1]} == {"answer_chunk"}
+    assert "".join(data["text"] for _, data in events[:-1]) == "two devices"
+    assert events[-1] == ("answer", {"answer": "two devices"})
@@ -0,0 +1,69 @@
+import copy
+import json
+
+import pytest
+
+import utils.projection
+from utils import ResponseProjector, parse_response
+
+FIELDS = ["id", "name", "vendor", "model", "virtual_type", "OS_Version", "domain_id", "licenses"]
+DATA = {"devices": {"count": 4, "total": 4, "device": [
+    {"id": 1, "name": "fw-a", "vendor": "Cisco", "model": "ASA", "virtual_type": "management", "OS_Version": "9.1", "domain_id": 1, "licenses": {"license": [{"sku": "x"}]}},
+    {"id": 2, "name": "fw-b", "vendor": "VMware", "model": "NSX", "virtual_type": "context", "OS_Version": "6", "domain_id": 1, "licenses": {"license": []}},
+    {"id": 3, "name": "fw-c", "vendor": "Palo Alto Networks", "model": "PA", "virtual_type": "management", "OS_Version": "10", "domain_id": 2, "licenses": {"license": []}},
+    {"id": 4, "name": "fw-d", "vendor": "Fortinet", "model": "FG", "virtual_type": "vsys", "OS_Version": "7", "domain_id": 2, "licenses": {"license": []}},
+]}}
+
+
+@pytest.fixture
+def projector():
+    item = {"properties": {name: {} for name in FIELDS}}
+    schema = {"properties": {"devices": {"properties": {"device": {"items": item}}}}}
+    return ResponseProjector("/securetrack/api/devices.json", {"responses": {"content": {"application/json": {"schema": schema}}}})
+
+
+def devices(projected):
+    return projected["devices"]["device"]
+
+
+@pytest.mark.parametrize("query", [
+    "all devices except management",
+    "Give me the list of the devices that are not management devices",
+    "Give me the list of the management devices",
+    "which devices are VMware",
+])
+def test_every_element_is_kept(projector, query):
+    assert [device["id"] for device in devices(projector.project(DATA, query))] == [1, 2, 3, 4]
+
+
+def test_fields_holding_query_values_are_kept(projector):
+    projected = projector.project(DATA, "Give me the list of all devices except management")
+    assert devices(projected)[1] == {"id": 2, "name": "fw-b", "virtual_type": "context"}
+    assert projected["devices"]["count"] == 4
+
+
+def test_fields_named_by_the_query_are_kept(projector):
+    projected = projector.project(DATA, "show the os version of every device")
+    assert devices(projected)[0] == {"id": 1, "name": "fw-a", "OS_Version": "9.1"}
+
+
+def test_data_is_not_modified(projector):
+    data = copy.deepcopy(DATA)
+    projector.project(data, "Give me the list of the management devices")
+    assert data == DATA
+
+
+def test_excerpt_is_projected_only_when_it_saves_enough(projector):
+    response = parse_response(json.dumps(DATA))
+    assert json.loads(projector.excerpt(response, "list the management devices", 1000)) == projector.project(DATA, "list the management devices")
+    assert projector.excerpt(response, "", 1000) == response.excerpt(1000)
+
+
+def test_original_excerpt_is_not_tokenized_again(projector, monkeypatch):
+    devices = [{"id": i, "name": f"fw-{i}", "vendor": "Cisco", "model": "ASA" * 20, "virtual_type": "management"} for i in range(2000)]
+    response = parse_response(json.dumps({"devices": {"count": 2000, "device": devices}}))
+    counted = []
+    monkeypatch.setattr(utils.projection, "count_tokens", lambda text: counted.append(text) or len(text) // 4)
+    projection = projector.measure(response, "list the management devices", 1000)
+    assert counted == [projection.text]
+    assert projection.tokens_before == 1000
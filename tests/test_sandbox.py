@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from model.parser import run_parsing_code
+from utils import SandboxPool, configure_sandbox, get_sandbox_pool
+from utils import sandbox
+
+
+@pytest.fixture(autouse=True)
+def no_global_pool(monkeypatch):
+    monkeypatch.setattr(sandbox, "_sandbox_pool", None)
+    yield
+    if sandbox._sandbox_pool is not None:
+        sandbox._sandbox_pool.close()
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(workers=1, timeout=1.0, max_memory_mb=64)
+    yield pool
+    pool.close()
+
+
+def test_no_pool_is_started_until_configured():
+    assert get_sandbox_pool() is None
+    assert run_parsing_code("print(len(data))", [1, 2, 3]).strip() == "3"
+
+
+def test_disabled_sandbox_runs_code_in_process():
+    assert configure_sandbox({"enabled": False}) is None
+    assert get_sandbox_pool() is None
+
+
+def test_configured_pool_runs_parsing_code_in_a_worker():
+    pool = configure_sandbox({"workers": 1})
+    assert get_sandbox_pool() is pool
+    worker_pid, length = run_parsing_code("import os; print(os.getpid(), len(data))", [1, 2]).split()
+    assert int(worker_pid) != os.getpid()
+    assert length == "2"
+
+
+def test_job_is_stopped_at_the_timeout_and_its_worker_replaced(pool):
+    assert pool.run("while True: pass", {}) is None
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["restarts"] == 1
+    assert pool.run("print(data)", {"data": 1}).strip() == "1"
+
+
+def test_job_is_stopped_at_the_memory_cap(pool):
+    assert pool.run("chunk = bytearray(256 * 1024 * 1024)", {}) is None
+    assert pool.stats()["memory_errors"] == 1
+    assert pool.run("print(len(bytearray(1024 * 1024)))", {}).strip() == str(1024 * 1024)
+
+
+def test_dead_worker_is_replaced(pool):
+    assert pool.run("import os, signal; os.kill(os.getpid(), signal.SIGKILL)", {}) is None
+    assert pool.stats()["restarts"] == 1
+    assert pool.stats()["idle"] == 1
+    assert pool.run("print('alive')", {}).strip() == "alive"
@@ -0,0 +1,49 @@
+import json
+
+from utils import load_spec_bundle
+
+SPEC = {
+    "servers": [{"url": "https://tos.example"}],
+    "info": {"description": ""},
+    "paths": {"/devices": {"get": {"description": "Returns the devices.", "responses": {"200": {"description": "OK"}}}}},
+}
+
+
+def write_spec(tmp_path, description):
+    spec_path = tmp_path / "spec.json"
+    spec_path.write_text(json.dumps({**SPEC, "info": {"description": description}}))
+    return spec_path
+
+
+def bundles(cache_dir):
+    return sorted(path.name for path in cache_dir.glob("*.pickle"))
+
+
+def test_bundles_of_other_reduce_options_are_kept(tmp_path):
+    spec_path, cache_dir = write_spec(tmp_path, "v1"), tmp_path / "cache"
+    load_spec_bundle(spec_path, cache_dir, only_required=False, merge_allof=True)
+    load_spec_bundle(spec_path, cache_dir, only_required=True, merge_allof=True)
+    assert len(bundles(cache_dir)) == 2
+
+
+def test_bundle_of_a_changed_spec_replaces_the_old_one(tmp_path):
+    cache_dir = tmp_path / "cache"
+    load_spec_bundle(write_spec(tmp_path, "v1"), cache_dir, only_required=True)
+    required_only = bundles(cache_dir)
+    load_spec_bundle(write_spec(tmp_path, "v1"), cache_dir, only_required=False)
+    old = [name for name in bundles(cache_dir) if name not in required_only]
+    api_spec = load_spec_bundle(write_spec(tmp_path, "v2"), cache_dir, only_required=False)
+    remaining = bundles(cache_dir)
+    assert len(remaining) == 2
+    assert set(required_only) < set(remaining)
+    assert old[0] not in remaining
+    assert api_spec.description == "v2"
+
+
+def test_bundles_of_older_versions_are_removed(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "spec.0123456789abcdef0123.v3.pickle").write_bytes(b"")
+    load_spec_bundle(write_spec(tmp_path, "v1"), cache_dir)
+    assert len(bundles(cache_dir)) == 1
+    assert not (cache_dir / "spec.0123456789abcdef0123.v3.pickle").exists()
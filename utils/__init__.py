@@ -1,2 +1,18 @@
 from .utils import simplify_json, get_matched_endpoint, ColorPrint, fix_json_error, MyRotatingFileHandler, init_spotify
-from .oas_utils import ReducedOpenAPISpec, reduce_openapi_spec
\ No newline at end of file
+from .endpoint_index import EndpointIndex
+from .oas_utils import ReducedOpenAPISpec, EndpointMatcher, RefResolver, AllOfMerger, reduce_openapi_spec
+from .spec_bundle import load_spec_bundle
+from .response_cache import ResponseCache, build_response_cache
+from .http_client import HTTPClient, get_http_client
+from .llm_cache import TieredLLMCache, configure_llm_cache
+from .tokenizer import get_encoder, count_tokens, estimate_tokens, fits_within, truncate_to_tokens
+from .json_response import ParsedResponse, parse_response
+from .pagination import PaginationPolicy, PagingParameters, find_paging_parameters, iter_pages, aiter_pages, merge_pages, is_truncated, find_page_items
+from .metrics import LLMMetricsCallbackHandler, timed_stage, observe_stage, observe_http, observe_iterations, observe_projection, set_endpoint_resolver, register_cache, render_metrics
+from .token_budget import TokenBudget
+from .projection import ResponseProjector, response_schema
+from .json_digest import JSONDigest, digest_json
+from .intent_router import AGENT_LABEL, IntentRouter, Route, build_intent_router
+from .plan_cache import PlanCache, build_plan_cache, query_template
+from .progress import report_progress, emit_progress, iter_answer_chunks, format_sse
+from .sandbox import SandboxPool, configure_sandbox, get_sandbox_pool
@@ -0,0 +1,116 @@
+"""Local retrieval index that shortlists endpoints for the API selector prompt.
+
+Each endpoint is indexed by its name, description and parameter names. A query is
+scored with BM25 over word tokens and with the cosine similarity of hashed embeddings
+(word and character-trigram features hashed into a fixed number of dimensions), which
+still matches near-misses such as "revision" vs "revisions" or "workflow" vs
+"workflows". The two scores are blended after scaling BM25 to [0, 1].
+"""
+
+import re
+import zlib
+from functools import lru_cache
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset({"a", "an", "and", "api", "by", "for", "from", "in", "is", "json", "of", "on", "or", "the", "to", "with"})
+
+
+def tokenize(text: str) -> List[str]:
+    """Split camelCase, snake_case and /path/segments into lowercase word tokens."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.lower()
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding, applied to documents and queries alike.
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _features(tokens: Iterable[str]) -> Iterable[str]:
+    for token in tokens:
+        yield token
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+@lru_cache(maxsize=65536)
+def _token_slots(token: str, dim: int) -> tuple:
+    """The dimensions a token's features are hashed into, and the signs they add there."""
+    dimensions, signs = [], []
+    for feature in _features([token]):
+        digest = zlib.crc32(feature.encode())
+        dimensions.append(digest % dim)
+        signs.append(1.0 if digest & 0x80000000 else -1.0)
+    return tuple(dimensions), tuple(signs)
+
+
+class EndpointIndex:
+    """BM25 plus hashed-embedding index over one text document per endpoint."""
+
+    def __init__(self, documents: Sequence[str], dim: int = 512, k1: float = 1.5, b: float = 0.75, alpha: float = 0.6) -> None:
+        self.dim = dim
+        self.alpha = alpha
+        self.size = len(documents)
+        tokenized = [tokenize(document) for document in documents]
+
+        self.vocabulary = {}
+        for tokens in tokenized:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+        term_frequencies = np.zeros((self.size, max(len(self.vocabulary), 1)), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            for token in tokens:
+                term_frequencies[row, self.vocabulary[token]] += 1
+
+        document_lengths = term_frequencies.sum(axis=1, keepdims=True)
+        average_length = max(float(document_lengths.mean()), 1.0) if self.size else 1.0
+        document_frequencies = (term_frequencies > 0).sum(axis=0)
+        idf = np.log(1 + (self.size - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        norm = k1 * (1 - b + b * document_lengths / average_length)
+        self.bm25_weights = (idf * term_frequencies * (k1 + 1) / (term_frequencies + norm)).astype(np.float32)
+
+        self.embeddings = np.stack([self._embed(tokens) for tokens in tokenized]) if self.size else np.zeros((0, dim), dtype=np.float32)
+
+    def _embed(self, tokens: Sequence[str]) -> np.ndarray:
+        dimensions: List[int] = []
+        signs: List[float] = []
+        for token in tokens:
+            token_dimensions, token_signs = _token_slots(token, self.dim)
+            dimensions += token_dimensions
+            signs += token_signs
+        if not dimensions:
+            return np.zeros(self.dim, dtype=np.float32)
+        vector = np.bincount(dimensions, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, query: str) -> np.ndarray:
+        return self.token_scores(tokenize(query))
+
+    def token_scores(self, tokens: Sequence[str]) -> np.ndarray:
+        """Scores of an already tokenized query."""
+        term_ids = sorted({self.vocabulary[token] for token in tokens if token in self.vocabulary})
+        bm25 = self.bm25_weights[:, term_ids].sum(axis=1) if term_ids else np.zeros(self.size, dtype=np.float32)
+        best = bm25.max(initial=0.0)
+        if best > 0:
+            bm25 = bm25 / best
+        cosine = np.maximum(self.embeddings @ self._embed(tokens), 0.0)
+        return self.alpha * bm25 + (1 - self.alpha) * cosine
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        """Indices of the `k` best-matching documents, best first.
+
+        Every document is returned, in document order, when there are no more than `k`.
+        """
+        if self.size <= k:
+            return list(range(self.size))
+        scores = self.scores(query)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best], kind="stable")].tolist()
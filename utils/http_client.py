@@ -0,0 +1,231 @@
+"""Pooled, keep-alive HTTP client shared by every Caller.
+
+The method signatures mirror langchain's `Requests` wrapper (POST/PATCH/PUT bodies are
+sent as JSON) so the client can be passed anywhere a requests wrapper is expected. The
+`a`-prefixed methods are asyncio equivalents backed by one aiohttp connection pool;
+they return `requests.Response` objects too, so callers handle both paths alike. Both
+paths consult the optional GET ResponseCache.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .metrics import observe_http
+from .response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    """A `requests.Session` with per-host connection pools and default timeouts.
+
+    `pool_connections` is the number of hosts kept pooled and `pool_maxsize` the number
+    of keep-alive connections per host, which bounds how many requests can run against
+    one host in parallel without opening throwaway connections.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 1,
+        response_cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+        self._lock = threading.Lock()
+        self._num_requests = 0
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self.response_cache = response_cache
+        self._aiosession: Optional[aiohttp.ClientSession] = None
+        self._aiosession_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        if self.response_cache is not None:
+            return self._cached_request(method, url, kwargs)
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._num_requests += 1
+        start, status = time.perf_counter(), "error"
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            observe_http(method, url, status, time.perf_counter() - start)
+
+    def _cached_request(self, method: str, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+        cache = self.response_cache
+        if method.upper() != "GET":
+            response = self._send(method, url, **kwargs)
+            cache.invalidate(url)
+            return response
+        key = cache.make_key(url, kwargs.get("params"), kwargs.get("headers"))
+        entry, fresh = cache.lookup(key)
+        if fresh:
+            return entry.to_response()
+        if entry is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cache.conditional_headers(entry)}
+        response = self._send(method, url, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return cache.revalidated(key, entry, response)
+        cache.store(key, response)
+        return response
+
+    async def _acached_request(self, method: str, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+        cache = self.response_cache
+        if method.upper() != "GET":
+            response = await self._asend(method, url, **kwargs)
+            cache.invalidate(url)
+            return response
+        key = cache.make_key(url, kwargs.get("params"), kwargs.get("headers"))
+        entry, fresh = cache.lookup(key)
+        if fresh:
+            return entry.to_response()
+        if entry is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cache.conditional_headers(entry)}
+        response = await self._asend(method, url, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return cache.revalidated(key, entry, response)
+        cache.store(key, response)
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, json=data, **kwargs)
+
+    def patch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.request("PATCH", url, json=data, **kwargs)
+
+    def put(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self.request("PUT", url, json=data, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def _get_aiosession(self) -> aiohttp.ClientSession:
+        # aiohttp sessions are bound to the loop they were created on.
+        loop = asyncio.get_running_loop()
+        if self._aiosession is None or self._aiosession.closed or self._aiosession_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self._pool_connections * self._pool_maxsize, limit_per_host=self._pool_maxsize)
+            self._aiosession = aiohttp.ClientSession(connector=connector, headers=dict(self.session.headers))
+            self._aiosession_loop = loop
+        return self._aiosession
+
+    async def arequest(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Async counterpart of `request`, accepting the same requests-style keyword arguments."""
+        if self.response_cache is not None:
+            return await self._acached_request(method, url, kwargs)
+        return await self._asend(method, url, **kwargs)
+
+    async def _asend(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        timeout = kwargs.pop("timeout", self.timeout)
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        if kwargs.pop("verify", True) is False:
+            kwargs["ssl"] = False
+        if kwargs.get("params"):
+            kwargs["params"] = {key: str(value) for key, value in kwargs["params"].items()}
+        with self._lock:
+            self._num_requests += 1
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        start, status = time.perf_counter(), "error"
+        try:
+            async with self._get_aiosession().request(method, url, timeout=timeout, **kwargs) as aio_response:
+                response = requests.Response()
+                response._content = await aio_response.read()
+                response.status_code = status = aio_response.status
+                response.headers = CaseInsensitiveDict(aio_response.headers)
+                response.url = str(aio_response.url)
+                response.reason = aio_response.reason
+                response.encoding = aio_response.charset
+                return response
+        finally:
+            observe_http(method, url, status, time.perf_counter() - start)
+
+    async def aget(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return await self.arequest("POST", url, json=data, **kwargs)
+
+    async def apatch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return await self.arequest("PATCH", url, json=data, **kwargs)
+
+    async def aput(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return await self.arequest("PUT", url, json=data, **kwargs)
+
+    async def adelete(self, url: str, **kwargs: Any) -> requests.Response:
+        return await self.arequest("DELETE", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection reuse statistics for the currently pooled hosts.
+
+        `connections` counts the TCP/TLS connections each pool opened and `requests` the
+        requests it served; everything above one request per connection was a reuse.
+        """
+        hosts = {}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "reused": max(pool.num_requests - pool.num_connections, 0),
+            }
+        connections = sum(host["connections"] for host in hosts.values())
+        pooled_requests = sum(host["requests"] for host in hosts.values())
+        stats = {
+            "requests": self._num_requests,
+            "connections": connections,
+            "reused": max(pooled_requests - connections, 0),
+            "hosts": hosts,
+        }
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats()
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+
+    async def aclose(self) -> None:
+        if self._aiosession is not None and not self._aiosession.closed:
+            await self._aiosession.close()
+
+
+_shared_client: Optional[HTTPClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_http_client(headers: Optional[Dict[str, str]] = None, **options: Any) -> HTTPClient:
+    """Return the process-wide HTTPClient, creating it with `headers`/`options` on first use."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = HTTPClient(headers=headers, **options)
+            logger.debug(f"Created shared HTTP client with options {options}")
+        return _shared_client
@@ -0,0 +1,302 @@
+"""Pre-router that answers canned and out-of-scope prompts without running the agent.
+
+Routing happens in three steps:
+1. A prompt that is exactly a keyword of a canned intent (ignoring case and punctuation)
+   gets its answer. A keyword inside a longer prompt ("what else can you do with
+   tickets?") does not answer; the rest of the prompt may be a real question.
+   A keyword automaton (Aho-Corasick) scans the prompt once for the agent keywords
+   (e.g. "for each", "and then"), which mark multi-step requests that must go to the full
+   agent, and for reference keywords ("its", "them"), which do so only when no API entity
+   comes before them in the prompt.
+2. A multinomial naive Bayes classifier, trained on the intents' examples and on the API
+   dataset queries, answers a canned or out-of-scope intent only when every word of the
+   prompt occurs in that intent's examples and the intent beats the API label by a clear
+   margin. With a few examples per intent the posterior alone is overconfident: any word
+   the intent has never seen ("firewalls", "device 20") is cheaper under a small intent
+   than under the large API label.
+3. A prompt classified as an API request whose best endpoint clearly beats the rest in
+   the spec's EndpointIndex takes the fast path: a single Caller run on that endpoint
+   without the Planner/APISelector loop.
+Everything else goes to the full agent.
+
+Everything a prompt is scored against (the classifier's log-probabilities, the endpoint
+vectors, the automaton's transitions) is computed when the router is built. Over the 21
+tufin dataset queries, a route takes about 150us; a canned answer about 2-25us. With the
+default fast-path thresholds, 13 of them take the fast path, all on the endpoint of their
+solution; the other 8 are writes (3), a two-step request (1), and queries whose best
+endpoint in the index is wrong or tied (4), which go to the agent.
+"""
+
+import json
+import logging
+import math
+import re
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import yaml
+
+from .endpoint_index import tokenize
+from .oas_utils import ReducedOpenAPISpec
+
+logger = logging.getLogger(__name__)
+
+API_LABEL = "api"
+AGENT_LABEL = "agent"
+REFERENCE_LABEL = "reference"
+PATH_PARAMETER_PATTERN = re.compile(r"\{[^}]+\}")
+VALUE_PATTERN = re.compile(r"\d+")
+PHRASE_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_phrase(text: str) -> str:
+    """Lowercase words of `text` without punctuation: "What's the weather?" -> "whats the weather"."""
+    return " ".join(PHRASE_WORD_PATTERN.findall(text.lower().replace("'", "")))
+
+
+@dataclass
+class Route:
+    kind: str  # "answer", "endpoint" or "agent"
+    intent: Optional[str] = None
+    answer: Optional[str] = None
+    endpoint: Optional[str] = None
+    confidence: float = 0.0
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over lowercase phrases, each mapped to a label.
+
+    Failure links are folded into a full transition table when the automaton is built, so
+    a search takes one dict lookup per character.
+    """
+
+    def __init__(self, phrases: Dict[str, str]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        self.output: List[List[Tuple[str, str]]] = [[]]
+        for phrase, label in phrases.items():
+            state = 0
+            for char in phrase.lower():
+                if char not in goto[state]:
+                    goto.append({})
+                    self.output.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            self.output[state].append((phrase, label))
+
+        # Breadth-first, so the transitions of every failure state are complete before
+        # they are inherited. Children of the root keep their failure link to the root.
+        fail = [0] * len(goto)
+        self.transitions: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self.transitions[state] = {**self.transitions[fail[state]], **goto[state]}
+            for char, child in goto[state].items():
+                queue.append(child)
+                fail[child] = self.transitions[fail[state]].get(char, 0)
+                self.output[child] = self.output[child] + self.output[fail[child]]
+
+    def search(self, text: str) -> List[Tuple[int, str, str]]:
+        """Return (start, phrase, label) for every phrase occurring in `text`, in order of where they end."""
+        matches = []
+        state = 0
+        transitions, output = self.transitions, self.output
+        for end, char in enumerate(text.lower()):
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                matches.extend((end + 1 - len(phrase), phrase, label) for phrase, label in output[state])
+        return matches
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over word tokens and bigrams, with Laplace smoothing.
+
+    The smoothed log-probabilities are computed once, when the classifier is trained: each
+    label's score starts from the log-probability of an unseen feature, and every feature
+    seen in training holds the per-label amount it adds on top of that.
+    """
+
+    def __init__(self, examples: Iterable[Tuple[str, str]], alpha: float = 0.1) -> None:
+        self.alpha = alpha
+        label_counts: Counter = Counter()
+        self.token_counts: Dict[str, Counter] = defaultdict(Counter)
+        for text, label in examples:
+            label_counts[label] += 1
+            self.token_counts[label].update(self._features(text))
+        total = sum(label_counts.values())
+        self.vocabulary_size = len({token for counts in self.token_counts.values() for token in counts}) or 1
+        self.log_priors = {label: math.log(count / total) for label, count in label_counts.items()}
+        self.totals = {label: sum(counts.values()) for label, counts in self.token_counts.items()}
+
+        denominators = {label: self.totals[label] + alpha * self.vocabulary_size for label in self.log_priors}
+        self.unseen_log_probs = {label: math.log(alpha / denominators[label]) for label in self.log_priors}
+        self.feature_log_odds: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for label, counts in self.token_counts.items():
+            for feature, count in counts.items():
+                self.feature_log_odds[feature][label] = math.log((count + alpha) / alpha)
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        return NaiveBayesClassifier.features_of(tokenize(text))
+
+    @staticmethod
+    def features_of(tokens: List[str]) -> List[str]:
+        return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def log_scores(self, text: str) -> Dict[str, float]:
+        """Return the joint log-likelihood of `text` and each label."""
+        return self.feature_log_scores(self._features(text))
+
+    def feature_log_scores(self, features: List[str]) -> Dict[str, float]:
+        """`log_scores` of already extracted features."""
+        log_scores = {label: log_prior + len(features) * self.unseen_log_probs[label] for label, log_prior in self.log_priors.items()}
+        for feature in features:
+            for label, log_odds in self.feature_log_odds.get(feature, {}).items():
+                log_scores[label] += log_odds
+        return log_scores
+
+    @staticmethod
+    def posterior(log_scores: Dict[str, float]) -> Tuple[str, float]:
+        """Return the most likely label of `log_scores` and its posterior probability."""
+        best = max(log_scores, key=log_scores.get)
+        normalizer = sum(math.exp(score - log_scores[best]) for score in log_scores.values())
+        return best, 1.0 / normalizer
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Return the most likely label and its posterior probability."""
+        return self.posterior(self.log_scores(text))
+
+    def coverage(self, text: str, label: str) -> float:
+        """Share of the words of `text` that occur in the training examples of `label`."""
+        return self.token_coverage(tokenize(text), label)
+
+    def token_coverage(self, tokens: List[str], label: str) -> float:
+        """`coverage` of an already tokenized text."""
+        if not tokens:
+            return 0.0
+        counts = self.token_counts[label]
+        return sum(1 for token in tokens if counts[token]) / len(tokens)
+
+
+@dataclass
+class FastPathPolicy:
+    enabled: bool = True
+    min_score: float = 0.65
+    min_margin: float = 0.15
+    methods: List[str] = field(default_factory=lambda: ["GET"])
+
+
+class IntentRouter:
+    def __init__(
+        self,
+        intents: Sequence[Dict[str, Any]],
+        api_examples: Sequence[str] = (),
+        agent_keywords: Sequence[str] = (),
+        api_spec: Optional[ReducedOpenAPISpec] = None,
+        min_confidence: float = 0.9,
+        min_coverage: float = 1.0,
+        min_log_odds: float = 3.0,
+        fast_path: Optional[FastPathPolicy] = None,
+        reference_keywords: Sequence[str] = (),
+    ) -> None:
+        self.answers = {intent["name"]: intent["answer"] for intent in intents}
+        self.keywords = {normalize_phrase(keyword): intent["name"] for intent in intents for keyword in intent.get("keywords", [])}
+        self.automaton = KeywordAutomaton({
+            **{keyword: REFERENCE_LABEL for keyword in reference_keywords},
+            **{keyword: AGENT_LABEL for keyword in agent_keywords},
+        })
+        examples = [(example, intent["name"]) for intent in intents for example in intent.get("examples", [])]
+        examples += [(example, API_LABEL) for example in api_examples]
+        self.classifier = NaiveBayesClassifier(examples)
+        self.api_spec = api_spec
+        self.entity_words: frozenset = frozenset()
+        if api_spec is not None:
+            # Built here rather than on the first prompt, which would otherwise pay for it.
+            api_spec.endpoint_index
+            self.entity_words = frozenset(token for name, _, _ in api_spec.endpoints for token in tokenize(PATH_PARAMETER_PATTERN.sub(" ", name.split(" ", 1)[-1])))
+        self.min_confidence = min_confidence
+        self.min_coverage = min_coverage
+        self.min_log_odds = min_log_odds
+        self.fast_path = fast_path or FastPathPolicy()
+
+    def route(self, prompt: str) -> Route:
+        label = self.keywords.get(normalize_phrase(prompt))
+        if label is not None:
+            return Route("answer", intent=label, answer=self.answers[label], confidence=1.0)
+        tokens = tokenize(prompt)
+        needs_agent = self._needs_agent(prompt)
+
+        log_scores = self.classifier.feature_log_scores(self.classifier.features_of(tokens))
+        label, confidence = self.classifier.posterior(log_scores)
+        if label != API_LABEL and self._answers(tokens, label, confidence, log_scores):
+            return Route("answer", intent=label, answer=self.answers[label], confidence=confidence)
+        if needs_agent:
+            return Route("agent", intent=AGENT_LABEL, confidence=confidence)
+        if label == API_LABEL:
+            endpoint = self._single_endpoint(prompt, tokens)
+            if endpoint is not None:
+                return Route("endpoint", intent=API_LABEL, endpoint=endpoint, confidence=confidence)
+        return Route("agent", intent=label, confidence=confidence)
+
+    def _needs_agent(self, prompt: str) -> bool:
+        """Whether the prompt has several steps, or refers to something it does not name.
+
+        A reference keyword ("its", "them") is resolved inside the prompt when an API
+        entity (a word of an endpoint path, like "device") comes before it: "the device
+        where its id is 20" stands on its own, "sort them by ip" does not.
+        """
+        # Padded, so keywords like " its " also match at either end of the prompt.
+        padded = f" {prompt.lower()} "
+        for start, _, label in self.automaton.search(padded):
+            if label == AGENT_LABEL:
+                return True
+            if self.entity_words.isdisjoint(tokenize(padded[:start])):
+                return True
+        return False
+
+    def _answers(self, tokens: List[str], label: str, confidence: float, log_scores: Dict[str, float]) -> bool:
+        """Whether the canned intent `label` may answer the prompt instead of the agent."""
+        if confidence < self.min_confidence or self.classifier.token_coverage(tokens, label) < self.min_coverage:
+            return False
+        return API_LABEL not in log_scores or log_scores[label] - log_scores[API_LABEL] >= self.min_log_odds
+
+    def _single_endpoint(self, prompt: str, tokens: List[str]) -> Optional[str]:
+        """Return the endpoint the prompt clearly refers to, if the fast path applies."""
+        if not self.fast_path.enabled or self.api_spec is None or len(self.api_spec.endpoints) < 2:
+            return None
+        scores = self.api_spec.endpoint_index.token_scores(tokens)
+        second, first = scores.argsort()[-2:]
+        name = self.api_spec.endpoints[first][0]
+        if scores[first] < self.fast_path.min_score or scores[first] - scores[second] < self.fast_path.min_margin:
+            return None
+        method, path = name.split(" ", 1)
+        if method not in self.fast_path.methods:
+            return None
+        # The Caller fills path parameters from the prompt alone, so it must carry enough values.
+        if len(PATH_PARAMETER_PATTERN.findall(path)) > len(VALUE_PATTERN.findall(prompt)):
+            return None
+        return name
+
+
+def build_intent_router(options: Optional[Dict[str, Any]], api_spec: Optional[ReducedOpenAPISpec] = None) -> Optional[IntentRouter]:
+    """Create an IntentRouter from the `router` config section, or None when disabled."""
+    options = dict(options or {})
+    if not options.pop("enabled", True):
+        return None
+    with open(options.pop("intents_path", "datasets/intents.yaml")) as f:
+        intents_file = yaml.safe_load(f)
+    api_examples = list(intents_file.get("api_examples", []))
+    for path in options.pop("api_examples_paths", []):
+        with open(path) as f:
+            api_examples.extend(item["query"] for item in json.load(f))
+    fast_path = FastPathPolicy(**options.pop("fast_path", {}))
+    return IntentRouter(
+        intents_file["intents"],
+        api_examples=api_examples,
+        agent_keywords=intents_file.get("agent_keywords", []),
+        reference_keywords=intents_file.get("reference_keywords", []),
+        api_spec=api_spec,
+        fast_path=fast_path,
+        **options,
+    )
@@ -0,0 +1,161 @@
+"""Statistical digest of a JSON response for the code-writing prompts.
+
+Showing the LLM the first elements of every list hides what it needs to write a correct
+filter: which keys are optional, how long arrays get, which values a field takes. The
+digest describes every path of the document instead, one line per path, rooted at
+`data` like the variable the generated code reads:
+
+    data.devices.device[].virtual_type: str; 3 distinct: "management", "context", "vsys"
+    data.devices.device[].domain_id: int 75%; 1..2
+    data.devices.device[].licenses.license: array; len 0..3
+
+Numbers are summarized by their range, strings and booleans by their distinct values.
+
+Arrays of objects are digested column by column: the values of one key across all
+elements are gathered in one pass and their ranges and lengths are computed with numpy.
+The input is never modified.
+"""
+
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .tokenizer import truncate_to_tokens
+
+ROOT = "data"
+# Longer sample strings are cut to this many characters.
+MAX_SAMPLE_CHARS = 40
+
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    return type(value).__name__
+
+
+@dataclass
+class PathStats:
+    """What one path of the document holds, over all the places it occurs."""
+
+    occurrences: int = 0
+    # Objects (or array elements) that could hold the path; presence is occurrences / parents.
+    parents: int = 0
+    types: Counter = field(default_factory=Counter)
+    distinct: int = 0
+    samples: List[Any] = field(default_factory=list)
+    value_range: Optional[Tuple[Any, Any]] = None
+    length_range: Optional[Tuple[int, int]] = None
+
+    @property
+    def presence(self) -> float:
+        return self.occurrences / self.parents if self.parents else 1.0
+
+    def describe(self, max_samples: int) -> str:
+        parts = ["|".join(name for name, _ in self.types.most_common())]
+        if self.presence < 1.0:
+            parts[0] += f" {self.presence:.0%}"
+        if self.length_range is not None:
+            low, high = self.length_range
+            parts.append(f"len {low}" if low == high else f"len {low}..{high}")
+        if self.value_range is not None:
+            low, high = (_number(bound) for bound in self.value_range)
+            parts.append(f"{low}" if low == high else f"{low}..{high}")
+        if self.samples:
+            samples = ", ".join(json.dumps(_cut(sample), ensure_ascii=False) for sample in self.samples[:max_samples])
+            more = ", ..." if self.distinct > max_samples else ""
+            parts.append(f"{self.distinct} distinct: {samples}{more}")
+        return "; ".join(parts)
+
+
+def _number(value: Any) -> Any:
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 4)
+    return value
+
+
+def _cut(sample: Any) -> Any:
+    if isinstance(sample, str) and len(sample) > MAX_SAMPLE_CHARS:
+        return sample[:MAX_SAMPLE_CHARS] + "..."
+    return sample
+
+
+@dataclass
+class JSONDigest:
+    paths: Dict[str, PathStats]
+    max_samples: int = 3
+
+    def render(self, max_tokens: Optional[int] = None) -> str:
+        text = "\n".join(f"{path}: {stats.describe(self.max_samples)}" for path, stats in self.paths.items())
+        return truncate_to_tokens(text, max_tokens) if max_tokens is not None else text
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+def digest_json(data: Any, max_samples: int = 3) -> JSONDigest:
+    """Digest `data` in one pass; every value is visited once."""
+    paths: Dict[str, PathStats] = {}
+    # A column is every value found at one path, with the number of objects or array
+    # elements that could have held it. Children are pushed in reverse, so paths are
+    # popped in document order.
+    columns: List[Tuple[str, List[Any], int]] = [(ROOT, [data], 1)]
+    while columns:
+        path, values, parents = columns.pop()
+        stats = paths[path] = PathStats(occurrences=len(values), parents=parents)
+
+        objects: List[Dict[str, Any]] = []
+        arrays: List[List[Any]] = []
+        numbers: List[Any] = []
+        scalars: List[Any] = []
+        for value in values:
+            stats.types[_type_name(value)] += 1
+            if isinstance(value, dict):
+                objects.append(value)
+            elif isinstance(value, list):
+                arrays.append(value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                numbers.append(value)
+            elif value is not None:
+                scalars.append(value)
+
+        if numbers:
+            column = np.asarray(numbers)
+            if column.dtype == object:
+                # Integers beyond int64 stay Python ints.
+                stats.value_range = (min(numbers), max(numbers))
+            else:
+                stats.value_range = (column.min().item(), column.max().item())
+        if scalars:
+            distinct = dict.fromkeys(scalars)
+            stats.distinct = len(distinct)
+            stats.samples = list(islice(distinct, max_samples))
+        if arrays:
+            lengths = np.fromiter((len(array) for array in arrays), dtype=np.int64, count=len(arrays))
+            stats.length_range = (int(lengths.min()), int(lengths.max()))
+            elements = [element for array in arrays for element in array]
+            if elements:
+                columns.append((f"{path}[]", elements, len(elements)))
+        if objects:
+            children: Dict[str, List[Any]] = {}
+            for obj in objects:
+                for key, value in obj.items():
+                    children.setdefault(key, []).append(value)
+            for key, child_values in reversed(children.items()):
+                columns.append((f"{path}.{key}", child_values, len(objects)))
+    return JSONDigest(paths, max_samples)
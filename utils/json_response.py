@@ -0,0 +1,68 @@
+"""API response bodies parsed once and handed from the Caller to the parsers."""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+import requests
+
+from .tokenizer import BYTES_PER_TOKEN_BOUND, truncate_to_tokens
+
+
+@dataclass
+class ParsedResponse:
+    """A response body with its JSON decoded exactly once.
+
+    `body` keeps the undecoded bytes so prompt excerpts can be cut from it without ever
+    building a str of the whole payload; `data` is None when the body is not JSON.
+    """
+
+    body: bytes
+    data: Any = None
+    is_json: bool = False
+    status_code: Optional[int] = None
+    content_type: str = ""
+
+    @property
+    def num_bytes(self) -> int:
+        return len(self.body)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def excerpt(self, max_tokens: int) -> str:
+        """Return the body cut to at most `max_tokens` tokens, with "..." if it was cut.
+
+        Only a byte prefix that can hold the budget is decoded and tokenized, so
+        multi-megabyte bodies are never encoded in full.
+        """
+        prefix_bytes = max_tokens * BYTES_PER_TOKEN_BOUND
+        text = self.body[:prefix_bytes].decode("utf-8", errors="ignore")
+        excerpt = truncate_to_tokens(text, max_tokens)
+        if excerpt is text and self.num_bytes > prefix_bytes:
+            return text + '...'
+        return excerpt
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def parse_response(response: Union[requests.Response, str, bytes, "ParsedResponse"]) -> ParsedResponse:
+    if isinstance(response, ParsedResponse):
+        return response
+    status_code, content_type = None, ""
+    if isinstance(response, requests.Response):
+        status_code = response.status_code
+        content_type = response.headers.get("Content-Type", "")
+        body = response.content
+    elif isinstance(response, str):
+        body = response.encode("utf-8")
+    else:
+        body = bytes(response)
+
+    try:
+        # json.loads accepts bytes directly, which avoids materializing response.text.
+        return ParsedResponse(body=body, data=json.loads(body), is_json=True, status_code=status_code, content_type=content_type)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return ParsedResponse(body=body, status_code=status_code, content_type=content_type)
@@ -0,0 +1,173 @@
+"""Completion cache shared by every LLMChain the agent builds.
+
+The cache is installed as `langchain.llm_cache`, so every LLM call (Planner, APISelector,
+Caller and ResponseParser chains alike) consults it. langchain keys lookups by the prompt
+and an "llm string" made of the model parameters, which includes the model name,
+temperature, max_tokens and stop sequences.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import langchain
+from langchain.cache import BaseCache, RETURN_VAL_TYPE
+from langchain.schema import Generation
+
+logger = logging.getLogger(__name__)
+
+TEMPERATURE_PATTERN = re.compile(r"\('temperature', ([0-9.eE+-]+)\)")
+
+
+def _is_deterministic(llm_string: str) -> bool:
+    match = TEMPERATURE_PATTERN.search(llm_string)
+    return match is None or float(match.group(1)) == 0.0
+
+
+class _SQLiteTier:
+    """Persistent tier; entries survive restarts and are shared by workers on one host."""
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, generations TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str, ttl: Optional[float]) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT generations, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if ttl is not None and now - row[1] > ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, generations: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)", (key, generations, now, now))
+            self._inserts += 1
+            # Trimming scans the accessed_at index, so only do it every 100 inserts.
+            if self._inserts % 100 == 0:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    "SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+
+class TieredLLMCache(BaseCache):
+    """In-memory LRU in front of an optional SQLite store, with TTL and hit/miss counters.
+
+    Only calls made at temperature 0 are cached when `deterministic_only` is set, since
+    replaying a sampled completion would change the agent's behaviour.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        sqlite_path: Optional[str] = None,
+        sqlite_max_entries: int = 50000,
+        deterministic_only: bool = True,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self._memory: "OrderedDict[str, Tuple[float, list]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sqlite = _SQLiteTier(sqlite_path, sqlite_max_entries) if sqlite_path else None
+        self.counters: Dict[str, int] = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "skipped": 0}
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def _remember(self, key: str, generations: list) -> None:
+        with self._lock:
+            self._memory[key] = (time.time(), generations)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.deterministic_only and not _is_deterministic(llm_string):
+            self.counters["skipped"] += 1
+            return None
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[1]
+
+        if self._sqlite is not None:
+            stored = self._sqlite.get(key, self.ttl)
+            if stored is not None:
+                generations = [Generation(**generation) for generation in json.loads(stored)]
+                self._remember(key, generations)
+                self.counters["sqlite_hits"] += 1
+                return generations
+
+        self.counters["misses"] += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.deterministic_only and not _is_deterministic(llm_string):
+            return
+        key = self._key(prompt, llm_string)
+        generations = list(return_val)
+        self._remember(key, generations)
+        if self._sqlite is not None:
+            self._sqlite.put(key, json.dumps([{"text": g.text, "generation_info": g.generation_info} for g in generations]))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self._sqlite is not None:
+            self._sqlite.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["sqlite_hits"]
+        lookups = hits + self.counters["misses"]
+        return {**self.counters, "entries": len(self._memory), "hit_ratio": hits / lookups if lookups else 0.0}
+
+
+def configure_llm_cache(options: Optional[Dict[str, Any]]) -> Optional[TieredLLMCache]:
+    """Install a TieredLLMCache as langchain's global cache from the `llm_cache` config section."""
+    options = dict(options or {})
+    if not options.pop("enabled", True):
+        langchain.llm_cache = None
+        return None
+    cache = TieredLLMCache(**options)
+    langchain.llm_cache = cache
+    logger.debug(f"LLM completion cache enabled with options {options}")
+    return cache
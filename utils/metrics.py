@@ -0,0 +1,167 @@
+"""Prometheus metrics for the agent pipeline, served by the controller's /metrics route.
+
+Stage histograms are inclusive: the Caller's time contains the ResponseParser calls it
+makes. The stage that is running is kept in a context variable, so LLM calls made
+underneath it are labelled with that chain. HTTP latency is labelled with the OAS
+endpoint template (never the raw URL), so label cardinality stays bounded by the spec.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+from .tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+ITERATION_BUCKETS = (0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30)
+
+STAGE_SECONDS = Histogram("chaty_stage_seconds", "Time spent in each pipeline stage.", ["stage"], buckets=LATENCY_BUCKETS)
+LLM_SECONDS = Histogram("chaty_llm_seconds", "Latency of LLM calls per chain.", ["chain"], buckets=LATENCY_BUCKETS)
+# chaty_llm_tokens_sum is the running token total per chain.
+LLM_TOKENS = Histogram("chaty_llm_tokens", "Tokens per LLM call per chain.", ["chain", "kind"], buckets=TOKEN_BUCKETS)
+HTTP_SECONDS = Histogram("chaty_http_request_seconds", "Latency of API calls per endpoint template.", ["method", "endpoint", "status"], buckets=LATENCY_BUCKETS)
+PROJECTION_SAVED_BYTES = Counter("chaty_projection_saved_bytes", "Response bytes removed by projection before prompting, per endpoint.", ["endpoint"])
+PROJECTION_SAVED_TOKENS = Counter("chaty_projection_saved_tokens", "Prompt tokens saved by response projection, per endpoint.", ["endpoint"])
+ITERATIONS = Histogram("chaty_iterations", "Per-query count of planner, API selector and caller rounds.", ["counter"], buckets=ITERATION_BUCKETS)
+
+current_stage: contextvars.ContextVar[str] = contextvars.ContextVar("current_stage", default="other")
+
+_endpoint_resolver: Optional[Callable[[str, str], Optional[str]]] = None
+_cache_stats: Dict[str, Callable[[], Optional[Dict[str, Any]]]] = {}
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    token = current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+        current_stage.reset(token)
+
+
+def timed_stage(stage: str) -> Callable:
+    """Decorate a chain's `_call` or `_acall` so its duration lands in chaty_stage_seconds."""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with observe_stage(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with observe_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_endpoint_resolver(resolver: Optional[Callable[[str, str], Optional[str]]]) -> None:
+    """Install `resolver(method, url) -> endpoint template` used to label HTTP latencies."""
+    global _endpoint_resolver
+    _endpoint_resolver = resolver
+
+
+def observe_http(method: str, url: str, status: Any, seconds: float) -> None:
+    endpoint = _endpoint_resolver(method, url) if _endpoint_resolver is not None else None
+    HTTP_SECONDS.labels(method.upper(), endpoint or "other", str(status)).observe(seconds)
+
+
+def observe_projection(endpoint: str, saved_bytes: int, saved_tokens: int) -> None:
+    PROJECTION_SAVED_BYTES.labels(endpoint).inc(max(saved_bytes, 0))
+    PROJECTION_SAVED_TOKENS.labels(endpoint).inc(max(saved_tokens, 0))
+
+
+def observe_iterations(counters: Dict[str, int]) -> None:
+    for name in ("planner_calls", "api_selector_calls", "caller_calls"):
+        ITERATIONS.labels(name).observe(counters.get(name, 0))
+
+
+def register_cache(name: str, stats: Callable[[], Optional[Dict[str, Any]]]) -> None:
+    """Report a cache's hit ratio and size; `stats()` returns its stats dict or None."""
+    _cache_stats[name] = stats
+
+
+class CacheCollector:
+    """Reads every registered cache's counters at scrape time."""
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        hit_ratio = GaugeMetricFamily("chaty_cache_hit_ratio", "Hit ratio of each cache since start.", labels=["cache"])
+        entries = GaugeMetricFamily("chaty_cache_entries", "Entries held by each cache.", labels=["cache"])
+        for name, stats in list(_cache_stats.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Could not read stats of cache {name}: {e}")
+                continue
+            if not values:
+                continue
+            if "hit_ratio" in values:
+                ratio = values["hit_ratio"]
+            else:
+                lookups = values.get("hits", 0) + values.get("misses", 0)
+                ratio = values.get("hits", 0) / lookups if lookups else 0.0
+            hit_ratio.add_metric([name], ratio)
+            if "entries" in values:
+                entries.add_metric([name], values["entries"])
+        yield hit_ratio
+        yield entries
+
+
+REGISTRY.register(CacheCollector())
+
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """Times LLM calls and counts their tokens, labelled with the stage that made them.
+
+    Token counts come from the provider's `token_usage` when it reports one and are
+    counted locally otherwise. Completions served from the LLM cache never reach the
+    callbacks, so they are not counted.
+    """
+
+    # Run in the caller's context so `current_stage` is visible from async chains too.
+    run_inline = True
+
+    def __init__(self) -> None:
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = (time.perf_counter(), current_stage.get(), prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        start, chain, prompts = self._runs.pop(run_id, (None, current_stage.get(), []))
+        if start is not None:
+            LLM_SECONDS.labels(chain).observe(time.perf_counter() - start)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(count_tokens(generation.text) for generations in response.generations for generation in generations)
+        for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            LLM_TOKENS.labels(chain, kind).observe(tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+
+def render_metrics() -> tuple:
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
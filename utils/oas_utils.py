@@ -1,64 +1,95 @@
 """Quick and dirty representation for OpenAPI specs."""
 
+import re
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple, Union
+from functools import cached_property
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
+from .endpoint_index import EndpointIndex
 
-def dereference_refs(spec_obj: dict, full_spec: dict) -> Union[dict, list]:
-    """Try to substitute $refs.
 
-    The goal is to get the complete docs for each endpoint in context for now.
+class RefResolver:
+    """Resolves the local $refs of one spec, each referenced component once.
 
-    In the few OpenAPI specs I studied, $refs referenced models
-    (or in OpenAPI terms, components) and could be nested. This code most
-    likely misses lots of cases.
+    Components are resolved on first use and memoized, so every doc that refers to
+    `#/components/schemas/Device` holds the same object and the reduced spec carries a
+    single copy of it, however many endpoints use it. Subtrees without $refs are shared
+    with the source spec rather than copied. A $ref reached again while its own target is
+    being resolved (a recursive schema) is left in place as {"$ref": ...}, so resolved
+    docs stay finite and printable. Resolved objects are shared: treat them as read-only.
     """
 
-    def _retrieve_ref_path(path: str, full_spec: dict) -> dict:
+    def __init__(self, full_spec: dict) -> None:
+        self.full_spec = full_spec
+        self._resolved: Dict[str, Any] = {}
+        self._resolving: Set[str] = set()
+
+    def lookup(self, path: str) -> Any:
         components = path.split("/")
         if components[0] != "#":
             raise RuntimeError(
                 "All $refs I've seen so far are uri fragments (start with hash)."
             )
-        out = full_spec
+        out = self.full_spec
         for component in components[1:]:
-            out = out[component]
+            out = out[component.replace("~1", "/").replace("~0", "~")]
         return out
 
-    def _dereference_refs(
-        obj: Union[dict, list], stop: bool = False
-    ) -> Union[dict, list]:
-        if stop:
-            return obj
-        obj_out: Dict[str, Any] = {}
+    def resolve(self, obj: Any) -> Any:
         if isinstance(obj, dict):
-            for k, v in obj.items():
-                if k == "$ref":
-                    # stop=True => don't dereference recursively.
-                    return _dereference_refs(
-                        _retrieve_ref_path(v, full_spec), stop=False
-                    )
-                elif isinstance(v, list):
-                    obj_out[k] = [_dereference_refs(el) for el in v]
-                elif isinstance(v, dict):
-                    obj_out[k] = _dereference_refs(v)
-                else:
-                    obj_out[k] = v
-            return obj_out
-        elif isinstance(obj, list):
-            return [_dereference_refs(el) for el in obj]
-        else:
+            ref = obj.get("$ref")
+            if isinstance(ref, str):
+                return self._resolve_ref(ref, obj)
+            resolved = {key: self.resolve(value) for key, value in obj.items()}
+            return obj if all(resolved[key] is value for key, value in obj.items()) else resolved
+        if isinstance(obj, list):
+            resolved = [self.resolve(el) for el in obj]
+            return obj if all(new is old for new, old in zip(resolved, obj)) else resolved
+        return obj
+
+    def _resolve_ref(self, ref: str, obj: dict) -> Any:
+        if ref in self._resolved:
+            return self._resolved[ref]
+        if ref in self._resolving:
             return obj
+        self._resolving.add(ref)
+        try:
+            resolved = self.resolve(self.lookup(ref))
+        finally:
+            self._resolving.discard(ref)
+        self._resolved[ref] = resolved
+        return resolved
 
-    return _dereference_refs(spec_obj)
 
+def dereference_refs(spec_obj: dict, full_spec: dict) -> Union[dict, list]:
+    """Try to substitute $refs.
 
-def merge_allof_properties(obj):
-    def merge(to_merge):
+    The goal is to get the complete docs for each endpoint in context for now.
+    See RefResolver, which resolves each component once and shares it between calls
+    made with the same resolver.
+    """
+    return RefResolver(full_spec).resolve(spec_obj)
+
+
+class AllOfMerger:
+    """Merges "allOf" compositions into one object schema, each distinct schema once.
+
+    Results are memoized by the identity of the schema object, so a component that
+    RefResolver shared between endpoints is merged once and the merged schema is shared
+    as well. Subtrees without allOf are returned as they are instead of being copied.
+    Merged schemas are shared: treat them as read-only.
+    """
+
+    def __init__(self) -> None:
+        # id(schema) -> (schema, merged); the schema is kept so its id is not reused.
+        self._merged: Dict[int, Tuple[Any, Any]] = {}
+
+    @staticmethod
+    def combine(to_merge: List[dict]) -> dict:
         merged = {'properties': {}, 'required': [], 'type': 'object'}
         for partial_schema in to_merge:
             if 'allOf' in partial_schema:
-                tmp = merge(partial_schema['allOf'])
+                tmp = AllOfMerger.combine(partial_schema['allOf'])
                 merged['properties'].update(tmp['properties'])
                 if 'required' in tmp:
                     merged['required'].extend(tmp['required'])
@@ -69,25 +100,119 @@ def merge_allof_properties(obj):
                 merged['required'].extend(partial_schema['required'])
         return merged
 
-    def _merge_allof(obj):
-        obj_out = {}
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                if k == 'allOf':
-                    return _merge_allof(merge(v))
-                elif isinstance(v, list):
-                    obj_out[k] = [_merge_allof(el) for el in v]
-                elif isinstance(v, dict):
-                    obj_out[k] = _merge_allof(v)
-                else:
-                    obj_out[k] = v
-            return obj_out
-        elif isinstance(obj, list):
-            return [_merge_allof(el) for el in obj]
-        else:
+    def merge(self, obj: Any) -> Any:
+        if not isinstance(obj, (dict, list)):
             return obj
+        cached = self._merged.get(id(obj))
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+        if isinstance(obj, dict) and 'allOf' in obj:
+            # The composition replaces the whole schema, siblings of allOf included.
+            merged = self.merge(self.combine(obj['allOf']))
+        elif isinstance(obj, dict):
+            merged = {k: self.merge(v) for k, v in obj.items()}
+            if all(merged[k] is v for k, v in obj.items()):
+                merged = obj
+        else:
+            merged = [self.merge(el) for el in obj]
+            if all(new is old for new, old in zip(merged, obj)):
+                merged = obj
+        self._merged[id(obj)] = (obj, merged)
+        return merged
+
+
+def merge_allof_properties(obj):
+    return AllOfMerger().merge(obj)
+
+
+PLAN_ENDPOINT_PATTERN = re.compile(r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)*")
+PATH_ARG_PATTERN = re.compile(r"[{](.*?)[}]")
+
+
+class _EndpointTrieNode:
+    __slots__ = ("literals", "patterns", "endpoint")
 
-    return _merge_allof(obj)
+    def __init__(self):
+        self.literals: Dict[str, "_EndpointTrieNode"] = {}
+        self.patterns: List[Tuple[re.Pattern, "_EndpointTrieNode"]] = []
+        self.endpoint: Optional[Tuple[int, str]] = None
+
+
+class EndpointMatcher:
+    """Precompiled lookup from concrete calls (e.g. "GET /devices/12.json") to spec endpoints.
+
+    Endpoints are stored in a trie keyed by method and then path segment. Literal
+    segments are dict lookups; templated segments (e.g. "{id}.json") are compiled to a
+    regex once. Matching walks at most one branch per candidate segment instead of
+    trying every route, and ties are broken by spec order like the linear scan did.
+    """
+
+    def __init__(self, endpoint_names: Iterable[str]):
+        self.exact: Dict[str, str] = {}
+        self.roots: Dict[str, _EndpointTrieNode] = {}
+        for index, name in enumerate(endpoint_names):
+            self.exact.setdefault(name, name)
+            method, _, route = name.partition(" ")
+            node = self.roots.setdefault(method, _EndpointTrieNode())
+            for segment in route.split("/"):
+                if "{" not in segment:
+                    node = node.literals.setdefault(segment, _EndpointTrieNode())
+                    continue
+                segment_pattern = self._compile_segment(segment)
+                for pattern, child in node.patterns:
+                    if pattern.pattern == segment_pattern.pattern:
+                        node = child
+                        break
+                else:
+                    child = _EndpointTrieNode()
+                    node.patterns.append((segment_pattern, child))
+                    node = child
+            if node.endpoint is None:
+                node.endpoint = (index, name)
+
+    @staticmethod
+    def _compile_segment(segment: str) -> re.Pattern:
+        parts = PATH_ARG_PATTERN.split(segment)
+        # split() alternates literal text and argument names.
+        regex = "".join(re.escape(part) if i % 2 == 0 else r"[^/]+" for i, part in enumerate(parts))
+        return re.compile(regex + "$")
+
+    def match(self, endpoint: str) -> Optional[str]:
+        """Return the spec endpoint name for a concrete "METHOD /path", or None."""
+        if endpoint in self.exact:
+            return endpoint
+        method, _, route = endpoint.partition(" ")
+        root = self.roots.get(method)
+        if root is None:
+            return None
+        segments = route.split("/")
+        best: Optional[Tuple[int, str]] = None
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(segments):
+                if node.endpoint is not None and (best is None or node.endpoint[0] < best[0]):
+                    best = node.endpoint
+                continue
+            segment = segments[depth]
+            child = node.literals.get(segment)
+            if child is not None:
+                stack.append((child, depth + 1))
+            for pattern, child in node.patterns:
+                if pattern.match(segment):
+                    stack.append((child, depth + 1))
+        return best[1] if best is not None else None
+
+    def match_plan(self, plan: str) -> Optional[List[str]]:
+        """Return the spec endpoints referenced by a free-text plan, or None if there are none."""
+        matched_endpoints = []
+        for method, route in PLAN_ENDPOINT_PATTERN.findall(plan):
+            name = self.match(f"{method} {route.split('?')[0]}")
+            if name is not None:
+                matched_endpoints.append(name)
+        if len(matched_endpoints) == 0:
+            return None
+        return matched_endpoints
 
 
 @dataclass
@@ -96,6 +221,28 @@ class ReducedOpenAPISpec:
     description: str
     endpoints: List[Tuple[str, Union[str, None], dict]]
 
+    @cached_property
+    def endpoint_matcher(self) -> EndpointMatcher:
+        return EndpointMatcher(name for name, _, _ in self.endpoints)
+
+    @cached_property
+    def endpoint_docs(self) -> Dict[str, dict]:
+        return {name: docs for name, _, docs in self.endpoints}
+
+    @cached_property
+    def selector_endpoints(self) -> List[str]:
+        """One "METHOD /route first-sentence-of-description" line per endpoint, as listed to the API selector."""
+        return [f"{name} {description.split('.')[0] if description is not None else ''}" for name, description, _ in self.endpoints]
+
+    @cached_property
+    def endpoint_index(self) -> EndpointIndex:
+        """Retrieval index over endpoint names, descriptions and parameter names."""
+        documents = []
+        for name, description, docs in self.endpoints:
+            parameter_names = " ".join(parameter.get("name", "") for parameter in docs.get("parameters", []) if isinstance(parameter, dict))
+            documents.append(f"{name} {description or ''} {parameter_names}")
+        return EndpointIndex(documents)
+
 
 def reduce_openapi_spec(spec: dict, dereference: bool = True, only_required: bool = True, merge_allof: bool = False) -> ReducedOpenAPISpec:
     """Simplify/distill/minify a spec somehow.
@@ -113,63 +260,51 @@ def reduce_openapi_spec(spec: dict, dereference: bool = True, only_required: boo
         if operation_name in ["get", "post", "patch", "delete", "put"]
     ]
 
-    # endpoints = []
-    # for route, operation in spec["paths"].items():
-    #     for operation_name, docs in operation.items():
-    #         if operation_name in ["get", "post", "patch", "delete"]:
-    #             if "parameters" in operation:
-    #                 if "parameters" in operation:
-    #                     docs += operation["parameters"]
-    #                 else:
-    #                     docs = operation["parameters"]
-    #             endpoints.append(
-    #                 (f"{operation_name.upper()} {route}", docs.get("description"), docs)
-    #             )
-
-    # 2. Replace any refs so that complete docs are retrieved.
-    # Note: probably want to do this post-retrieval, it blows up the size of the spec.
-    if dereference:
-        endpoints = [
-            (name, description, dereference_refs(docs, spec))
-            for name, description, docs in endpoints
-        ]
+    # 2. Strip docs down to required request args + happy path response, and only then
+    # replace the refs in what is kept. Each referenced component is resolved once and
+    # shared by every endpoint that uses it; components referenced only from dropped
+    # parts of the docs (error responses, other operations' bodies) are never resolved.
+    resolver = RefResolver(spec) if dereference else None
 
-    # 3. Merge "allof" properties. Maybe very slow.
-    if merge_allof:
-        endpoints = [
-            (name, description, merge_allof_properties(docs))
-            for name, description, docs in endpoints
-        ]
+    def resolve(obj: Any) -> Any:
+        return resolver.resolve(obj) if resolver is not None else obj
 
-    # 3. Strip docs down to required request args + happy path response.
     def reduce_endpoint_docs(docs: dict) -> dict:
         out = {}
         if docs.get("description"):
             out["description"] = docs.get("description")
         if docs.get("parameters"):
+            # A parameter may itself be a $ref, so resolve before looking at "required".
+            parameters = [resolve(parameter) for parameter in docs.get("parameters", [])]
             if only_required:
                 out["parameters"] = [
                     parameter
-                    for parameter in docs.get("parameters", [])
+                    for parameter in parameters
                     if parameter.get("required")
                 ]
             else:
-                out["parameters"] = [
-                    parameter
-                    for parameter in docs.get("parameters", [])
-                ]
+                out["parameters"] = parameters
         if docs.get("requestBody"):
-            out["requestBody"] = docs.get("requestBody")
+            out["requestBody"] = resolve(docs.get("requestBody"))
         if "200" in docs["responses"]:
-            out["responses"] = docs["responses"]["200"]
+            out["responses"] = resolve(docs["responses"]["200"])
         elif 200 in docs["responses"]:
-            out["responses"] = docs["responses"][200]
+            out["responses"] = resolve(docs["responses"][200])
         return out
 
     endpoints = [
         (name, description, reduce_endpoint_docs(docs))
         for name, description, docs in endpoints
     ]
+
+    # 3. Merge "allof" properties, each shared composition once.
+    if merge_allof:
+        merger = AllOfMerger()
+        endpoints = [
+            (name, description, merger.merge(docs))
+            for name, description, docs in endpoints
+        ]
+
     return ReducedOpenAPISpec(
         servers=spec["servers"],
         description=spec["info"].get("description", ""),
@@ -0,0 +1,193 @@
+"""Paged fetching of collections whose endpoints declare start/count parameters.
+
+SecureTrack pages collections with a `start` offset and a `count` page size. A page's
+items are the first list found in the response body (e.g. `devices.device`), and an
+integer `total` next to it, when present, bounds the number of pages to fetch. Fetching
+stops at the first short, empty or failed page.
+
+Pages are yielded in order, while the next `prefetch` pages are already being
+downloaded. The Caller collects every page before parsing: `merge_pages` joins their items
+back into one response, so the collection is parsed once, as if it had been returned by a
+single request, rather than costing one parse (and possibly one LLM call) per page. The
+read-ahead therefore shortens the download, not the time to the first parsed item. When
+`max_pages` cuts a collection short, `is_truncated` tells the Caller so it can say so.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple, Union
+
+import requests
+
+from .json_response import ParsedResponse, parse_response
+
+logger = logging.getLogger(__name__)
+
+START_PARAMETER_NAMES = ("start", "offset")
+COUNT_PARAMETER_NAMES = ("count", "limit")
+
+
+@dataclass
+class PaginationPolicy:
+    """How many items to request per page, how many pages to read ahead and fetch at most."""
+
+    page_size: int = 100
+    prefetch: int = 2
+    max_pages: int = 50
+
+
+@dataclass
+class PagingParameters:
+    start: str
+    count: str
+
+
+def find_paging_parameters(docs: Optional[dict]) -> Optional[PagingParameters]:
+    """Return the start/count query parameter names an endpoint declares, if it has both."""
+    names = {parameter.get("name") for parameter in (docs or {}).get("parameters", []) if parameter.get("in") == "query"}
+    start = next((name for name in START_PARAMETER_NAMES if name in names), None)
+    count = next((name for name in COUNT_PARAMETER_NAMES if name in names), None)
+    if start is None or count is None:
+        return None
+    return PagingParameters(start=start, count=count)
+
+
+def _find_items_path(data: Any) -> Optional[List[str]]:
+    """Return the keys leading to the item list of a page, breadth first."""
+    queue = deque([(data, [])])
+    while queue:
+        node, path = queue.popleft()
+        if isinstance(node, list):
+            return path
+        if not isinstance(node, dict):
+            continue
+        for key, value in node.items():
+            if isinstance(value, list):
+                return path + [key]
+        queue.extend((value, path + [key]) for key, value in node.items() if isinstance(value, dict))
+    return None
+
+
+def _get_path(data: Any, path: List[str]) -> Any:
+    for key in path:
+        data = data[key]
+    return data
+
+
+def find_page_items(data: Any) -> Tuple[Optional[list], Optional[int]]:
+    """Locate the item list of a page and the collection total next to it, breadth first."""
+    path = _find_items_path(data)
+    if path is None:
+        return None, None
+    if not path:
+        return data, None
+    parent = _get_path(data, path[:-1])
+    total = parent.get("total")
+    return parent[path[-1]], total if isinstance(total, int) else None
+
+
+def merge_pages(pages: List[ParsedResponse]) -> ParsedResponse:
+    """Join the items of all pages into the first page's structure, as one response.
+
+    An integer `count` next to the items is set to the number of merged items. Failed
+    pages, or pages without an item list, are left out. The pages are not modified.
+    """
+    first_page = pages[0]
+    path = _find_items_path(first_page.data) if first_page.is_json else None
+    if len(pages) == 1 or path is None:
+        return first_page
+
+    items = []
+    for number, page in enumerate(pages, 1):
+        page_items, _ = find_page_items(page.data) if page.is_json else (None, None)
+        if (page.status_code is not None and page.status_code != 200) or page_items is None:
+            logger.warning(f"Page {number} failed or has no items; it is left out of the merged response")
+            continue
+        items.extend(page_items)
+
+    data: Union[dict, list] = items
+    # Rebuild the containers on the way to the items, leaving the first page's data intact.
+    for depth in reversed(range(len(path))):
+        parent = dict(_get_path(first_page.data, path[:depth]))
+        parent[path[depth]] = data
+        if depth == len(path) - 1 and isinstance(parent.get("count"), int):
+            parent["count"] = len(items)
+        data = parent
+    body = json.dumps(data).encode("utf-8")
+    return ParsedResponse(body=body, data=data, is_json=True, status_code=first_page.status_code, content_type=first_page.content_type)
+
+
+def _is_last_page(page: ParsedResponse, page_size: int) -> bool:
+    if page.status_code is not None and page.status_code != 200:
+        return True
+    items, _ = find_page_items(page.data)
+    return items is None or len(items) < page_size
+
+
+def is_truncated(pages: List[ParsedResponse], policy: PaginationPolicy) -> bool:
+    """Whether fetching stopped at `max_pages` although the collection has more items."""
+    if len(pages) < policy.max_pages or _is_last_page(pages[-1], policy.page_size):
+        return False
+    _, total = find_page_items(pages[0].data)
+    return total is None or total > len(pages) * policy.page_size
+
+
+def _next_starts(first_page: ParsedResponse, policy: PaginationPolicy) -> Iterator[int]:
+    _, total = find_page_items(first_page.data)
+    starts = itertools.count(policy.page_size, policy.page_size)
+    if total is not None:
+        starts = iter(range(policy.page_size, total, policy.page_size))
+    return itertools.islice(starts, policy.max_pages - 1)
+
+
+def iter_pages(fetch: Callable[[int, int], requests.Response], policy: PaginationPolicy) -> Iterator[ParsedResponse]:
+    """Yield parsed pages in order; `fetch(start, count)` requests one page."""
+    first_page = parse_response(fetch(0, policy.page_size))
+    yield first_page
+    if _is_last_page(first_page, policy.page_size):
+        return
+
+    starts = _next_starts(first_page, policy)
+    with ThreadPoolExecutor(max_workers=max(policy.prefetch, 1)) as pool:
+        # Read-ahead fetches run in a copy of the caller's context, so their stage metrics and
+        # progress events reach the query that asked for them.
+        pending = deque(pool.submit(contextvars.copy_context().run, fetch, start, policy.page_size) for start in itertools.islice(starts, max(policy.prefetch, 1)))
+        while pending:
+            page = parse_response(pending.popleft().result())
+            yield page
+            if _is_last_page(page, policy.page_size):
+                for future in pending:
+                    future.cancel()
+                return
+            start = next(starts, None)
+            if start is not None:
+                pending.append(pool.submit(contextvars.copy_context().run, fetch, start, policy.page_size))
+
+
+async def aiter_pages(fetch: Callable[[int, int], Awaitable[requests.Response]], policy: PaginationPolicy) -> AsyncIterator[ParsedResponse]:
+    """Async counterpart of `iter_pages`; read-ahead pages are fetched as concurrent tasks."""
+    first_page = parse_response(await fetch(0, policy.page_size))
+    yield first_page
+    if _is_last_page(first_page, policy.page_size):
+        return
+
+    starts = _next_starts(first_page, policy)
+    pending = deque(asyncio.ensure_future(fetch(start, policy.page_size)) for start in itertools.islice(starts, max(policy.prefetch, 1)))
+    try:
+        while pending:
+            page = parse_response(await pending.popleft())
+            yield page
+            if _is_last_page(page, policy.page_size):
+                return
+            start = next(starts, None)
+            if start is not None:
+                pending.append(asyncio.ensure_future(fetch(start, policy.page_size)))
+    finally:
+        for task in pending:
+            task.cancel()
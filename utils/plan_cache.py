@@ -0,0 +1,204 @@
+"""Replay cache of solution paths for recurring query shapes.
+
+A query is normalized into a template by replacing its arguments (IP addresses and
+networks, protocol:port services, double-quoted strings and numbers) with numbered slots,
+e.g. "give me the device where its id is {num_1}". Each template maps to the sequence of
+API calls that answered it, with the same slots in place of the arguments, e.g.
+"GET /securetrack/api/devices/{num_1}.json?show_license=true".
+
+Entries are seeded from the datasets' gold solutions and learned from successful agent
+runs. Only read-only (GET) paths are kept, and only when every path parameter is a slot,
+no query parameter carries a number that is not a slot, and every other word of a query
+parameter is a flag (true/false) or occurs in the query itself. Any other value came from
+an earlier response or from the conversation, not from the query, and replaying it for
+other arguments would be wrong. Runs that saw earlier turns of a conversation are not
+learned at all (see run.learn_path).
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .oas_utils import ReducedOpenAPISpec
+
+logger = logging.getLogger(__name__)
+
+# A value must not be glued to a word or be part of a longer dotted number ("60.json" and
+# "id 60." hold the value 60, "10.10.10.1" does not hold 10).
+VALUE_START, VALUE_END = r"(?<!\w)(?<!\d\.)", r"(?!\w)(?!\.\d)"
+SLOT_PATTERN = re.compile(
+    rf"(?P<ip>{VALUE_START}\d{{1,3}}(?:\.\d{{1,3}}){{3}}(?:/\d{{1,2}})?{VALUE_END})"
+    rf"|(?P<service>{VALUE_START}(?:tcp|udp|icmp):\d+{VALUE_END})"
+    r"|(?P<quoted>\"[^\"]+\")"
+    rf"|(?P<num>{VALUE_START}\d+{VALUE_END})",
+    re.IGNORECASE,
+)
+PLACEHOLDER_PATTERN = re.compile(r"\{([^}]+)\}")
+DIGIT_PATTERN = re.compile(r"\d")
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+FLAG_VALUES = frozenset({"true", "false"})
+CACHEABLE_METHODS = ("GET",)
+
+
+def query_template(query: str) -> Tuple[str, Dict[str, str]]:
+    """Return the normalized template of `query` and the values of its slots."""
+    slots: Dict[str, str] = {}
+    counts: Dict[str, int] = {}
+
+    def replace(match: re.Match) -> str:
+        kind = match.lastgroup
+        counts[kind] = counts.get(kind, 0) + 1
+        name = f"{kind}_{counts[kind]}"
+        slots[name] = match.group().strip('"')
+        return "{" + name + "}"
+
+    template = SLOT_PATTERN.sub(replace, query)
+    # Lowercase everything but the slot names, which are lowercase already.
+    template = " ".join(template.lower().split()).strip(" ?.!,")
+    return template, slots
+
+
+def describe_call(method: str, url: str, params: Optional[Dict[str, Any]] = None, base_url: str = "") -> str:
+    """Render a request as "METHOD /path?query", relative to the API server."""
+    parts = urlsplit(url[len(base_url):] if base_url and url.startswith(base_url) else url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + [(k, str(v)) for k, v in (params or {}).items()]
+    call = f"{method.upper()} {parts.path}"
+    if query:
+        call += "?" + urlencode(query, safe="/:,{}")
+    return call
+
+
+class PlanCache:
+    """Thread-safe LRU of query template -> API call templates, persisted as JSON."""
+
+    def __init__(self, api_spec: ReducedOpenAPISpec, path: Optional[str] = None, max_entries: int = 512) -> None:
+        self.api_spec = api_spec
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                self._entries.update(json.loads(self.path.read_text()))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable plan cache {self.path}: {e}")
+
+    def _templatize(self, call: str, slots: Dict[str, str], query_words: Optional[frozenset] = None) -> Optional[str]:
+        """Replace slot values in a concrete call by their slot names, or None if not replayable."""
+        method, _, target = call.strip().partition(" ")
+        target = target.strip()
+        if method.upper() not in CACHEABLE_METHODS:
+            return None
+        # Longest values first, so "10" does not replace the start of "10.10.10.1/24".
+        for name, value in sorted(slots.items(), key=lambda item: -len(item[1])):
+            target = re.sub(VALUE_START + re.escape(value) + VALUE_END, "{" + name + "}", target)
+
+        path, _, query = target.partition("?")
+        endpoint = self.api_spec.endpoint_matcher.match(f"{method.upper()} {path}")
+        if endpoint is None:
+            return None
+        template_segments = endpoint.split(" ", 1)[1].split("/")
+        for template_segment, segment in zip(template_segments, path.split("/")):
+            if "{" in template_segment and not PLACEHOLDER_PATTERN.search(segment):
+                return None
+        for value in PLACEHOLDER_PATTERN.findall(target):
+            if value not in slots:
+                return None
+        for _, value in parse_qsl(query, keep_blank_values=True):
+            literal = PLACEHOLDER_PATTERN.sub(" ", value)
+            if DIGIT_PATTERN.search(literal):
+                return None
+            if query_words is not None and not set(WORD_PATTERN.findall(literal.lower())) <= query_words | FLAG_VALUES:
+                return None
+        return f"{method.upper()} {target}"
+
+    def add(self, query: str, calls: Sequence[str]) -> bool:
+        """Store the calls that answered `query`; returns whether they could be templated."""
+        template, slots = query_template(query)
+        query_words = frozenset(WORD_PATTERN.findall(query.lower()))
+        templated = [self._templatize(call, slots, query_words) for call in calls]
+        if not templated or any(call is None for call in templated):
+            return False
+        with self._lock:
+            self._entries[template] = templated
+            self._entries.move_to_end(template)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def learn(self, query: str, api_calls: Iterable[Tuple[str, str, Optional[Dict[str, Any]], Optional[int]]]) -> bool:
+        """Store the calls of a successful agent run and persist the cache."""
+        api_calls = list(api_calls)
+        if not api_calls or any(status is not None and status >= 400 for *_, status in api_calls):
+            return False
+        base_url = self.api_spec.servers[0]["url"]
+        if not self.add(query, [describe_call(method, url, params, base_url) for method, url, params, _ in api_calls]):
+            return False
+        logger.info(f"Plan cache learned: {query_template(query)[0]}")
+        self.save()
+        return True
+
+    def seed(self, dataset_paths: Iterable[str]) -> int:
+        """Add the datasets' gold solutions that can be replayed; returns how many were added."""
+        added = 0
+        for dataset_path in dataset_paths:
+            with open(dataset_path) as f:
+                for item in json.load(f):
+                    with self._lock:
+                        known = query_template(item["query"])[0] in self._entries
+                    if not known and self.add(item["query"], item.get("solution", [])):
+                        added += 1
+        return added
+
+    def lookup(self, query: str) -> Optional[List[str]]:
+        """Return the concrete calls for `query` if its template is known."""
+        template, slots = query_template(query)
+        with self._lock:
+            calls = self._entries.get(template)
+            if calls is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(template)
+            self.hits += 1
+        return [PLACEHOLDER_PATTERN.sub(lambda m: slots[m.group(1)], call) for call in calls]
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            content = json.dumps(self._entries, indent=1)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def build_plan_cache(options: Optional[Dict[str, Any]], api_spec: ReducedOpenAPISpec) -> Optional[PlanCache]:
+    """Create a PlanCache from the `plan_cache` config section, or None when disabled."""
+    options = dict(options or {})
+    if not options.pop("enabled", True):
+        return None
+    seed_paths = options.pop("seed_paths", [])
+    plan_cache = PlanCache(api_spec, **options)
+    seeded = plan_cache.seed(seed_paths)
+    logger.info(f"Plan cache: {plan_cache.stats()['entries']} entries ({seeded} seeded from datasets)")
+    return plan_cache
@@ -0,0 +1,67 @@
+"""Progress events for streaming a query's stages to the client as they happen.
+
+The sink of the running query is kept in a context variable, like the metrics' current
+stage, so the planner, the Caller and the parsers can report progress without threading
+a callback through every chain. Nothing is emitted when no sink is installed.
+
+Events: "route", "plan", "api_plan", "http" (method, url, status), "result" (a parsed
+response), then the final answer as "answer_chunk" events and a closing "answer" event.
+The chunks are cut from the finished answer, token by token, once the query is done; they
+are not streamed while the LLM generates it.
+"""
+
+import contextvars
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .tokenizer import get_encoder
+
+logger = logging.getLogger(__name__)
+
+ProgressSink = Callable[[str, Dict[str, Any]], None]
+
+progress_sink: contextvars.ContextVar[Optional[ProgressSink]] = contextvars.ContextVar("progress_sink", default=None)
+
+
+@contextmanager
+def report_progress(sink: Optional[ProgressSink]) -> Iterator[None]:
+    """Send the events emitted inside the block to `sink(event, data)`."""
+    token = progress_sink.set(sink)
+    try:
+        yield
+    finally:
+        progress_sink.reset(token)
+
+
+def emit_progress(event: str, **data: Any) -> None:
+    sink = progress_sink.get()
+    if sink is None:
+        return
+    try:
+        sink(event, data)
+    except Exception as e:
+        # A client that went away must not fail the query.
+        logger.warning(f"Could not report {event} progress: {e}")
+
+
+def iter_answer_chunks(text: str) -> Iterator[str]:
+    """Split `text` into chunks at its token boundaries, never cutting a multi-byte character."""
+    encoder = get_encoder()
+    pending = b""
+    for token in encoder.encode(text):
+        pending += encoder.decode_single_token_bytes(token)
+        try:
+            piece = pending.decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        pending = b""
+        yield piece
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> bytes:
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
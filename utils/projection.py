@@ -0,0 +1,186 @@
+"""Query-driven projection of API responses before they are put into a prompt.
+
+Collections dominate response size, so projection prunes inside arrays of objects only;
+scalars outside arrays (counts, totals) are kept. Inside an element a field is kept when
+- it is an identity field (`id`, `name`),
+- its name matches a word of the query ("os version" keeps `OS_Version`; a matching
+  object or array inside an element keeps its whole subtree), or
+- one of its values matches a query word that is not a field name of the endpoint's
+  response schema or a word of its path ("management devices" keeps `virtual_type`,
+  whose value is "management").
+Only fields are projected: every element of an array is kept, so counts hold and
+negations ("all interfaces except management") still see the elements they exclude. A
+nested object or array left without any kept value is dropped from its element.
+
+The data is never modified; the projection is a new structure. ResponseParser keeps
+running generated code against the full data; only the JSON excerpts shown to the LLM
+are projected.
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterator, Optional, Set
+
+from .endpoint_index import tokenize
+from .json_response import ParsedResponse
+from .metrics import observe_projection
+from .tokenizer import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+IDENTITY_FIELDS = frozenset({"id", "name"})
+# Request phrasing that never selects a value.
+GENERIC_WORDS = frozenset({"all", "and", "any", "display", "every", "find", "get", "give", "its", "list", "me", "of", "return", "show", "that", "the", "their", "what", "where", "which", "with"})
+# Keep the original when projection would save less than this share of the bytes.
+MIN_SAVING = 0.1
+
+
+def _words(text: str) -> Set[str]:
+    words = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def response_schema(api_doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Return the JSON schema of an endpoint's response, if the spec declares one."""
+    content = ((api_doc or {}).get("responses") or {}).get("content") or {}
+    for media_type, media in content.items():
+        if "json" in media_type and isinstance(media, dict):
+            return media.get("schema")
+    return None
+
+
+def _property_names(schema: Any) -> Iterator[str]:
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for name, child in (node.get("properties") or {}).items():
+                yield name
+                stack.append(child)
+            stack.extend(node[key] for key in ("items", "additionalProperties") if isinstance(node.get(key), dict))
+            for key in ("allOf", "anyOf", "oneOf"):
+                stack.extend(node.get(key) or [])
+
+
+@dataclass
+class Projection:
+    text: str
+    bytes_before: int
+    bytes_after: int
+    tokens_before: int
+    tokens_after: int
+
+
+class ResponseProjector:
+    """Projects one endpoint's responses onto the fields a query needs."""
+
+    def __init__(self, api_path: str, api_doc: Optional[Dict[str, Any]] = None) -> None:
+        self.api_path = api_path
+        schema_words: Set[str] = set()
+        for name in _property_names(response_schema(api_doc)):
+            schema_words.update(_words(name.replace("_", " ")))
+        self.schema_words = frozenset(schema_words | _words(api_path))
+
+    def _query_terms(self, query: str) -> tuple:
+        field_tokens = frozenset(tokenize(query)) - GENERIC_WORDS
+        value_words = frozenset(_words(query) - GENERIC_WORDS - self.schema_words)
+        return field_tokens, value_words
+
+    @staticmethod
+    def _matches_value(value: Any, value_words: FrozenSet[str]) -> bool:
+        return isinstance(value, str) and not _words(value).isdisjoint(value_words)
+
+    def _value_fields(self, node: Any, value_words: FrozenSet[str]) -> Set[str]:
+        """Names of the fields that hold a value matching the query anywhere in `node`."""
+        fields: Set[str] = set()
+        if not value_words:
+            return fields
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if isinstance(value, (dict, list)):
+                        stack.append(value)
+                    elif self._matches_value(value, value_words):
+                        fields.add(key)
+            elif isinstance(node, list):
+                stack.extend(node)
+        return fields
+
+    @staticmethod
+    def _has_values(node: Any) -> bool:
+        if isinstance(node, dict):
+            return any(ResponseProjector._has_values(value) for value in node.values())
+        if isinstance(node, list):
+            return any(ResponseProjector._has_values(value) for value in node)
+        return True
+
+    def _project(self, node: Any, keep: Any, in_array: bool) -> Any:
+        if isinstance(node, list):
+            return [self._project(element, keep, True) for element in node]
+        if not isinstance(node, dict):
+            return node
+        projected = {}
+        for key, value in node.items():
+            if not isinstance(value, (dict, list)):
+                if not in_array or keep(key):
+                    projected[key] = value
+            elif in_array and keep(key):
+                projected[key] = value
+            else:
+                child = self._project(value, keep, in_array)
+                # Containers left without a single kept value, like the projection of an
+                # unrelated nested array, are dropped as a whole.
+                if self._has_values(child):
+                    projected[key] = child
+        return projected
+
+    def project(self, data: Any, query: Optional[str]) -> Any:
+        """Return a copy of `data` with the fields `query` needs; `data` itself is left untouched."""
+        if not query or not isinstance(data, (dict, list)):
+            return data
+        field_tokens, value_words = self._query_terms(query)
+        value_fields = self._value_fields(data, value_words)
+
+        def keep(key: str) -> bool:
+            return key.lower() in IDENTITY_FIELDS or key in value_fields or not field_tokens.isdisjoint(tokenize(key))
+
+        return self._project(data, keep, False)
+
+    def excerpt(self, response: ParsedResponse, query: Optional[str], max_tokens: int) -> str:
+        """The response as shown to the LLM: projected when that pays off, cut to `max_tokens`."""
+        if not response.is_json:
+            return response.excerpt(max_tokens)
+        projection = self.measure(response, query, max_tokens)
+        if projection is None:
+            return response.excerpt(max_tokens)
+        logger.info(
+            f"Projection of {self.api_path}: {projection.bytes_before} -> {projection.bytes_after} bytes, "
+            f"~{projection.tokens_before} -> {projection.tokens_after} tokens"
+        )
+        observe_projection(self.api_path, projection.bytes_before - projection.bytes_after, projection.tokens_before - projection.tokens_after)
+        return projection.text
+
+    def measure(self, response: ParsedResponse, query: Optional[str], max_tokens: int) -> Optional[Projection]:
+        projected = self.project(response.data, query)
+        if projected is response.data:
+            return None
+        text = json.dumps(projected, ensure_ascii=False)
+        size = len(text.encode("utf-8"))
+        if size > (1 - MIN_SAVING) * response.num_bytes:
+            return None
+        text = truncate_to_tokens(text, max_tokens)
+        tokens = count_tokens(text)
+        # The original is never tokenized again: its excerpt is estimated at the projection's
+        # bytes per token, and it could not have been longer than `max_tokens`.
+        bytes_per_token = len(text.encode("utf-8")) / max(tokens, 1)
+        tokens_before = min(max_tokens, max(tokens, round(response.num_bytes / bytes_per_token)))
+        return Projection(text, response.num_bytes, size, tokens_before, tokens)
@@ -0,0 +1,197 @@
+"""Cache of GET responses used by HTTPClient.
+
+Freshness comes from per-endpoint TTL rules in the `response_cache` config section; the
+first rule whose glob pattern matches the URL path wins and `default_ttl` applies to the
+rest. A stale entry that carried an ETag or Last-Modified header is revalidated with
+If-None-Match / If-Modified-Since, and a 304 answer is served from the cache. Entries
+are evicted least recently used first once their bodies exceed `max_bytes` in total.
+
+Only GET is ever cached. POST/PUT/PATCH/DELETE bypass the cache and evict the cached
+responses of the resource they modify.
+"""
+
+import fnmatch
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_STATUS_CODES = (200, 203)
+ID_SEGMENT_PATTERN = re.compile(r"/[^/]*\d[^/]*$")
+
+
+@dataclass
+class CachedResponse:
+    content: bytes
+    status_code: int
+    headers: Dict[str, str]
+    url: str
+    reason: Optional[str]
+    encoding: Optional[str]
+    expires_at: float
+    path: str
+
+    @property
+    def num_bytes(self) -> int:
+        return len(self.content)
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("Last-Modified")
+
+    def to_response(self) -> requests.Response:
+        response = requests.Response()
+        response._content = self.content
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.url = self.url
+        response.reason = self.reason
+        response.encoding = self.encoding
+        return response
+
+
+@dataclass
+class TTLRule:
+    pattern: str
+    ttl: float
+
+
+@dataclass
+class ResponseCache:
+    """Byte-bounded LRU of GET responses keyed by URL, query parameters and request headers."""
+
+    max_bytes: int = 64 * 1024 * 1024
+    default_ttl: float = 60.0
+    rules: List[TTLRule] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.rules = [rule if isinstance(rule, TTLRule) else TTLRule(**rule) for rule in self.rules]
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_bytes = 0
+        self.counters: Dict[str, int] = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> str:
+        return json.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())], default=str)
+
+    def ttl_for(self, url: str) -> float:
+        path = urlsplit(url).path
+        for rule in self.rules:
+            if fnmatch.fnmatchcase(path, rule.pattern):
+                return rule.ttl
+        return self.default_ttl
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], bool]:
+        """Return the cached entry for `key` (or None) and whether it is still fresh."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            if time.time() < entry.expires_at:
+                self.counters["hits"] += 1
+                return entry, True
+            if entry.etag is None and entry.last_modified is None:
+                self._remove(key)
+                self.counters["misses"] += 1
+                return None, False
+            return entry, False
+
+    @staticmethod
+    def conditional_headers(entry: CachedResponse) -> Dict[str, str]:
+        headers = {}
+        if entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified is not None:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def revalidated(self, key: str, entry: CachedResponse, not_modified: requests.Response) -> requests.Response:
+        """Refresh `entry` after a 304 answer and return it as a response."""
+        with self._lock:
+            entry.headers.update({k: v for k, v in not_modified.headers.items() if k in ("ETag", "Last-Modified", "Date", "Cache-Control")})
+            entry.expires_at = time.time() + self.ttl_for(entry.url)
+            self.counters["revalidated"] += 1
+        return entry.to_response()
+
+    def store(self, key: str, response: requests.Response) -> None:
+        if response.status_code not in CACHEABLE_STATUS_CODES:
+            return
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return
+        ttl = self.ttl_for(response.url)
+        has_validator = "ETag" in response.headers or "Last-Modified" in response.headers
+        # With a TTL of 0 an entry is only worth keeping if it can be revalidated.
+        if ttl <= 0 and not has_validator:
+            return
+        entry = CachedResponse(
+            content=response.content,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            url=response.url,
+            reason=response.reason,
+            encoding=response.encoding,
+            expires_at=time.time() + ttl,
+            path=urlsplit(response.url).path,
+        )
+        if entry.num_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.num_bytes += entry.num_bytes
+            self.counters["stored"] += 1
+            while self.num_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, url: str) -> None:
+        """Evict cached responses of the resource at `url` and of its collection."""
+        stem = urlsplit(url).path.rsplit(".", 1)[0]
+        prefixes = {stem, ID_SEGMENT_PATTERN.sub("", stem)}
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if any(entry.path.startswith(prefix) for prefix in prefixes)]
+            for key in stale:
+                self._remove(key)
+            self.counters["invalidations"] += len(stale)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.num_bytes -= entry.num_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["hits"] + self.counters["revalidated"]
+        lookups = hits + self.counters["misses"]
+        return {**self.counters, "entries": len(self._entries), "bytes": self.num_bytes, "hit_ratio": hits / lookups if lookups else 0.0}
+
+
+def build_response_cache(options: Optional[Dict[str, Any]]) -> Optional[ResponseCache]:
+    """Create a ResponseCache from the `response_cache` config section, or None when disabled."""
+    options = dict(options or {})
+    if not options.pop("enabled", True):
+        return None
+    logger.debug(f"HTTP response cache enabled with options {options}")
+    return ResponseCache(**options)
@@ -0,0 +1,184 @@
+"""Pre-forked worker processes that run the parsers' LLM-generated code.
+
+Running the code with `exec` in the server process shares `sys.stdout` between
+concurrent requests, and a runaway program stalls the whole worker. Here every program
+runs in a worker process of its own: the parsed response is pickled to the worker over a
+pipe, stdout is captured inside the worker, and each job is bounded by a wall-clock
+timeout and a memory cap (an address-space limit above the worker's baseline). A worker
+that times out or dies is killed and replaced; the others keep serving.
+
+Workers are forked from a forkserver that has already imported this package and the
+main module, so a replacement starts warm and forking never copies the threads of the
+server process. Like any multiprocessing entry point, the main module must guard its
+startup code with `if __name__ == "__main__":`. The pool is started by `configure_sandbox`
+only; until then, parsing code runs in-process.
+
+Process isolation protects the server from faulty programs, not from hostile ones.
+"""
+
+import asyncio
+import builtins
+import io
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import resource
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _address_space() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * PAGE_SIZE
+
+
+def _limit_memory(max_memory_mb: int) -> None:
+    try:
+        limit = _address_space() + max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Sandbox worker runs without a memory cap: {e}")
+
+
+def _worker_main(conn: Any, max_memory_mb: int, max_output_chars: int) -> None:
+    """Serve jobs until the pipe closes; every job is (code, variables) -> (status, output)."""
+    _limit_memory(max_memory_mb)
+    while True:
+        try:
+            code, variables = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            return
+        stdout = io.StringIO()
+        sys.stdout = stdout
+        try:
+            exec(code, {"__builtins__": builtins, **variables})
+            result: Tuple[str, str] = ("ok", stdout.getvalue()[:max_output_chars])
+        except MemoryError:
+            result = ("memory", "MemoryError: the program exceeded the sandbox memory limit")
+        except BaseException as e:
+            result = ("error", f"{type(e).__name__}: {e}")
+        finally:
+            sys.stdout = sys.__stdout__
+            del stdout
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, context: Any, max_memory_mb: int, max_output_chars: int) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, max_memory_mb, max_output_chars), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """Fixed-size pool of sandbox workers; `run` blocks until a worker is free."""
+
+    def __init__(self, workers: int = 4, timeout: float = 10.0, max_memory_mb: int = 512, max_output_chars: int = 200000) -> None:
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_output_chars = max_output_chars
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            # Workers skip re-importing the main module when the forkserver already has it.
+            self._context.set_forkserver_preload(["__main__", __name__])
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.counters = {"jobs": 0, "errors": 0, "timeouts": 0, "memory_errors": 0, "restarts": 0}
+        self.size = workers
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._context, self.max_memory_mb, self.max_output_chars)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def run(self, code: str, variables: Dict[str, Any]) -> Optional[str]:
+        """Run `code` with `variables` as globals; return what it printed, or None if it failed."""
+        payload = pickle.dumps((code, variables), protocol=pickle.HIGHEST_PROTOCOL)
+        worker = self._idle.get()
+        self._count("jobs")
+        try:
+            worker.conn.send_bytes(payload)
+            if not worker.conn.poll(self.timeout):
+                self._count("timeouts")
+                logger.info(f"Parsing code timed out after {self.timeout}s; restarting its worker")
+                worker = self._replace(worker)
+                return None
+            status, output = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            self._count("errors")
+            logger.info(f"Sandbox worker died ({e}); restarting it")
+            worker = self._replace(worker)
+            return None
+        finally:
+            self._idle.put(worker)
+
+        if status == "memory":
+            self._count("memory_errors")
+        elif status == "error":
+            self._count("errors")
+        if status != "ok":
+            logger.info(output)
+            return None
+        return output
+
+    async def arun(self, code: str, variables: Dict[str, Any]) -> Optional[str]:
+        return await asyncio.to_thread(self.run, code, variables)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        self._count("restarts")
+        return self._spawn()
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self._idle.get().kill()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "workers": self.size, "idle": self._idle.qsize()}
+
+
+_sandbox_pool: Optional[SandboxPool] = None
+_sandbox_lock = threading.Lock()
+
+
+def configure_sandbox(options: Optional[Dict[str, Any]]) -> Optional[SandboxPool]:
+    """Start the process-wide SandboxPool from the `sandbox` config section.
+
+    This is the only place the pool is started. With `enabled: false`, or in a process
+    that never calls it, the parsers run the code in-process.
+    """
+    global _sandbox_pool
+    options = dict(options or {})
+    with _sandbox_lock:
+        if _sandbox_pool is not None:
+            _sandbox_pool.close()
+            _sandbox_pool = None
+        if options.pop("enabled", True):
+            _sandbox_pool = SandboxPool(**options)
+            logger.debug(f"Started sandbox pool with options {options}")
+        return _sandbox_pool
+
+
+def get_sandbox_pool() -> Optional[SandboxPool]:
+    """Return the process-wide SandboxPool; None until `configure_sandbox` starts one."""
+    with _sandbox_lock:
+        return _sandbox_pool
@@ -0,0 +1,115 @@
+"""Compiled, on-disk bundles of reduced OpenAPI specs.
+
+Reducing a spec (dereferencing every $ref and merging allOf schemas) is slow, so the
+result is pickled next to a content hash of the source file. Loading a bundle is a
+single unpickle; any change to the spec file, the reduce options or BUNDLE_VERSION
+produces a new key and the bundle is rebuilt automatically.
+
+Bundles are named `{spec}.{options}.{content}.v{BUNDLE_VERSION}.pickle`. Compiling one
+removes the bundles it replaces: those of the same spec and reduce options, and those of
+an older BUNDLE_VERSION. Bundles built with other reduce options are left alone, so
+processes configured differently can share a cache directory.
+
+Compile ahead of time with: python -m utils.spec_bundle specs/tufin_oas.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+from pathlib import Path
+from typing import Union
+
+from .oas_utils import ReducedOpenAPISpec, reduce_openapi_spec
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever ReducedOpenAPISpec, reduce_openapi_spec or the bundle layout changes.
+BUNDLE_VERSION = 4
+DEFAULT_CACHE_DIR = ".spec_cache"
+
+
+def _bundle_path(spec_path: Path, raw_spec: bytes, cache_dir: Path, reduce_kwargs: dict) -> Path:
+    options = hashlib.sha256(json.dumps(sorted(reduce_kwargs.items())).encode()).hexdigest()[:8]
+    content = hashlib.sha256(raw_spec).hexdigest()[:20]
+    return cache_dir / f"{spec_path.stem}.{options}.{content}.v{BUNDLE_VERSION}.pickle"
+
+
+def _bundle_version(bundle_path: Path) -> int:
+    version = bundle_path.name.rsplit(".", 2)[-2]
+    return int(version[1:]) if version[:1] == "v" and version[1:].isdigit() else 0
+
+
+def _remove_stale_bundles(bundle_path: Path) -> None:
+    """Remove the bundles `bundle_path` replaces; bundles of other reduce options are kept."""
+    spec_stem, options = bundle_path.name.rsplit(".", 4)[:2]
+    for bundle in bundle_path.parent.glob(f"{spec_stem}.*.pickle"):
+        if bundle == bundle_path:
+            continue
+        if bundle.name.startswith(f"{spec_stem}.{options}.") or _bundle_version(bundle) < BUNDLE_VERSION:
+            bundle.unlink(missing_ok=True)
+
+
+def compile_spec_bundle(raw_spec: bytes, bundle_path: Path, **reduce_kwargs) -> ReducedOpenAPISpec:
+    api_spec = reduce_openapi_spec(json.loads(raw_spec), **reduce_kwargs)
+    # Materialize the derived indexes so they are stored in the bundle too.
+    api_spec.endpoint_matcher
+    api_spec.endpoint_docs
+    api_spec.selector_endpoints
+    api_spec.endpoint_index
+
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=bundle_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(api_spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, bundle_path)
+
+    _remove_stale_bundles(bundle_path)
+    return api_spec
+
+
+def load_spec_bundle(spec_path: Union[str, Path], cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR, **reduce_kwargs) -> ReducedOpenAPISpec:
+    """Return the reduced spec for `spec_path`, compiling and caching it on first use.
+
+    `reduce_kwargs` are passed to reduce_openapi_spec and are part of the bundle key.
+    """
+    start_time = time.perf_counter()
+    spec_path = Path(spec_path)
+    raw_spec = spec_path.read_bytes()
+    bundle_path = _bundle_path(spec_path, raw_spec, Path(cache_dir), reduce_kwargs)
+
+    if bundle_path.exists():
+        try:
+            with open(bundle_path, "rb") as f:
+                api_spec = pickle.load(f)
+            logger.debug(f"Loaded spec bundle {bundle_path} in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+            return api_spec
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning(f"Ignoring unreadable spec bundle {bundle_path}: {e}")
+
+    api_spec = compile_spec_bundle(raw_spec, bundle_path, **reduce_kwargs)
+    logger.info(f"Compiled spec bundle {bundle_path} in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    return api_spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile an OpenAPI spec into a reduced spec bundle.")
+    parser.add_argument("spec_path")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--only-required", action="store_true")
+    parser.add_argument("--no-merge-allof", action="store_true")
+    args = parser.parse_args()
+
+    raw_spec = Path(args.spec_path).read_bytes()
+    reduce_kwargs = {"only_required": args.only_required, "merge_allof": not args.no_merge_allof}
+    bundle_path = _bundle_path(Path(args.spec_path), raw_spec, Path(args.cache_dir), reduce_kwargs)
+    api_spec = compile_spec_bundle(raw_spec, bundle_path, **reduce_kwargs)
+    print(f"Wrote {bundle_path} ({len(api_spec.endpoints)} endpoints)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Per-section token budgets that keep prompts bounded as a query takes more steps.
+
+Scratchpads and backgrounds replay earlier steps in every later prompt. The newest
+`recent_steps` steps keep their observation, cut to the `observation` budget; older
+steps keep only a one-line summary. If the steps still exceed the `history` budget,
+the oldest observations are replaced by a reference to their step number. The most
+recent step is always kept. ICL examples and endpoint lists are cut at whole examples
+and whole lines, respectively.
+
+Compaction only affects how the steps are rendered; the ExecutionContext keeps the full
+results.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+from .tokenizer import count_tokens, fits_within, truncate_to_tokens
+
+EXAMPLE_PATTERN = re.compile(r"(?=^Example \d+:)", re.MULTILINE)
+
+
+@dataclass
+class TokenBudget:
+    icl_examples: int = 2500
+    endpoints: int = 2000
+    history: int = 2000
+    observation: int = 800
+    summary: int = 60
+    recent_steps: int = 2
+
+    def fit_observation(self, text: str) -> str:
+        return truncate_to_tokens(text, self.observation)
+
+    def summarize(self, text: str) -> str:
+        first_line = text.strip().split("\n", 1)[0]
+        return truncate_to_tokens(first_line, self.summary)
+
+    def compact_steps(self, steps: Sequence[Tuple[str, ...]], observation_index: int = -1) -> List[Tuple[str, ...]]:
+        """Return `steps` with their observation (at `observation_index`) compacted to budget."""
+        compacted = []
+        for i, step in enumerate(steps):
+            step = list(step)
+            if i >= len(steps) - self.recent_steps:
+                step[observation_index] = self.fit_observation(step[observation_index])
+            else:
+                step[observation_index] = self.summarize(step[observation_index])
+            compacted.append(step)
+
+        sizes = [count_tokens("\n".join(step)) for step in compacted]
+        total = sum(sizes)
+        for i in range(len(compacted) - 1):
+            if total <= self.history:
+                break
+            compacted[i][observation_index] = f"(result of step {i + 1} omitted)"
+            new_size = count_tokens("\n".join(compacted[i]))
+            total += new_size - sizes[i]
+            sizes[i] = new_size
+        return [tuple(step) for step in compacted]
+
+    def fit_examples(self, text: str) -> str:
+        """Keep the leading ICL examples that fit the `icl_examples` budget."""
+        if fits_within(text, self.icl_examples):
+            return text
+        kept = ""
+        for example in EXAMPLE_PATTERN.split(text):
+            if not fits_within(kept + example, self.icl_examples):
+                break
+            kept += example
+        return kept or truncate_to_tokens(text, self.icl_examples)
+
+    def lines_within(self, lines: Sequence[str]) -> int:
+        """How many of the leading `lines` (e.g. ranked endpoints) fit the `endpoints` budget."""
+        used = 0
+        for i, line in enumerate(lines):
+            used += count_tokens(line) + 1
+            if used > self.endpoints:
+                return i
+        return len(lines)
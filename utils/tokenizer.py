@@ -0,0 +1,72 @@
+"""Process-wide tokenizer with cached token counts.
+
+The BPE ranks for cl100k_base (used by gpt-3.5-turbo) are vendored in vendor/tiktoken, so
+the encoder loads without network access. tiktoken looks files up by the sha1 of their
+download URL inside TIKTOKEN_CACHE_DIR; an explicitly configured TIKTOKEN_CACHE_DIR wins.
+"""
+
+import math
+import os
+from functools import lru_cache
+
+import tiktoken
+
+DEFAULT_MODEL = 'gpt-3.5-turbo-0125'
+VENDORED_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'vendor', 'tiktoken')
+
+# The longest cl100k_base token is 128 bytes, and a token is at least one byte.
+MAX_BYTES_PER_TOKEN = 128
+# Upper bound on bytes per token used to cut text before tokenizing it. JSON and prose
+# average 3-4 bytes per token, so a prefix this long almost always holds the budget.
+BYTES_PER_TOKEN_BOUND = 8
+# Only strings up to this length are memoized, so huge payloads are not pinned in memory.
+MEMO_MAX_CHARS = 65536
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = DEFAULT_MODEL) -> tiktoken.Encoding:
+    os.environ.setdefault('TIKTOKEN_CACHE_DIR', VENDORED_CACHE_DIR)
+    return tiktoken.encoding_for_model(model)
+
+
+@lru_cache(maxsize=8192)
+def _count_tokens_memoized(text: str, model: str) -> int:
+    return len(get_encoder(model).encode(text))
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    if len(text) <= MEMO_MAX_CHARS:
+        return _count_tokens_memoized(text, model)
+    return len(get_encoder(model).encode(text))
+
+
+def estimate_tokens(text: str) -> tuple:
+    """Return (lower, upper) bounds on the token count without encoding.
+
+    A token spans 1 to MAX_BYTES_PER_TOKEN bytes, and a character is 1 byte when the text
+    is ASCII and at most 4 otherwise.
+    """
+    max_bytes = len(text) if text.isascii() else 4 * len(text)
+    return math.ceil(len(text) / MAX_BYTES_PER_TOKEN), max_bytes
+
+
+def fits_within(text: str, max_tokens: int, model: str = DEFAULT_MODEL) -> bool:
+    """Whether `text` is at most `max_tokens` tokens, encoding only when the bounds can't tell."""
+    lower, upper = estimate_tokens(text)
+    if upper <= max_tokens:
+        return True
+    if lower > max_tokens:
+        return False
+    return count_tokens(text, model) <= max_tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = '...', model: str = DEFAULT_MODEL) -> str:
+    """Cut `text` to `max_tokens` tokens (plus `suffix`), tokenizing at most a bounded prefix."""
+    if fits_within(text, max_tokens, model):
+        return text
+    encoder = get_encoder(model)
+    prefix = text[:max_tokens * BYTES_PER_TOKEN_BOUND]
+    encoded = encoder.encode(prefix)
+    if len(encoded) > max_tokens:
+        prefix = encoder.decode(encoded[:max_tokens])
+    return prefix + suffix
@@ -1,5 +1,4 @@
 import os
-import re
 import json
 import logging
 from logging.handlers import BaseRotatingHandler
@@ -7,6 +6,8 @@ from colorama import Fore
 
 from langchain.agents.agent_toolkits.openapi.spec import ReducedOpenAPISpec
 
+from .oas_utils import EndpointMatcher
+
 
 
 class ColorPrint:
@@ -53,45 +54,18 @@ class MyRotatingFileHandler(BaseRotatingHandler):
 
 
 def get_matched_endpoint(api_spec: ReducedOpenAPISpec, plan: str):
-    pattern = r"\b(GET|POST|PATCH|DELETE|PUT)\s+(/\S+)*"
-    matches = re.findall(pattern, plan)
-    plan_endpoints = [
-        "{method} {route}".format(method=method, route=route.split("?")[0])
-        for method, route in matches
-    ]
-    spec_endpoints = [item[0] for item in api_spec.endpoints]
-
-    matched_endpoints = []
-
-    for plan_endpoint in plan_endpoints:
-        if plan_endpoint in spec_endpoints:
-            matched_endpoints.append(plan_endpoint)
-            continue
-        for name in spec_endpoints:
-            arg_list = re.findall(r"[{](.*?)[}]", name)
-            pattern = name.format(**{arg: r"[^/]+" for arg in arg_list}) + '$'
-            if re.match(pattern, plan_endpoint):
-                matched_endpoints.append(name)
-                break
-    if len(matched_endpoints) == 0:
-        return None
-        # raise ValueError(f"Endpoint {plan_endpoint} not found in API spec.")
-    
-    return matched_endpoints
+    matcher = getattr(api_spec, "endpoint_matcher", None)
+    if matcher is None:
+        matcher = EndpointMatcher(item[0] for item in api_spec.endpoints)
+    return matcher.match_plan(plan)
 
 
 def simplify_json(raw_json: dict):
+    """Return a copy of `raw_json` with every list cut to its first two elements."""
     if isinstance(raw_json, dict):
-        for key in raw_json.keys():
-            raw_json[key] = simplify_json(raw_json[key])
-        return raw_json
+        return {key: simplify_json(value) for key, value in raw_json.items()}
     elif isinstance(raw_json, list):
-        if len(raw_json) == 0:
-            return raw_json
-        elif len(raw_json) == 1:
-            return [simplify_json(raw_json[0])]
-        else:
-            return [simplify_json(raw_json[0]), simplify_json(raw_json[1])]
+        return [simplify_json(item) for item in raw_json[:2]]
     else:
         return raw_json
 